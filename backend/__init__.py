@@ -4,6 +4,7 @@ from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_bcrypt import Bcrypt
 from flask_socketio import SocketIO
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import click
 
@@ -16,6 +17,10 @@ def create_app(config_class='backend.config.Config'):
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(config_class)
 
+    if app.config['PROXY_FIX_X_FOR'] or app.config['PROXY_FIX_X_PROTO']:
+        # Behind a reverse proxy, take the client address the rate limits key on from its headers
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'], x_proto=app.config['PROXY_FIX_X_PROTO'])
+
     # Ensure the instance folder exists
     try:
         os.makedirs(app.instance_path)
@@ -34,10 +39,30 @@ def create_app(config_class='backend.config.Config'):
     migrate.init_app(app, db)
     bcrypt.init_app(app)
     socketio.init_app(app, cors_allowed_origins="*")
-    CORS(app, resources={r"/api/*": {"origins": "*"}}) # Allow all origins for now
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor", "Link"]) # Allow all origins for now
 
     from . import routes
     from . import models
+    from . import auth
+    from . import jobs
+    from . import search
+    from . import retention
+    from . import audit
+    from . import hashing
+    from . import ratelimit
+    from . import branding
+    from . import reports
+    from . import mailer
+    auth.init_app(app)
+    jobs.init_app(app)
+    search.init_app(app)
+    retention.init_app(app)
+    audit.init_app(app)
+    hashing.init_app(app)
+    ratelimit.init_app(app)
+    branding.init_app(app)
+    reports.init_app(app)
+    mailer.init_app(app)
     app.register_blueprint(routes.bp)
 
     @app.cli.command("register-permissions")
@@ -115,18 +140,62 @@ def create_app(config_class='backend.config.Config'):
         db.session.commit()
         print(f"User '{username}' created and assigned the 'admin' role with all permissions.")
 
-    @app.before_request
-    def cleanup_old_audit_logs():
-        from .models import AuditLog, db
-        from datetime import datetime, timedelta
-
-        last_cleanup = app.config.get('LAST_AUDIT_CLEANUP')
-        if last_cleanup and last_cleanup.date() == datetime.utcnow().date():
-            return
-
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        AuditLog.query.filter(AuditLog.timestamp < thirty_days_ago).delete()
-        db.session.commit()
-        app.config['LAST_AUDIT_CLEANUP'] = datetime.utcnow()
+    @app.cli.command("rebuild-screening-stats")
+    def rebuild_screening_stats():
+        """Recomputes the screening statistics counters from the screening records."""
+        from .stats import rebuild_counters
+
+        count = rebuild_counters()
+        print(f"Rebuilt {count} screening statistics counters.")
+
+    @app.cli.command("purge-audit-logs")
+    def purge_audit_logs_command():
+        """Archives and deletes audit log entries past the retention period now."""
+        from .retention import purge_audit_logs
+
+        metrics = purge_audit_logs(app.config)
+        print(f"Purged {metrics['last_purged']} audit log entries (archive: {metrics['last_archive'] or 'none'}).")
+
+    @app.cli.command("rehash-branding-uploads")
+    def rehash_branding_uploads():
+        """Renames branding uploads to content-hashed names, merging duplicates."""
+        from .branding import rehash_assets
+
+        count = rehash_assets()
+        print(f"Updated {count} branding file references.")
+
+    @app.cli.command("render-cohort-reports")
+    @click.argument("screening_year", type=int)
+    @click.argument("company_section")
+    @click.argument("output")
+    @click.option("--by-department", is_flag=True, help="Bundle the reports in one zip per department.")
+    @click.option("--workers", type=int, default=None, help="Rendering processes (default REPORT_RENDER_WORKERS).")
+    def render_cohort_reports_command(screening_year, company_section, output, by_department, workers):
+        """Renders every report of a screening cohort into a zip archive.
+
+        Reports rendered by an earlier, interrupted run are reused.
+        """
+        from .reports import render_cohort_reports, reports_available, write_report_archive
+
+        if not reports_available():
+            raise click.ClickException("reportlab is not installed.")
+
+        def progress(done, total):
+            click.echo(f"\rRendered {done}/{total} reports", nl=False)
+
+        reports = render_cohort_reports(screening_year, company_section, progress=progress, workers=workers)
+        write_report_archive(output, reports, screening_year, by_department)
+        click.echo(f"\nWrote {len(reports)} reports to {output}.")
+
+    @app.cli.command("send-queued-emails")
+    def send_queued_emails():
+        """Delivers every queued email that is due now, within the rate limit."""
+        from .mailer import mail_sender
+        from .models import OutboundEmail
+
+        mail_sender.deliver_due()
+        mail_sender.close()
+        queued = OutboundEmail.query.filter(OutboundEmail.status.in_(['queued', 'sending'])).count()
+        print(f"{queued} emails still queued.")
 
     return app
\ No newline at end of file
@@ -0,0 +1,149 @@
+from datetime import datetime
+from threading import Lock, Thread
+import atexit
+import queue
+import time
+from sqlalchemy import insert
+from . import db
+from .models import AuditLog
+
+# Actions written in the caller's transaction instead of the background queue,
+# so they are committed (or rolled back) together with the change they record:
+# security events, and every action that creates, changes or deletes data.
+# Only read-only actions (downloads, exports) and summaries logged after their
+# data was committed go through the queue.
+SECURITY_ACTIONS = frozenset({
+    'USER_REGISTER', 'USER_LOGIN', 'PROFILE_UPDATE', 'PASSWORD_CHANGE',
+    '2FA_ENABLED', '2FA_DISABLED', 'ADMIN_USER_UPDATE', 'ADMIN_PASSWORD_CHANGE',
+    'ROLE_ASSIGN', 'ROLE_CREATE', 'ROLE_UPDATE', 'ROLE_DELETE',
+    'TEMP_CODE_GENERATED', 'TEMP_CODE_REVOKE', 'TEMP_CODE_ACTIVATE_SUCCESS',
+    'TEMP_CODE_ACTIVATE_FAILURE', 'TEMP_ACCESS_CODE_REQUEST',
+    'PATIENT_ACCOUNT_CLAIM', 'CONFIG_UPDATE', 'AUDIT_LOG_EXPORT',
+    'PATIENT_REGISTER', 'PATIENT_UPDATE', 'PATIENT_DELETE',
+    'SCREENING_REGISTER', 'SCREENING_RECORD_DELETE',
+    'CONSULTATION_SAVE', 'TEST_RESULT_SAVE', 'DIRECTOR_REVIEW_SAVE',
+    'BRANDING_UPDATE', 'EMAIL_REPORT_QUEUED',
+})
+
+_STOP = object()
+
+
+class AuditWriter:
+    """Buffers audit log entries in a bounded queue and inserts them in
+    batches from a background thread.
+
+    After the first entry of a batch arrives, the thread keeps collecting for
+    up to AUDIT_FLUSH_INTERVAL seconds or AUDIT_FLUSH_BATCH_SIZE entries, then
+    writes them with one INSERT. A failed batch is retried a few times before
+    its entries are logged as lost. The queue is drained at interpreter exit.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self._thread = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.app = app
+        # A size of 0 turns buffering off: every entry is written synchronously
+        self.queue = queue.Queue(maxsize=app.config['AUDIT_QUEUE_SIZE']) if app.config['AUDIT_QUEUE_SIZE'] > 0 else None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def submit(self, entry):
+        """Queues an entry dict; returns False if buffering is off or the queue is full."""
+        if self.queue is None:
+            return False
+        if self._thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            return False
+        return True
+
+    def _collect(self):
+        batch = []
+        stopping = False
+        item = self.queue.get()
+        deadline = time.monotonic() + self.app.config['AUDIT_FLUSH_INTERVAL']
+        while True:
+            if item is _STOP:
+                stopping = True
+            else:
+                batch.append(item)
+            if stopping or len(batch) >= self.app.config['AUDIT_FLUSH_BATCH_SIZE']:
+                break
+            try:
+                item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+        return batch, stopping
+
+    def _write(self, batch):
+        for attempt in range(3):
+            with self.app.app_context():
+                try:
+                    db.session.execute(insert(AuditLog), batch)
+                    db.session.commit()
+                    return
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception(f"Writing {len(batch)} audit log entries failed (attempt {attempt + 1})")
+                finally:
+                    db.session.remove()
+            time.sleep(2 ** attempt)
+        for entry in batch:
+            self.app.logger.error(f"Audit log entry lost: {entry}")
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + stopping):
+                self.queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued entry has been written."""
+        if self._thread is not None:
+            self.queue.join()
+
+    def stop(self, timeout=10):
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+
+
+audit_writer = AuditWriter()
+
+
+def init_app(app):
+    audit_writer.init_app(app)
+
+
+def log_audit(user, action, details="", sync=None):
+    """Records an audit log entry for `user`.
+
+    Security-relevant actions (SECURITY_ACTIONS, or sync=True) are added to
+    the current session and committed by the caller with the change they
+    describe. Everything else goes to the background writer, falling back to
+    the session when buffering is off or the queue is full.
+    """
+    if sync is None:
+        sync = action in SECURITY_ACTIONS
+    if not sync and user.id is not None and audit_writer.submit({
+        'user_id': user.id, 'action': action, 'details': details, 'timestamp': datetime.utcnow()
+    }):
+        return
+    if user.id is None:
+        db.session.add(AuditLog(user=user, action=action, details=details)) # Not flushed yet
+    else:
+        db.session.add(AuditLog(user_id=user.id, action=action, details=details))
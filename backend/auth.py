@@ -0,0 +1,279 @@
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+import hashlib
+import secrets
+import time
+import uuid
+import jwt
+from flask import current_app
+from sqlalchemy import event, select
+from . import db
+from .cache import TTLCache
+from .models import Permission, RefreshToken, RevokedToken, User, UserAuthState, role_permissions, user_roles
+
+# User columns served from the cache instead of loading the User row
+USER_FIELDS = ['id', 'username', 'email', 'first_name', 'last_name']
+
+# Both caches are keyed by (user id, auth version), so bumping a user's
+# version anywhere makes every worker miss once it has refreshed auth_state.
+permission_cache = TTLCache()
+user_cache = TTLCache()
+
+
+class AuthState:
+    """In-memory mirror of the user_auth_state and revoked_token tables.
+
+    Refreshed at most every AUTH_STATE_REFRESH_INTERVAL seconds by reading
+    only the rows changed since the last refresh, so checking a token's
+    version and revocation costs no query on most requests.
+    """
+
+    # Rows committed out of timestamp order can appear behind the high-water
+    # mark; re-reading this much history catches them.
+    OVERLAP = timedelta(seconds=60)
+
+    def __init__(self):
+        self.interval = 5
+        self._lock = Lock()
+        self._versions = {}   # user id -> (version, revoked_before as a UNIX time)
+        self._revoked = {}    # jti -> expiry
+        self._since = None
+        self._refreshed_at = None
+
+    def expire(self):
+        """Makes the next check re-read changes, e.g. right after this process changed them."""
+        self._refreshed_at = None
+
+    def refresh(self):
+        now = datetime.utcnow()
+        since = self._since - self.OVERLAP if self._since else datetime.min
+        states = db.session.query(
+            UserAuthState.user_id, UserAuthState.version, UserAuthState.revoked_before, UserAuthState.updated_at
+        ).filter(UserAuthState.updated_at >= since).all()
+        revoked = db.session.query(RevokedToken.jti, RevokedToken.expires_at).filter(
+            RevokedToken.revoked_at >= since, RevokedToken.expires_at > now
+        ).all()
+        with self._lock:
+            for user_id, version, revoked_before, updated_at in states:
+                cutoff = revoked_before.replace(tzinfo=timezone.utc).timestamp() if revoked_before else 0
+                self._versions[user_id] = (version, cutoff)
+                self._since = max(self._since or updated_at, updated_at)
+            self._revoked.update(revoked)
+            self._revoked = {jti: expires_at for jti, expires_at in self._revoked.items() if expires_at > now}
+            self._refreshed_at = time.monotonic()
+
+    def _check(self):
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.interval:
+            self.refresh()
+
+    def version(self, user_id):
+        self._check()
+        return self._versions.get(user_id, (0, 0))[0]
+
+    def is_revoked(self, claims):
+        self._check()
+        if claims.get('jti') in self._revoked:
+            return True
+        cutoff = self._versions.get(claims['user_id'], (0, 0))[1]
+        return claims.get('iat', 0) <= cutoff
+
+
+auth_state = AuthState()
+
+
+def _expire_on_commit():
+    # Re-reading before the change is committed would cache the old state
+    # for another AUTH_STATE_REFRESH_INTERVAL, so only mark it here
+    db.session.info['auth_state_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _expire_auth_state(session):
+    if session.info.pop('auth_state_changed', False):
+        auth_state.expire()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_auth_state_change(session):
+    session.info.pop('auth_state_changed', None)
+
+
+def init_app(app):
+    permission_cache.maxsize = user_cache.maxsize = app.config['PERMISSION_CACHE_SIZE']
+    permission_cache.ttl = user_cache.ttl = app.config['PERMISSION_CACHE_TTL']
+    auth_state.interval = app.config['AUTH_STATE_REFRESH_INTERVAL']
+
+
+def get_user_permissions(user_id):
+    """Returns the set of permission names granted to a user through their roles."""
+    key = (user_id, auth_state.version(user_id))
+    permissions = permission_cache.get(key)
+    if permissions is None:
+        rows = db.session.query(Permission.name).join(
+            role_permissions, role_permissions.c.permission_id == Permission.id
+        ).join(
+            user_roles, user_roles.c.role_id == role_permissions.c.role_id
+        ).filter(
+            user_roles.c.user_id == user_id
+        ).distinct().all()
+        permissions = frozenset(name for (name,) in rows)
+        permission_cache.set(key, permissions)
+    return permissions
+
+
+def bump_auth_version(user_ids=None, role_id=None, revoke_tokens=False):
+    """Bumps the auth version of the given users, or of every member of
+    `role_id`, in the current session. With `revoke_tokens` every token
+    they were issued so far stops working. The caller commits.
+    """
+    if role_id is not None:
+        user_ids = db.session.scalars(select(user_roles.c.user_id).where(user_roles.c.role_id == role_id)).all()
+    now = datetime.utcnow()
+    for user_id in user_ids:
+        state = db.session.get(UserAuthState, user_id)
+        if state is None:
+            state = UserAuthState(user_id=user_id, version=0)
+            db.session.add(state)
+        state.version += 1
+        state.updated_at = now
+        if revoke_tokens:
+            state.revoked_before = now
+    _expire_on_commit()
+
+
+def issue_token(user):
+    """Signs a short-lived access token for `user`."""
+    now = datetime.now(timezone.utc)
+    return jwt.encode({
+        'user_id': user.id,
+        'jti': uuid.uuid4().hex,
+        'iat': now.timestamp(), # Sub-second, so a revocation never spares a token from the same second
+        'pv': auth_state.version(user.id),
+        'exp': now + timedelta(minutes=30)
+    }, current_app.config['SECRET_KEY'], algorithm="HS256")
+
+
+def revoke_token(claims):
+    """Revokes one decoded token, e.g. on logout. The caller commits."""
+    # Expired tokens are rejected by their signature check; their rows can go
+    RevokedToken.query.filter(RevokedToken.expires_at <= datetime.utcnow()).delete()
+    db.session.add(RevokedToken(
+        jti=claims['jti'],
+        user_id=claims['user_id'],
+        expires_at=datetime.fromtimestamp(claims['exp'], timezone.utc).replace(tzinfo=None)
+    ))
+    _expire_on_commit()
+
+
+def _hash_token(raw):
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def issue_refresh_token(user_id, family_id=None, family_expires_at=None):
+    """Adds a refresh token to the current session and returns its raw value.
+
+    Without a `family_id` this starts a new family (a login), which may be
+    refreshed for up to REFRESH_TOKEN_MAX_DAYS. The caller commits.
+    """
+    now = datetime.utcnow()
+    if family_id is None:
+        family_id = uuid.uuid4().hex
+        family_expires_at = now + timedelta(days=current_app.config['REFRESH_TOKEN_MAX_DAYS'])
+        # Tidy up this user's dead tokens while we are here
+        RefreshToken.query.filter(RefreshToken.user_id == user_id, RefreshToken.family_expires_at <= now).delete()
+    raw = secrets.token_urlsafe(32)
+    db.session.add(RefreshToken(
+        user_id=user_id,
+        family_id=family_id,
+        token_hash=_hash_token(raw),
+        expires_at=min(now + timedelta(days=current_app.config['REFRESH_TOKEN_IDLE_DAYS']), family_expires_at),
+        family_expires_at=family_expires_at
+    ))
+    return raw
+
+
+def rotate_refresh_token(raw):
+    """Exchanges a refresh token for the next one in its family.
+
+    Returns (user id, new raw token), or None if the token is unknown,
+    expired or revoked. Presenting a token that was already exchanged means
+    it was copied, so its whole family is revoked. The caller commits.
+    """
+    now = datetime.utcnow()
+    token = RefreshToken.query.filter_by(token_hash=_hash_token(raw)).with_for_update().first()
+    if token is None:
+        return None
+    if token.used_at is not None:
+        revoke_refresh_tokens(family_id=token.family_id)
+        return None
+    if token.revoked_at is not None or token.expires_at <= now:
+        return None
+    token.used_at = now
+    return token.user_id, issue_refresh_token(token.user_id, token.family_id, token.family_expires_at)
+
+
+def revoke_refresh_tokens(user_id=None, family_id=None, raw=None):
+    """Revokes a user's refresh tokens, one family, or the family of a raw token. The caller commits."""
+    query = RefreshToken.query.filter(RefreshToken.revoked_at.is_(None))
+    if raw is not None:
+        token = RefreshToken.query.filter_by(token_hash=_hash_token(raw)).first()
+        if token is None:
+            return
+        family_id = token.family_id
+    if family_id is not None:
+        query = query.filter(RefreshToken.family_id == family_id)
+    else:
+        query = query.filter(RefreshToken.user_id == user_id)
+    query.update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
+
+class CachedUser:
+    """Stands in for the User a token belongs to.
+
+    Reads of USER_FIELDS come from the cached record; any other attribute,
+    and every assignment, goes to the User row, which is loaded on first need.
+    """
+
+    def __init__(self, record):
+        object.__setattr__(self, '_record', record)
+        object.__setattr__(self, '_user', None)
+
+    def _load(self):
+        user = object.__getattribute__(self, '_user')
+        if user is None:
+            user = db.session.get(User, self._record['id'])
+            object.__setattr__(self, '_user', user)
+        return user
+
+    def __getattr__(self, name):
+        record = object.__getattribute__(self, '_record')
+        if name in record and object.__getattribute__(self, '_user') is None:
+            return record[name]
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        return f"<CachedUser {self._record['username']}>"
+
+
+def load_token_user(claims):
+    """Returns the user a decoded token belongs to, or None if the token was
+    revoked or the user no longer exists. Usually needs no query at all.
+    """
+    if 'user_id' not in claims:
+        return None
+    if claims.get('pv', 0) > auth_state.version(claims['user_id']):
+        auth_state.refresh() # Issued after a change this process has not seen yet
+    if auth_state.is_revoked(claims):
+        return None
+    key = (claims['user_id'], auth_state.version(claims['user_id']))
+    record = user_cache.get(key)
+    if record is None:
+        row = db.session.query(*[getattr(User, name) for name in USER_FIELDS]).filter(User.id == claims['user_id']).first()
+        if row is None:
+            return None
+        record = row._asdict()
+        user_cache.set(key, record)
+    return CachedUser(record)
@@ -0,0 +1,233 @@
+from collections import namedtuple
+from threading import Lock
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import time
+from flask import abort, current_app, send_from_directory
+from werkzeug.security import safe_join
+from . import db
+from .models import Branding
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Without Pillow no variants are made and the original is served
+    Image = None
+
+BRANDING_FIELDS = [
+    'clinic_name', 'logo_light', 'logo_dark', 'logo_home',
+    'report_header', 'report_signature', 'report_footer', 'doctor_name', 'doctor_title',
+]
+
+ASSET_FIELDS = ['logo_light', 'logo_dark', 'logo_home', 'report_header', 'report_signature', 'report_footer']
+
+# Uploads are stored as <sha256 of the content>.<extension> (and their variants
+# as <sha256>.<variant>.webp); such a name never changes meaning, so it can be
+# cached forever
+ASSET_NAME = re.compile(r'^[0-9a-f]{64}\.([a-z]+\.)?[a-z0-9]+$')
+
+# Resized copies made of every uploaded image: variant -> (max width, WebP quality).
+# thumb is for previews, header for on-screen logos and banners, print for
+# A4 reports at 300 dpi.
+IMAGE_VARIANTS = {
+    'thumb': (320, 80),
+    'header': (1200, 82),
+    'print': (2480, 90),
+}
+
+# The serialized branding payload with its version and a strong ETag over the body
+BrandingEntry = namedtuple('BrandingEntry', ['version', 'data', 'body', 'etag'])
+
+
+def _defaults():
+    """The branding a fresh install shows before anyone saves settings."""
+    columns = Branding.__table__.c
+    return {name: columns[name].default.arg if columns[name].default is not None else None for name in BRANDING_FIELDS}
+
+
+class BrandingCache:
+    """Keeps the serialized branding in this process.
+
+    update_branding bumps Branding.version and invalidates the local copy.
+    Other workers keep serving theirs for up to BRANDING_CACHE_TTL seconds,
+    then check the version with a one-column query and only reload the row
+    when it has changed.
+    """
+
+    def __init__(self):
+        self.ttl = 30
+        self._lock = Lock()
+        self._entry = None
+        self._checked_at = 0
+
+    def init_app(self, app):
+        self.ttl = app.config['BRANDING_CACHE_TTL']
+
+    def invalidate(self):
+        self._entry = None
+
+    def _load(self):
+        branding = Branding.query.first()
+        if branding is None:
+            version, data = 0, _defaults() # Nothing saved yet; don't write a row just to read it
+        else:
+            version, data = branding.version, {name: getattr(branding, name) for name in BRANDING_FIELDS}
+        body = json.dumps(data, separators=(',', ':')).encode() + b'\n'
+        return BrandingEntry(version, data, body, hashlib.sha256(body).hexdigest()[:32])
+
+    def get(self):
+        entry = self._entry
+        now = time.monotonic()
+        if entry is not None and now - self._checked_at < self.ttl:
+            return entry
+        with self._lock:
+            if entry is not None:
+                version = db.session.query(Branding.version).order_by(Branding.id).limit(1).scalar() or 0
+                if version != entry.version:
+                    entry = None
+            if entry is None:
+                entry = self._load()
+            self._entry, self._checked_at = entry, now
+        return entry
+
+
+branding_cache = BrandingCache()
+
+
+def init_app(app):
+    branding_cache.init_app(app)
+
+
+def write_atomically(path, write):
+    """Calls `write` with the name of a new, uniquely named file beside `path`
+    and then moves that file into place. Readers never see a half-written
+    file, and threads or processes writing the same path never share one.
+    """
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.part')
+    os.close(fd)
+    try:
+        os.chmod(partial, 0o644) # mkstemp makes it readable by its owner only
+        write(partial)
+        os.replace(partial, path)
+    except BaseException:
+        os.remove(partial)
+        raise
+
+
+def write_bytes_atomically(path, data):
+    def write(partial):
+        with open(partial, 'wb') as f:
+            f.write(data)
+    write_atomically(path, write)
+
+
+def store_asset(data, extension):
+    """Saves uploaded bytes under their content hash and returns the filename.
+
+    Uploading the same image again (for any field) reuses the existing file.
+    """
+    extension = 'jpg' if extension.lower() == 'jpeg' else extension.lower()
+    filename = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(path):
+        write_bytes_atomically(path, data)
+    make_variants(filename, IMAGE_VARIANTS)
+    return filename
+
+
+def variant_name(filename, size):
+    return f"{filename.split('.', 1)[0]}.{size}.webp"
+
+
+def make_variants(filename, sizes):
+    """Writes the given variants of an uploaded image. Returns the filenames
+    that exist afterwards; none if Pillow is missing or the file can't be decoded.
+
+    The image is decoded once, turned upright from its EXIF orientation and
+    scaled down (never up) from the widest variant to the narrowest. Each is
+    re-encoded as WebP without metadata, so camera and location details in
+    phone photos are not passed on.
+    """
+    if Image is None or not ASSET_NAME.match(filename):
+        return {}
+    folder = current_app.config['UPLOAD_FOLDER']
+    names = {size: variant_name(filename, size) for size in sizes}
+    missing = sorted((size for size in sizes if not os.path.exists(os.path.join(folder, names[size]))),
+                     key=lambda size: -IMAGE_VARIANTS[size][0])
+    try:
+        if missing:
+            with Image.open(os.path.join(folder, filename)) as source:
+                source.draft('RGB', (IMAGE_VARIANTS[missing[0]][0],) * 2) # Cheap JPEG downscale while decoding
+                image = ImageOps.exif_transpose(source)
+                image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+            for size in missing:
+                width, quality = IMAGE_VARIANTS[size]
+                if image.width > width:
+                    image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+                write_atomically(os.path.join(folder, names[size]),
+                                 lambda partial: image.save(partial, 'WEBP', quality=quality, method=4))
+    except (OSError, Image.DecompressionBombError):
+        current_app.logger.warning(f"Could not make image variants of {filename}", exc_info=True)
+        return {}
+    return names
+
+
+def asset_response(filename, size=None):
+    """Serves an uploaded file, or its `size` variant, or hands it to the web
+    server to send. Variants missing for older uploads are made on first use,
+    and the original is served when one can't be made.
+
+    With UPLOAD_SENDFILE set to 'x-sendfile' (Apache, lighttpd) or
+    'x-accel-redirect' (nginx) the response only names the file; the web
+    server streams the bytes without tying up a worker.
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    if size is not None:
+        filename = make_variants(filename, [size]).get(size, filename)
+    mode = current_app.config['UPLOAD_SENDFILE']
+    if mode:
+        path = safe_join(folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        if mode == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + filename
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        response = send_from_directory(folder, filename)
+    response.cache_control.public = True
+    if ASSET_NAME.match(filename):
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = current_app.config['UPLOAD_MAX_AGE']
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True # Uploaded before content addressing
+    return response
+
+
+def rehash_assets():
+    """Re-saves branding files stored under upload-time names with
+    content-hashed names, collapsing duplicates. The old files are left in
+    place. Returns how many references were updated.
+    """
+    branding = Branding.query.first()
+    if branding is None:
+        return 0
+    folder = current_app.config['UPLOAD_FOLDER']
+    renamed = 0
+    for field in ASSET_FIELDS:
+        filename = getattr(branding, field)
+        if not filename or ASSET_NAME.match(filename) or not os.path.isfile(os.path.join(folder, filename)):
+            continue
+        with open(os.path.join(folder, filename), 'rb') as f:
+            setattr(branding, field, store_asset(f.read(), filename.rsplit('.', 1)[-1]))
+        renamed += 1
+    if renamed:
+        branding.version += 1
+        db.session.commit()
+        branding_cache.invalidate()
+    return renamed
@@ -8,3 +8,97 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', 'instance', 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Per-process cache of each user's flattened permission set
+    PERMISSION_CACHE_TTL = int(os.environ.get('PERMISSION_CACHE_TTL', 60))
+    PERMISSION_CACHE_SIZE = int(os.environ.get('PERMISSION_CACHE_SIZE', 1024))
+
+    # Spreadsheet exports read rows in batches and spool to disk past this size
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+    EXPORT_SPOOL_MAX_SIZE = int(os.environ.get('EXPORT_SPOOL_MAX_SIZE', 8 * 1024 * 1024))
+
+    # Rows per INSERT batch when importing patient rosters
+    UPLOAD_BATCH_SIZE = int(os.environ.get('UPLOAD_BATCH_SIZE', 500))
+
+    # Background job pool for bulk uploads and exports
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    # Seconds between each worker marking its jobs alive and sweeping for jobs whose
+    # worker died and for expired files (0 disables the sweep)
+    JOB_HEARTBEAT_INTERVAL = int(os.environ.get('JOB_HEARTBEAT_INTERVAL', 30))
+    # Hours a finished job's download stays available before it is deleted
+    JOB_ARTIFACT_RETENTION_HOURS = int(os.environ.get('JOB_ARTIFACT_RETENTION_HOURS', 24))
+    # Processes that render PDF reports when a whole screening cohort is rendered at once
+    REPORT_RENDER_WORKERS = int(os.environ.get('REPORT_RENDER_WORKERS', os.cpu_count() or 2))
+
+    # How uploaded branding files are sent: '' streams them from Flask, 'x-sendfile'
+    # or 'x-accel-redirect' leaves it to the web server (UPLOAD_ACCEL_PREFIX is the
+    # internal nginx location that maps to the upload folder)
+    UPLOAD_SENDFILE = os.environ.get('UPLOAD_SENDFILE', '').lower()
+    UPLOAD_ACCEL_PREFIX = os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+    # Browser cache lifetime in seconds for content-addressed uploads
+    UPLOAD_MAX_AGE = int(os.environ.get('UPLOAD_MAX_AGE', 365 * 24 * 3600))
+    # Seconds a worker serves its cached branding before checking the version in the database
+    BRANDING_CACHE_TTL = int(os.environ.get('BRANDING_CACHE_TTL', 30))
+    # Seconds before the in-process patient search index is rebuilt from the database
+    SEARCH_INDEX_MAX_AGE = int(os.environ.get('SEARCH_INDEX_MAX_AGE', 300))
+
+    # Keyset pagination of list endpoints (?limit=&after=)
+    DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 500))
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+
+    # Audit log retention: entries older than this many days are archived and
+    # deleted (0 keeps every entry)
+    AUDIT_RETENTION_DAYS = int(os.environ.get('AUDIT_RETENTION_DAYS', 30))
+    # Seconds between background purge runs (0 disables the scheduler, e.g. when
+    # `flask purge-audit-logs` runs from cron)
+    AUDIT_PURGE_INTERVAL = int(os.environ.get('AUDIT_PURGE_INTERVAL', 3600))
+    AUDIT_PURGE_BATCH_SIZE = int(os.environ.get('AUDIT_PURGE_BATCH_SIZE', 1000))
+
+    # Buffered audit log writer; a queue size of 0 writes every entry synchronously
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+    AUDIT_FLUSH_BATCH_SIZE = int(os.environ.get('AUDIT_FLUSH_BATCH_SIZE', 500))
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 0.5))
+
+    # Seconds between re-reads of token revocations and per-user auth versions
+    AUTH_STATE_REFRESH_INTERVAL = int(os.environ.get('AUTH_STATE_REFRESH_INTERVAL', 5))
+
+    # Refresh tokens: each use slides the expiry forward by the idle period,
+    # up to a hard limit counted from the login that started the chain
+    REFRESH_TOKEN_IDLE_DAYS = int(os.environ.get('REFRESH_TOKEN_IDLE_DAYS', 7))
+    REFRESH_TOKEN_MAX_DAYS = int(os.environ.get('REFRESH_TOKEN_MAX_DAYS', 30))
+
+    # bcrypt cost factor (read by Flask-Bcrypt) and the pool that runs it:
+    # hashes beyond workers + queue size are refused with a 429
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', 16))
+
+    # Outgoing mail server; SMTP_SECURITY is 'ssl', 'starttls' or 'none'. The sender
+    # address and app password are set on the email settings page.
+    SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+    SMTP_PORT = int(os.environ.get('SMTP_PORT', 465))
+    SMTP_SECURITY = os.environ.get('SMTP_SECURITY', 'ssl').lower()
+    # Seconds between checks of the outbound mail queue (0 disables the sender in this process)
+    MAIL_POLL_INTERVAL = int(os.environ.get('MAIL_POLL_INTERVAL', 30))
+    # Most emails sent per minute across all workers
+    MAIL_RATE_PER_MINUTE = int(os.environ.get('MAIL_RATE_PER_MINUTE', 20))
+    # Delivery attempts per email, and the delay in seconds before the first retry (doubling after each)
+    MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 6))
+    MAIL_RETRY_DELAY = int(os.environ.get('MAIL_RETRY_DELAY', 30))
+    # Seconds an idle SMTP connection is kept open for the next email
+    MAIL_IDLE_TIMEOUT = int(os.environ.get('MAIL_IDLE_TIMEOUT', 60))
+
+    # Number of reverse proxies in front of the app whose X-Forwarded-For and
+    # X-Forwarded-Proto headers are trusted; 0 uses the connecting address as is
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+    PROXY_FIX_X_PROTO = int(os.environ.get('PROXY_FIX_X_PROTO', 0))
+    # Rate limiter backend: a redis:// URL to share counters between workers, or empty to keep them in memory
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', '')
+    # Length in seconds of the rate limiting window
+    RATELIMIT_WINDOW = int(os.environ.get('RATELIMIT_WINDOW', 60))
+    # Most keys the in-memory rate limiter tracks before dropping the oldest
+    RATELIMIT_MAX_KEYS = int(os.environ.get('RATELIMIT_MAX_KEYS', 100000))
+    # Failed login and account claim attempts allowed per client IP per window
+    LOGIN_RATE_LIMIT_PER_IP = int(os.environ.get('LOGIN_RATE_LIMIT_PER_IP', 20))
+    # Failed login attempts allowed per username (or claim attempts per staff ID) per window
+    LOGIN_RATE_LIMIT_PER_ACCOUNT = int(os.environ.get('LOGIN_RATE_LIMIT_PER_ACCOUNT', 5))
@@ -0,0 +1,208 @@
+from flask import Response, current_app, send_file, stream_with_context
+import csv
+import io
+import itertools
+import json
+import openpyxl
+import tempfile
+from . import db
+from .models import Patient, ScreeningBioData
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError: # Parquet exports are only offered when pyarrow is installed
+    pyarrow = None
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+EXPORT_FORMATS = ('xlsx', 'csv', 'parquet')
+
+BIODATA_HEADERS = [
+    'Staff ID', 'First Name', 'Middle Name', 'Last Name', 'Department',
+    'Gender', 'Date of Birth', 'Contact Phone', 'Email Address',
+    'Race', 'Nationality'
+]
+
+
+def biodata_query(screening_year=None, company_section=None):
+    """Selects the bio-data columns for all patients, or for one screening cohort."""
+    query = db.session.query(
+        Patient.staff_id, Patient.first_name, Patient.middle_name, Patient.last_name,
+        Patient.department, Patient.gender, Patient.date_of_birth, Patient.contact_phone,
+        Patient.email_address, Patient.race, Patient.nationality
+    )
+    if screening_year is not None:
+        query = query.join(
+            ScreeningBioData, Patient.id == ScreeningBioData.patient_comprehensive_id
+        ).filter(
+            ScreeningBioData.screening_year == screening_year,
+            ScreeningBioData.company_section == company_section
+        )
+    return query.order_by(Patient.first_name, Patient.last_name)
+
+
+def biodata_rows(rows):
+    for row in rows:
+        row = list(row)
+        row[6] = row[6].isoformat() if row[6] else ''
+        yield row
+
+
+def stream_query(query):
+    """Iterates a query in fixed-size batches instead of loading every row at once."""
+    return query.yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+
+
+def write_xlsx(output, title, headers, rows):
+    """Writes a single-sheet workbook to `output` in write-only mode, so rows
+    are flushed as they are appended rather than kept in memory.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(output)
+
+
+def xlsx_response(title, headers, rows, download_name):
+    """Builds the workbook into a spooled temporary file and streams it back.
+
+    Small exports stay in memory; larger ones roll over to disk once they pass
+    EXPORT_SPOOL_MAX_SIZE bytes.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=current_app.config['EXPORT_SPOOL_MAX_SIZE'])
+    write_xlsx(output, title, headers, rows)
+    output.seek(0)
+    return send_file(
+        output,
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=download_name
+    )
+
+
+def write_csv(output, headers, rows):
+    writer = csv.writer(output)
+    writer.writerow(headers)
+    writer.writerows(rows)
+
+
+def csv_response(headers, rows, download_name):
+    """Streams rows as CSV while they are read, one batch of lines per chunk."""
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={download_name}'}
+    )
+
+
+def ndjson_response(records, download_name):
+    """Streams dicts as newline-delimited JSON while they are read."""
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+
+    def generate():
+        for batch in iter(lambda: list(itertools.islice(records, batch_size)), []):
+            yield ''.join(json.dumps(record, default=str) + '\n' for record in batch)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={download_name}'}
+    )
+
+
+def _as_number(value, t):
+    """Converts a cell to float or int, or None when it holds no number (e.g. '')."""
+    if value is None or isinstance(value, t):
+        return value
+    try:
+        return t(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def write_parquet(output, headers, rows, types=None):
+    """Writes rows to a Parquet file one row group per batch.
+
+    `types` gives the Python type of each column (float, int or str) and
+    defaults to all strings.
+    """
+    arrow_types = {float: pyarrow.float64(), int: pyarrow.int64(), str: pyarrow.string()}
+    types = types or [str] * len(headers)
+    schema = pyarrow.schema([(name, arrow_types[t]) for name, t in zip(headers, types)])
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+
+    with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+        for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+            columns = []
+            for i, t in enumerate(types):
+                values = [row[i] for row in batch]
+                if t is str:
+                    values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+                else:
+                    values = [_as_number(v, t) for v in values]
+                columns.append(values)
+            writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+
+
+def parquet_response(headers, rows, download_name, types=None):
+    output = tempfile.SpooledTemporaryFile(max_size=current_app.config['EXPORT_SPOOL_MAX_SIZE'])
+    write_parquet(output, headers, rows, types)
+    output.seek(0)
+    return send_file(
+        output,
+        mimetype='application/vnd.apache.parquet',
+        as_attachment=True,
+        download_name=download_name
+    )
+
+
+def export_response(export_format, title, headers, rows, basename, types=None):
+    """Renders an export in the requested format; the caller has already
+    validated `export_format` against EXPORT_FORMATS.
+    """
+    rows = iter(rows)
+    download_name = f'{basename}.{export_format}'
+    if export_format == 'csv':
+        return csv_response(headers, rows, download_name)
+    if export_format == 'parquet':
+        return parquet_response(headers, rows, download_name, types)
+    return xlsx_response(title, headers, rows, download_name)
+
+
+def write_export(path, export_format, title, headers, rows, types=None):
+    """Writes an export to a file on disk, e.g. as a background job artifact."""
+    rows = iter(rows)
+    if export_format == 'csv':
+        with open(path, 'w', newline='') as output:
+            write_csv(output, headers, rows)
+    elif export_format == 'parquet':
+        with open(path, 'wb') as output:
+            write_parquet(output, headers, rows, types)
+    else:
+        with open(path, 'wb') as output:
+            write_xlsx(output, title, headers, rows)
+
+
+def check_export_format(export_format):
+    """Returns an error message for an unusable format, or None if it can be served."""
+    if export_format not in EXPORT_FORMATS:
+        return f"Unsupported format '{export_format}'. Choose one of: {', '.join(EXPORT_FORMATS)}."
+    if export_format == 'parquet' and pyarrow is None:
+        return 'Parquet export is not available on this server.'
+    return None
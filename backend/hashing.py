@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from . import bcrypt
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing pool already has as many operations waiting as it allows."""
+
+
+class HashingPool:
+    """Runs bcrypt on a small dedicated thread pool.
+
+    bcrypt releases the GIL while it hashes, so a few pool threads use the
+    CPU cores while request threads only wait. At most PASSWORD_HASH_WORKERS
+    hashes run at once and PASSWORD_HASH_QUEUE_SIZE more may wait; past that,
+    callers get PasswordHashingBusy (a 429) straight away instead of piling
+    up behind a login storm and starving other requests.
+    """
+
+    def __init__(self):
+        self.executor = None
+        self.workers = 0
+        self.queue_size = 0
+        self._lock = Lock()
+        self._pending = 0
+        self._rejected = 0
+        self._completed = 0
+
+    def init_app(self, app):
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.queue_size = app.config['PASSWORD_HASH_QUEUE_SIZE']
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+
+    def run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise PasswordHashingBusy()
+            self._pending += 1
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'running': min(self._pending, self.workers),
+                'queued': max(0, self._pending - self.workers),
+                'queue_size': self.queue_size,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+
+
+hashing_pool = HashingPool()
+
+
+def init_app(app):
+    hashing_pool.init_app(app)
+
+
+def hash_password(password):
+    return hashing_pool.run(bcrypt.generate_password_hash, password).decode('utf-8')
+
+
+def check_password(password_hash, password):
+    return hashing_pool.run(bcrypt.check_password_hash, password_hash, password)
@@ -0,0 +1,156 @@
+from datetime import date, datetime
+import openpyxl
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import Patient
+
+# Spreadsheet column -> Patient attribute
+UPLOAD_COLUMNS = {
+    'Staff ID': 'staff_id',
+    'Patient ID': 'patient_id',
+    'First Name': 'first_name',
+    'Middle Name': 'middle_name',
+    'Last Name': 'last_name',
+    'Department': 'department',
+    'Gender': 'gender',
+    'Date of Birth': 'date_of_birth',
+    'Contact Phone': 'contact_phone',
+    'Email Address': 'email_address',
+    'Race': 'race',
+    'Nationality': 'nationality',
+}
+
+REQUIRED_COLUMNS = ['Staff ID', 'First Name', 'Last Name']
+
+# Columns a row must fill in before it can be stored (Patient columns are NOT NULL)
+REQUIRED_VALUES = [
+    'Staff ID', 'First Name', 'Last Name', 'Department', 'Gender', 'Date of Birth',
+    'Contact Phone', 'Email Address', 'Race', 'Nationality'
+]
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    if isinstance(value, float) and value.is_integer():
+        # Numeric cells such as staff IDs and phone numbers come back as floats
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+def parse_date_of_birth(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(value, fmt).date()
+            except ValueError:
+                pass
+    return None
+
+
+def _insert_chunk(chunk, report):
+    """Inserts a batch with one executemany; if the batch is rejected, retries
+    row by row so one bad row doesn't sink the others.
+    """
+    try:
+        db.session.bulk_insert_mappings(Patient, [mapping for _, mapping in chunk])
+        db.session.commit()
+        report['inserted'].extend({'row': row, 'staff_id': mapping['staff_id']} for row, mapping in chunk)
+        return
+    except IntegrityError:
+        db.session.rollback()
+
+    for row, mapping in chunk:
+        try:
+            db.session.bulk_insert_mappings(Patient, [mapping])
+            db.session.commit()
+            report['inserted'].append({'row': row, 'staff_id': mapping['staff_id']})
+        except IntegrityError:
+            db.session.rollback()
+            report['skipped'].append({'row': row, 'staff_id': mapping['staff_id'], 'reason': 'Conflicts with an existing patient'})
+
+
+def ingest_patient_workbook(file, batch_size=500, progress=None):
+    """Loads new patients from an .xlsx roster.
+
+    Existing staff and patient IDs are fetched once up front, rows are
+    validated in a single pass over a read-only workbook, and new patients are
+    inserted in batches of `batch_size`. Returns a report listing the inserted,
+    skipped and invalid rows by spreadsheet row number. If given,
+    `progress(rows_done, rows_total)` is called after each batch.
+
+    Raises ValueError if the header row lacks a required column.
+    """
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        total_rows = (sheet.max_row or 1) - 1
+        rows = sheet.iter_rows(values_only=True)
+        headers = [_clean(h) for h in next(rows, ())]
+        missing_columns = [c for c in REQUIRED_COLUMNS if c not in headers]
+        if missing_columns:
+            raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+
+        staff_ids = {s for (s,) in db.session.query(Patient.staff_id)}
+        patient_ids = {p for (p,) in db.session.query(Patient.patient_id)}
+        seen = set()
+        report = {'inserted': [], 'skipped': [], 'invalid': []}
+        chunk = []
+
+        for row_number, row in enumerate(rows, start=2):
+            row_data = {h: _clean(v) for h, v in zip(headers, row) if h in UPLOAD_COLUMNS}
+            if not any(row_data.values()):
+                continue # Blank line
+
+            staff_id = row_data.get('Staff ID')
+            missing = [c for c in REQUIRED_VALUES if not row_data.get(c)]
+            if missing:
+                report['invalid'].append({'row': row_number, 'staff_id': staff_id, 'reason': f"Missing {', '.join(missing)}"})
+                continue
+
+            if staff_id in seen:
+                report['skipped'].append({'row': row_number, 'staff_id': staff_id, 'reason': 'Duplicate Staff ID in file'})
+                continue
+            if staff_id in staff_ids:
+                report['skipped'].append({'row': row_number, 'staff_id': staff_id, 'reason': 'Patient already exists'})
+                continue
+
+            dob = parse_date_of_birth(row_data['Date of Birth'])
+            if dob is None:
+                report['invalid'].append({'row': row_number, 'staff_id': staff_id, 'reason': f"Invalid Date of Birth '{row_data['Date of Birth']}'"})
+                continue
+
+            # Like screening registration, fall back to the staff ID as the patient ID
+            patient_id = row_data.get('Patient ID') or staff_id
+            if patient_id in patient_ids:
+                report['invalid'].append({'row': row_number, 'staff_id': staff_id, 'reason': f"Patient ID '{patient_id}' is already in use"})
+                continue
+
+            mapping = {UPLOAD_COLUMNS[h]: v for h, v in row_data.items()}
+            mapping['patient_id'] = patient_id
+            mapping['date_of_birth'] = dob
+            mapping['date_registered'] = datetime.utcnow()
+            seen.add(staff_id)
+            patient_ids.add(patient_id)
+            chunk.append((row_number, mapping))
+
+            if len(chunk) >= batch_size:
+                _insert_chunk(chunk, report)
+                chunk = []
+                if progress:
+                    progress(row_number - 1, total_rows)
+
+        if chunk:
+            _insert_chunk(chunk, report)
+        return report
+    finally:
+        workbook.close()
@@ -0,0 +1,219 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from flask import current_app
+from sqlalchemy import or_
+import json
+import os
+import random
+import time
+from . import db, socketio
+from .models import Job
+
+# Shared pool that runs bulk work (uploads, exports) outside request threads.
+# Created by init_app so its size comes from the app config.
+executor = None
+
+# Jobs this process has queued or is running; the sweeper keeps their heartbeat fresh
+_active = set()
+_active_lock = Lock()
+
+# Heartbeats a job may miss before it is assumed lost with its worker
+MISSED_HEARTBEATS = 3
+
+_sweeper = None
+_sweeper_lock = Lock()
+
+
+def init_app(app):
+    global executor
+    executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'], thread_name_prefix='job')
+    app.config.setdefault('JOB_FOLDER', os.path.join(app.instance_path, 'jobs'))
+    os.makedirs(app.config['JOB_FOLDER'], exist_ok=True)
+
+    @app.before_request
+    def start_job_sweeper():
+        # Only web workers hold jobs, so CLI commands and migrations never sweep
+        if _sweeper is None and app.config['JOB_HEARTBEAT_INTERVAL'] > 0:
+            start_sweeper(app)
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'has_artifact': bool(job.artifact_path),
+    }
+
+
+def _emit(job):
+    # Clients follow a job by joining its room with the existing 'join' event.
+    # Rooms are not authenticated, so the event only says how far along the job
+    # is; the result is fetched from GET /jobs/<id>.
+    socketio.emit('job_progress', {
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+    }, to=f'job_{job.id}')
+
+
+class JobProgress:
+    """Handed to a job function so it can report how far along it is.
+
+    Calling it with (done, total) stores the percentage and pushes a
+    'job_progress' event, but only when the whole percent changes.
+    """
+
+    def __init__(self, job):
+        self.job = job
+
+    def __call__(self, done, total, message=None):
+        percent = min(99, int(done * 100 / total)) if total else 0
+        if percent == self.job.progress and message is None:
+            return
+        self.job.progress = percent
+        if message is not None:
+            self.job.message = message
+        db.session.commit()
+        _emit(self.job)
+
+    def artifact_path(self, extension):
+        """Returns the path the job should write its output file to."""
+        return os.path.join(current_app.config['JOB_FOLDER'], f'job_{self.job.id}.{extension}')
+
+
+def _run(app, job_id, target, args):
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+        _emit(job)
+
+        try:
+            result = target(JobProgress(job), *args) or {}
+            job.artifact_path = result.pop('artifact_path', None)
+            job.artifact_name = result.pop('artifact_name', None)
+            job.result = json.dumps(result)
+            job.status = 'finished'
+            job.progress = 100
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception(f"Job {job_id} ({job.kind}) failed")
+            job = db.session.get(Job, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            _emit(job)
+            db.session.remove()
+            with _active_lock:
+                _active.discard(job_id)
+
+
+def submit_job(kind, user, target, *args):
+    """Records a queued job and schedules `target(progress, *args)` on the pool.
+
+    `target` runs inside an application context. It may return a dict that is
+    stored as the job result; 'artifact_path' and 'artifact_name' keys mark a
+    file the user can download once the job has finished.
+    """
+    job = Job(kind=kind, user_id=user.id)
+    db.session.add(job)
+    db.session.commit()
+    with _active_lock:
+        _active.add(job.id)
+    executor.submit(_run, current_app._get_current_object(), job.id, target, args)
+    return job
+
+
+def sweep_jobs(app_config):
+    """Marks this process's jobs alive, fails jobs whose worker has stopped
+    sending heartbeats (it crashed or was restarted mid-job) and deletes job
+    files older than JOB_ARTIFACT_RETENTION_HOURS. Returns (failed, expired).
+    """
+    now = datetime.utcnow()
+    with _active_lock:
+        active = list(_active)
+    if active:
+        Job.query.filter(Job.id.in_(active)).update({Job.heartbeat_at: now}, synchronize_session=False)
+        db.session.commit()
+
+    lost_before = now - timedelta(seconds=app_config['JOB_HEARTBEAT_INTERVAL'] * MISSED_HEARTBEATS)
+    lost = Job.query.filter(
+        Job.status.in_(['queued', 'running']),
+        or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < lost_before)
+    ).all()
+    for job in lost:
+        job.status = 'failed'
+        job.error = 'The job was interrupted because the server running it stopped.'
+        job.finished_at = now
+    db.session.commit()
+    for job in lost:
+        _emit(job)
+
+    cutoff = now - timedelta(hours=app_config['JOB_ARTIFACT_RETENTION_HOURS'])
+    expired = Job.query.filter(Job.artifact_path.isnot(None), Job.finished_at < cutoff).all()
+    for job in expired:
+        try:
+            os.remove(job.artifact_path)
+        except FileNotFoundError:
+            pass
+        job.artifact_path = None
+    db.session.commit()
+
+    # Uploaded spreadsheets and files left by failed or interrupted jobs
+    cutoff_time = time.time() - app_config['JOB_ARTIFACT_RETENTION_HOURS'] * 3600
+    for entry in os.scandir(app_config['JOB_FOLDER']):
+        if entry.is_file() and entry.stat().st_mtime < cutoff_time:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    return len(lost), len(expired)
+
+
+class JobSweeper(Thread):
+    """Daemon thread that runs sweep_jobs every JOB_HEARTBEAT_INTERVAL seconds.
+
+    Every worker process runs one; each keeps its own jobs' heartbeats fresh,
+    and any of them may fail the jobs of a worker that has gone away.
+    """
+
+    def __init__(self, app):
+        super().__init__(name='job-sweeper', daemon=True)
+        self.app = app
+        self.stopped = Event()
+
+    def run(self):
+        interval = self.app.config['JOB_HEARTBEAT_INTERVAL']
+        # The first sweep comes soon after the first request, spread out so workers started together don't collide
+        delay = random.uniform(1, min(interval, 10))
+        while not self.stopped.wait(delay):
+            with self.app.app_context():
+                try:
+                    sweep_jobs(self.app.config)
+                except Exception:
+                    self.app.logger.exception("Job sweep failed")
+                finally:
+                    db.session.remove()
+            delay = interval
+
+
+def start_sweeper(app):
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = JobSweeper(app)
+            _sweeper.start()
+    return _sweeper
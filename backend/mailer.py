@@ -0,0 +1,275 @@
+from datetime import datetime, timedelta
+from email import policy
+from threading import Event, Lock, Thread
+import random
+import smtplib
+import time
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .audit import log_audit
+from .models import MailRateWindow, OutboundEmail, SystemConfig, User
+
+# How long a claimed message may stay 'sending' before another worker may
+# assume its sender died and pick it up again. Messages are claimed one at a
+# time, so this only has to outlast a single connect and send.
+LEASE = timedelta(minutes=5)
+
+
+def email_to_dict(email):
+    return {
+        'id': email.id,
+        'to': email.to_address,
+        'subject': email.subject,
+        'status': email.status,
+        'attempts': email.attempts,
+        'next_attempt_at': email.next_attempt_at.isoformat() if email.status == 'queued' else None,
+        'last_error': email.last_error,
+        'created_at': email.created_at.isoformat(),
+        'sent_at': email.sent_at.isoformat() if email.sent_at else None,
+    }
+
+
+def smtp_settings(app_config):
+    """Server settings from the app config plus the sender credentials
+    managed on the email settings page. None if no sender is configured.
+    """
+    values = dict(db.session.query(SystemConfig.key, SystemConfig.value).filter(
+        SystemConfig.key.in_(['sender_email', 'app_password'])
+    ).all())
+    if not values.get('sender_email'):
+        return None
+    return (app_config['SMTP_HOST'], app_config['SMTP_PORT'], app_config['SMTP_SECURITY'],
+            values['sender_email'], values.get('app_password'))
+
+
+def enqueue(message, user=None, audit_action=None):
+    """Adds an EmailMessage to the outbound queue and returns its OutboundEmail.
+
+    The caller commits, then calls mail_sender.wake() so this worker's sender
+    picks it up straight away instead of at its next poll. With
+    `audit_action`, <action>_SUCCESS or <action>_FAILURE is logged for `user`
+    once delivery settles.
+    """
+    email = OutboundEmail(
+        to_address=message['To'],
+        subject=message['Subject'],
+        message=message.as_bytes(policy=policy.SMTP), # CRLF line endings, ready for sendmail()
+        user_id=user.id if user else None,
+        audit_action=audit_action
+    )
+    db.session.add(email)
+    return email
+
+
+def _is_permanent(error):
+    # 5xx replies (bad address, message rejected) won't succeed on a retry
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500 \
+        and not isinstance(error, smtplib.SMTPAuthenticationError)
+
+
+class MailSender:
+    """Delivers queued OutboundEmail rows from a background thread.
+
+    One authenticated SMTP connection is kept open and reused for every
+    message until it has been idle for MAIL_IDLE_TIMEOUT seconds. At most
+    MAIL_RATE_PER_MINUTE messages are attempted per minute across all
+    workers. A message that fails with a temporary error is retried after
+    MAIL_RETRY_DELAY seconds, doubling per attempt, up to MAIL_MAX_ATTEMPTS;
+    permanent 5xx rejections fail immediately.
+
+    Every worker runs a sender. Before each message a sender reserves a slot
+    in the minute's MailRateWindow, then claims one due message with a
+    conditional UPDATE, so each message is sent by one of them and the rate
+    holds however many there are.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._lock = Lock()
+        self._wake = Event()
+        self._smtp = None
+        self._smtp_settings = None
+        self._smtp_used_at = 0
+
+    def init_app(self, app):
+        self.app = app
+
+        @app.before_request
+        def start_mail_sender():
+            # Started by the first request so CLI commands and migrations never
+            # run a sender; `flask send-queued-emails` calls deliver_due() itself
+            if self._thread is None and app.config['MAIL_POLL_INTERVAL'] > 0:
+                self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='mail-sender', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        delay = 0
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    delay = self.deliver_due()
+                except Exception:
+                    self.app.logger.exception("Outbound mail delivery failed")
+                    delay = self.app.config['MAIL_POLL_INTERVAL']
+                finally:
+                    db.session.remove()
+            if self._smtp is not None and time.monotonic() - self._smtp_used_at >= self.app.config['MAIL_IDLE_TIMEOUT']:
+                self._disconnect()
+
+    def _due(self, now, limit=1):
+        return db.session.query(OutboundEmail.id, OutboundEmail.status, OutboundEmail.next_attempt_at).filter(
+            or_(OutboundEmail.status == 'queued', OutboundEmail.status == 'sending'),
+            OutboundEmail.next_attempt_at <= now
+        ).order_by(OutboundEmail.next_attempt_at, OutboundEmail.id).limit(limit).all()
+
+    def _reserve_slot(self, window):
+        """Takes one of the minute's sending slots; False once they are all taken."""
+        if not MailRateWindow.query.filter_by(window_start=window).first():
+            try:
+                with db.session.begin_nested():
+                    db.session.add(MailRateWindow(window_start=window, reserved=0))
+            except IntegrityError:
+                pass # Another worker opened the window first
+            MailRateWindow.query.filter(MailRateWindow.window_start < window - timedelta(hours=1)).delete()
+        # Atomic, so concurrent senders can't both take the last slot
+        result = db.session.execute(update(MailRateWindow).where(
+            MailRateWindow.window_start == window,
+            MailRateWindow.reserved < self.app.config['MAIL_RATE_PER_MINUTE']
+        ).values(reserved=MailRateWindow.reserved + 1))
+        db.session.commit()
+        return bool(result.rowcount)
+
+    def _release_slot(self, window):
+        db.session.execute(update(MailRateWindow).where(
+            MailRateWindow.window_start == window, MailRateWindow.reserved > 0
+        ).values(reserved=MailRateWindow.reserved - 1))
+        db.session.commit()
+
+    def _claim(self, now):
+        """Leases one due message to this sender and returns its id, or None."""
+        for email_id, status, next_attempt_at in self._due(now, limit=5):
+            result = db.session.execute(update(OutboundEmail).where(
+                OutboundEmail.id == email_id,
+                OutboundEmail.status == status,
+                OutboundEmail.next_attempt_at == next_attempt_at
+            ).values(status='sending', next_attempt_at=now + LEASE))
+            if result.rowcount:
+                db.session.commit()
+                return email_id
+        db.session.commit()
+        return None
+
+    def deliver_due(self):
+        """Sends every message that is due, one at a time, within the rate
+        limit. Returns the seconds until there may be more to do.
+        """
+        poll = self.app.config['MAIL_POLL_INTERVAL'] or 60
+        settings = None
+        while True:
+            now = datetime.utcnow()
+            if not self._due(now):
+                return poll
+            window = now.replace(second=0, microsecond=0)
+            if not self._reserve_slot(window):
+                return min(max(1, 60 - (now - window).total_seconds()), poll)
+            email_id = self._claim(now)
+            if email_id is None:
+                self._release_slot(window) # Another worker got there first
+                continue
+            if settings is None:
+                settings = smtp_settings(self.app.config)
+            self._deliver(db.session.get(OutboundEmail, email_id), settings)
+
+    def _connect(self, settings):
+        host, port, security, username, password = settings
+        if security == 'ssl':
+            smtp = smtplib.SMTP_SSL(host, port, timeout=30)
+        else:
+            smtp = smtplib.SMTP(host, port, timeout=30)
+            if security == 'starttls':
+                smtp.starttls()
+        smtp.ehlo_or_helo_if_needed()
+        if password and smtp.has_extn('auth'):
+            smtp.login(username, password)
+        self._smtp, self._smtp_settings = smtp, settings
+
+    def close(self):
+        """Closes the kept-open SMTP connection, if any."""
+        if self._smtp is not None:
+            self._disconnect()
+
+    def _disconnect(self):
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+    def _send(self, email, settings):
+        if self._smtp is not None and self._smtp_settings != settings:
+            self._disconnect() # The credentials were changed
+        reused = self._smtp is not None
+        if not reused:
+            self._connect(settings)
+        try:
+            self._smtp.sendmail(settings[3], [email.to_address], email.message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped a connection we kept open; one fresh try
+            self._smtp = None
+            if not reused:
+                raise
+            self._connect(settings)
+            self._smtp.sendmail(settings[3], [email.to_address], email.message)
+        self._smtp_used_at = time.monotonic()
+
+    def _deliver(self, email, settings):
+        email.attempts += 1
+        try:
+            if settings is None:
+                raise RuntimeError('Email service is not configured.')
+            self._send(email, settings)
+        except Exception as e:
+            if self._smtp is not None and not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                self._disconnect()
+            email.last_error = str(e)
+            if _is_permanent(e) or email.attempts >= self.app.config['MAIL_MAX_ATTEMPTS']:
+                email.status = 'failed'
+                self.app.logger.error(f"Giving up on email {email.id} to {email.to_address}: {e}")
+            else:
+                email.status = 'queued'
+                delay = self.app.config['MAIL_RETRY_DELAY'] * 2 ** (email.attempts - 1)
+                email.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay * random.uniform(1, 1.2))
+                self.app.logger.warning(f"Email {email.id} to {email.to_address} failed, retrying in {delay}s: {e}")
+        else:
+            email.status = 'sent'
+            email.sent_at = datetime.utcnow()
+            email.last_error = None
+
+        if email.status != 'queued' and email.audit_action and email.user_id:
+            user = db.session.get(User, email.user_id)
+            if email.status == 'sent':
+                log_audit(user, f'{email.audit_action}_SUCCESS', f"Email {email.id} '{email.subject}' delivered to {email.to_address}")
+            else:
+                log_audit(user, f'{email.audit_action}_FAILURE', f"Email {email.id} to {email.to_address} failed: {email.last_error}")
+        db.session.commit()
+
+
+mail_sender = MailSender()
+
+
+def init_app(app):
+    mail_sender.init_app(app)
@@ -1,4 +1,5 @@
-from . import db, bcrypt
+from . import db
+from .hashing import check_password, hash_password
 from datetime import datetime
 import re
 
@@ -17,10 +18,10 @@ class User(db.Model):
     otp_enabled = db.Column(db.Boolean, nullable=False, default=False)
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return check_password(self.password_hash, password)
 
     @staticmethod
     def is_password_strong(password):
@@ -90,12 +91,46 @@ class AuditLog(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User')
     action = db.Column(db.String(100), nullable=False)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     details = db.Column(db.Text)
 
     def __repr__(self):
         return f'<AuditLog {self.user.username} - {self.action}>'
 
+class UserAuthState(db.Model):
+    """Per-user counters that let every worker check tokens without loading the user.
+
+    `version` is bumped whenever a user's roles, role permissions or cached
+    profile fields change; `revoked_before` rejects every token issued before
+    it (e.g. after a password change).
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    revoked_before = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class RefreshToken(db.Model):
+    """A single-use refresh token. Each use replaces it with a new token in the
+    same family; presenting one that was already used revokes the family.
+    Only a SHA-256 hash of the token is stored.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    family_id = db.Column(db.String(32), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False) # Slides forward with every rotation
+    family_expires_at = db.Column(db.DateTime, nullable=False) # Hard limit for the whole family
+    used_at = db.Column(db.DateTime)
+    revoked_at = db.Column(db.DateTime)
+
+class RevokedToken(db.Model):
+    """A single logged-out token, kept until it would have expired anyway."""
+    jti = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
 class Patient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     staff_id = db.Column(db.String(50), unique=True, nullable=False)
@@ -125,6 +160,11 @@ class Patient(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, unique=True)
     user = db.relationship('User', backref=db.backref('patient', uselist=False))
 
+    __table_args__ = (
+        # Patient lists and exports are ordered by name
+        db.Index('ix_patient_name', 'first_name', 'last_name'),
+    )
+
     def __repr__(self):
         return f'<Patient {self.first_name} {self.last_name}>'
 
@@ -274,11 +314,36 @@ class ScreeningBioData(db.Model):
     __table_args__ = (
         db.UniqueConstraint('patient_id_for_year', 'screening_year', 'company_section', name='_patient_id_year_company_uc'),
         db.UniqueConstraint('patient_comprehensive_id', 'screening_year', 'company_section', name='_patient_comprehensive_year_company_uc'),
+        # Cohort lookups filter on year and section, the daily queue on registered_at too
+        db.Index('ix_screening_bio_data_cohort_registered_at', 'screening_year', 'company_section', 'registered_at'),
     )
 
     def __repr__(self):
         return f'<ScreeningBioData for Patient {self.patient_comprehensive_id} in {self.screening_year}>'
 
+class ScreeningStatCounter(db.Model):
+    """Running registration totals for one screening cohort on one day.
+
+    Kept up to date by the routes that register, delete or re-describe
+    screened patients, so dashboard stats never have to scan the cohort.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    screening_year = db.Column(db.Integer, nullable=False)
+    company_section = db.Column(db.String(10), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    male = db.Column(db.Integer, nullable=False, default=0)
+    female = db.Column(db.Integer, nullable=False, default=0)
+    over_40 = db.Column(db.Integer, nullable=False, default=0)
+    under_40 = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('screening_year', 'company_section', 'day', name='_screening_stat_counter_uc'),
+    )
+
+    def __repr__(self):
+        return f'<ScreeningStatCounter {self.screening_year} {self.company_section} {self.day}>'
+
 class SystemConfig(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(50), unique=True, nullable=False)
@@ -313,6 +378,10 @@ class Message(db.Model):
     conversation = db.relationship('Conversation', back_populates='messages')
     sender = db.relationship('User', backref='sent_messages')
 
+    __table_args__ = (
+        db.Index('ix_message_conversation_timestamp', 'conversation_id', 'timestamp'),
+    )
+
 class Branding(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     clinic_name = db.Column(db.String(100), nullable=False, default='Legit HealthCare Services Ltd')
@@ -324,6 +393,8 @@ class Branding(db.Model):
     report_footer = db.Column(db.String(255), nullable=True)
     doctor_name = db.Column(db.String(100), nullable=True, default='Dr. Anyanwu Ugochukwu D. FMCPath')
     doctor_title = db.Column(db.String(100), nullable=True, default='Consultant in Charge')
+    # Bumped on every change so caches of the branding can tell they are stale
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     def __repr__(self):
         return f'<Branding {self.clinic_name}>'
@@ -336,3 +407,59 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     user = db.relationship('User', backref='notifications')
+
+    __table_args__ = (
+        db.Index('ix_notification_user_timestamp', 'user_id', 'timestamp'),
+    )
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued') # 'queued', 'running', 'finished' or 'failed'
+    progress = db.Column(db.Integer, nullable=False, default=0) # Percent complete
+    message = db.Column(db.String(255))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship('User')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    result = db.Column(db.Text) # JSON summary returned by the job
+    error = db.Column(db.Text)
+    artifact_path = db.Column(db.String(255)) # File produced by the job, if any
+    artifact_name = db.Column(db.String(255)) # Download name for the artifact
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow) # Last time the worker holding the job was seen alive
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+class OutboundEmail(db.Model):
+    """An email waiting for, or done with, delivery by the background mail sender."""
+    __table_args__ = (db.Index('ix_outbound_email_due', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    to_address = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    message = db.Column(db.LargeBinary, nullable=False) # The whole RFC 5322 message, attachments included
+    status = db.Column(db.String(20), nullable=False, default='queued') # 'queued', 'sending', 'sent' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # Also the lease expiry while 'sending'
+    last_error = db.Column(db.Text)
+    audit_action = db.Column(db.String(50)) # Logged as <action>_SUCCESS / <action>_FAILURE once delivery settles
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, index=True)
+
+    def __repr__(self):
+        return f'<OutboundEmail {self.id} {self.status}>'
+
+class MailRateWindow(db.Model):
+    """Sending slots the mail senders of every worker have taken in one minute.
+
+    A slot is reserved with a conditional UPDATE on this row before a message
+    is claimed, so MAIL_RATE_PER_MINUTE holds however many workers send.
+    """
+    window_start = db.Column(db.DateTime, primary_key=True) # The minute, truncated
+    reserved = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<MailRateWindow {self.window_start} {self.reserved}>'
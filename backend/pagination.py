@@ -0,0 +1,106 @@
+from datetime import date, datetime
+from flask import current_app, jsonify, request
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from urllib.parse import urlencode
+import base64
+import json
+
+
+class CursorError(ValueError):
+    pass
+
+
+def _dump(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _load(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return value
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps([_dump(v) for v in values]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [_load(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        raise CursorError('Invalid pagination cursor')
+
+
+def _sort_key(clause):
+    if isinstance(clause, UnaryExpression) and clause.modifier is operators.desc_op:
+        return clause.element, True
+    if isinstance(clause, UnaryExpression) and clause.modifier is operators.asc_op:
+        return clause.element, False
+    return clause, False
+
+
+def _after(keys, values):
+    """The WHERE clause selecting rows that sort after `values` under `keys`."""
+    clauses = []
+    for i, ((column, descending), value) in enumerate(zip(keys, values)):
+        equal = [keys[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column < value if descending else column > value))
+    return or_(*clauses)
+
+
+def page_size():
+    limit = request.args.get('limit', type=int) or current_app.config['DEFAULT_PAGE_SIZE']
+    return max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+
+
+def paginate(query, *order_by, key=None):
+    """Returns one page of `query` and the cursor of the page after it.
+
+    `order_by` lists the sort columns (optionally with .desc()). They must be
+    non-null and end with a unique column so the order is total. The page size
+    and starting cursor come from the `limit` and `after` query parameters.
+    `key` maps a result to its sort values when they are not attributes named
+    after the sort columns. The next cursor is None on the last page. Raises
+    CursorError for a malformed `after`.
+    """
+    keys = [_sort_key(clause) for clause in order_by]
+    columns = [column for column, _ in keys]
+    after = request.args.get('after')
+    if after:
+        query = query.filter(_after(keys, decode_cursor(after, columns)))
+
+    limit = page_size()
+    items = query.order_by(*order_by).limit(limit + 1).all()
+    if len(items) <= limit:
+        return items, None
+
+    items = items[:limit]
+    key = key or (lambda item: [getattr(item, column.key) for column in columns])
+    return items, encode_cursor(key(items[-1]))
+
+
+def page_response(results, next_cursor):
+    """A JSON array response carrying the next cursor in X-Next-Cursor and Link headers.
+
+    The body stays a plain array; clients that need every row request
+    `after` the cursor until the header is absent.
+    """
+    response = jsonify(results)
+    if next_cursor:
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
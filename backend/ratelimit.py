@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from threading import Lock
+import math
+import time
+
+try:
+    import redis
+except ImportError: # Only needed when RATELIMIT_STORAGE_URL points at Redis
+    redis = None
+
+
+class MemoryWindowStore:
+    """Sliding-window counters kept in this process.
+
+    Each key holds (window start, hits in this window, hits in the previous
+    window); the oldest keys are dropped past `max_keys`, so memory stays
+    bounded however many IPs or usernames show up.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._counters = OrderedDict()
+        self._lock = Lock()
+
+    def _roll(self, key, window_start, window):
+        start, current, previous = self._counters.get(key, (window_start, 0, 0))
+        if start != window_start:
+            previous = current if start == window_start - window else 0
+            current = 0
+        return current, previous
+
+    def get(self, key, window_start, window):
+        with self._lock:
+            return self._roll(key, window_start, window)
+
+    def hit(self, key, window_start, window):
+        with self._lock:
+            current, previous = self._roll(key, window_start, window)
+            current += 1
+            self._counters.pop(key, None)
+            self._counters[key] = (window_start, current, previous)
+            while len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        return current, previous
+
+    def release(self, key, window_start, window):
+        with self._lock:
+            if key in self._counters:
+                current, previous = self._roll(key, window_start, window)
+                self._counters[key] = (window_start, max(0, current - 1), previous)
+
+    def reset(self, key, window_start, window):
+        with self._lock:
+            self._counters.pop(key, None)
+
+
+class RedisWindowStore:
+    """The same counters in Redis, shared by every worker and host."""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key, window_start, window):
+        current, previous = self.client.mget(f'ratelimit:{key}:{window_start}', f'ratelimit:{key}:{window_start - window}')
+        return int(current or 0), int(previous or 0)
+
+    def hit(self, key, window_start, window):
+        current_key = f'ratelimit:{key}:{window_start}'
+        pipe = self.client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, window * 2)
+        pipe.get(f'ratelimit:{key}:{window_start - window}')
+        current, _, previous = pipe.execute()
+        return current, int(previous or 0)
+
+    def release(self, key, window_start, window):
+        # A refund can only follow a hit in this window or the last, so at
+        # worst it lands on the previous window's key, which expires anyway
+        current_key = f'ratelimit:{key}:{window_start}'
+        pipe = self.client.pipeline()
+        pipe.decr(current_key)
+        pipe.expire(current_key, window * 2)
+        current, _ = pipe.execute()
+        if current < 0:
+            self.client.incr(current_key)
+
+    def reset(self, key, window_start, window):
+        self.client.delete(f'ratelimit:{key}:{window_start}', f'ratelimit:{key}:{window_start - window}')
+
+
+class RateLimiter:
+    """Sliding-window rate limiter.
+
+    A key's rate is estimated as the hits in the current window plus the
+    previous window's hits weighted by how much of it still overlaps the
+    last `window` seconds, which smooths out the burst a fixed window
+    allows at its boundary.
+    """
+
+    def __init__(self):
+        self.window = 60
+        self.store = MemoryWindowStore()
+
+    def init_app(self, app):
+        self.window = app.config['RATELIMIT_WINDOW']
+        url = app.config['RATELIMIT_STORAGE_URL']
+        if url:
+            if redis is None:
+                raise RuntimeError('RATELIMIT_STORAGE_URL is set but the redis package is not installed')
+            self.store = RedisWindowStore(url)
+        else:
+            self.store = MemoryWindowStore(app.config['RATELIMIT_MAX_KEYS'])
+
+    def _window(self):
+        now = time.time()
+        window_start = int(now // self.window * self.window)
+        return window_start, now - window_start
+
+    def _wait(self, current, previous, elapsed, limit):
+        if previous * (1 - elapsed / self.window) + current <= limit:
+            return None
+        return max(1, math.ceil(self.window - elapsed))
+
+    def wait(self, key, limit):
+        """Returns the seconds to wait if `key` has already used its `limit`
+        attempts per window, or None if one more is allowed. Counts nothing.
+        """
+        window_start, elapsed = self._window()
+        current, previous = self.store.get(key, window_start, self.window)
+        return self._wait(current + 1, previous, elapsed, limit)
+
+    def hit(self, key):
+        """Counts one attempt for `key`."""
+        window_start, _ = self._window()
+        self.store.hit(key, window_start, self.window)
+
+    def release(self, key):
+        """Gives back one attempt counted for `key` by hit() or acquire()."""
+        window_start, _ = self._window()
+        self.store.release(key, window_start, self.window)
+
+    def reset(self, key):
+        """Forgets the attempts counted for `key`."""
+        window_start, _ = self._window()
+        self.store.reset(key, window_start, self.window)
+
+    def check(self, limits):
+        """Returns the longest wait among the (key, limit) pairs that are at
+        their limit, or None.
+        """
+        waits = [self.wait(key, limit) for key, limit in limits]
+        waits = [wait for wait in waits if wait]
+        return max(waits) if waits else None
+
+    def acquire(self, limits):
+        """Counts one attempt against each of the (key, limit) pairs and
+        returns None if every key stayed within its limit. Otherwise the
+        attempt is given back and the longest wait is returned.
+
+        Counting first and comparing after means concurrent requests cannot
+        all pass a check before any of them is counted.
+        """
+        window_start, elapsed = self._window()
+        waits = []
+        for key, limit in limits:
+            current, previous = self.store.hit(key, window_start, self.window)
+            waits.append(self._wait(current, previous, elapsed, limit))
+        waits = [wait for wait in waits if wait]
+        if not waits:
+            return None
+        for key, _ in limits:
+            self.store.release(key, window_start, self.window)
+        return max(waits)
+
+
+limiter = RateLimiter()
+
+
+def init_app(app):
+    limiter.init_app(app)
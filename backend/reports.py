@@ -0,0 +1,440 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from xml.sax.saxutils import escape
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import zipfile
+from flask import current_app
+from . import db
+from .branding import ASSET_FIELDS, branding_cache, make_variants, write_atomically, write_bytes_atomically
+from .models import Patient, ScreeningBioData
+from .summaries import screening_export_patient_ids, summary_from_row, summary_query
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import Image, KeepTogether, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+except ImportError: # PDF reports are only offered when reportlab is installed
+    colors = None
+
+# Part of every cache key; bump it when the layout below changes so reports
+# rendered with the old layout are not served again
+LAYOUT_VERSION = 2
+
+# Lab findings table, as on the printed report: (investigation, remark field,
+# remark when empty, result when empty, [(parameter, result field, reference values, units)])
+LAB_SECTIONS = [
+    ('BLOOD SUGAR', 'fbs_rbs_remark', 'Normal', 'NA', [
+        ('FBS', 'fbs', '70-99', 'ml/dL'),
+        ('RBS', 'rbs', '<200', 'ml/dL'),
+    ]),
+    ('FBC', 'fbc_remark', 'Normal', 'NA', [
+        ('PCV', 'hct', '34-53.9', '%'),
+        ('WBC', 'wbc', '3-11', 'x109/L'),
+        ('Lymphocyte', 'lymp', '19.7-48', '%'),
+        ('Neutrophil', 'gra', '45.6-73.3', '%'),
+        ('Platelets', 'plt', '100-450', 'x109/L'),
+    ]),
+    ('KIDNEY FUNCTION', 'kft_remark', 'Normal', 'NA', [
+        ('Pottasium', 'k', '3.5-5.0', 'mmol/L'),
+        ('Sodium', 'na', '135-145', 'mmol/L'),
+        ('Chloride', 'cl', '97-107', 'mmol/L'),
+        ('Bicarbonate', 'hc03', '20-28', 'mmol/L'),
+        ('Urea', 'urea', '10-50', 'mg/dL'),
+        ('Cretinine', 'cre', 'Male: 0.7-1.4\nFemale: 0.6-1.2', 'mg/dL'),
+    ]),
+    ('LIPID PROFILE', 'lp_remark', 'Desirable', 'NA', [
+        ('Total Cholesterol', 'tcho', '150-220', 'mg/dL'),
+        ('Triglycerides', 'tg', 'Male: 60-165\nFemale: 42-88', 'mg/dL'),
+        ('HDL-C', 'hdl', 'Male: 35-80\nFemale: 42-88', 'mg/dL'),
+        ('LDL-C', 'ldl', '<130', 'mg/dL'),
+    ]),
+    ('LIVER FUNCTION', 'lft_remark', 'Normal', 'NA', [
+        ('AST', 'ast', '0-46', 'U/L'),
+        ('ALT', 'alt', '0-49', 'U/L'),
+        ('ALP', 'alp', 'Male: 80-306\nFemale: 64-306', 'U/L'),
+        ('TB', 'tb', '0-1.2', 'mg/dL'),
+        ('CB', 'cb', '0-0.4', 'mg/dL'),
+    ]),
+    ('URINE ANALYSIS', 'ua_remark', 'Normal', 'Normal', [
+        ('Sugar & Protein', 'urine_analysis', 'NA', 'NA'),
+    ]),
+    ('PSA', 'psa_remark', 'Not Applicable', 'Not Applicable', [
+        ('PSA', 'prostrate_specific_antigen', 'NA', 'NA'),
+    ]),
+]
+
+# Clinical findings on page two: (investigation, result field, result when empty)
+CLINICAL_FINDINGS = [
+    ('Relevant History and Physical Exam:', 'assessment_hx_pe', 'Normal'),
+    ('Relevant Laboratory Investigations:', 'overall_lab_remark', 'Essentially Normal'),
+    ('Electrocardiogram (ECG) Findings:', 'ecg_result', 'Not Done'),
+    ('Spirometry (Lung Function Test):', 'spirometry_result', 'Normal Lung Function'),
+    ('Audiometry (Hearing Test):', 'audiometry_result', 'Normal Hearing'),
+    ('Breast Examination (Females only):', 'breast_exam', 'Not Applicable'),
+]
+
+ACRONYMS = [
+    ['FBC', 'FULL BLOOD COUNT', 'LDL-C', 'LOW DENSITY LIPOPROTEIN CHOLESTEROL', 'TB', 'TOTAL BILIRUBIN'],
+    ['TC', 'TOTAL CHOLESTEROL', 'AST', 'APARTATE AMINOTRANSFERASE', 'CB', 'CONJUFATED BILIRUBIN'],
+    ['TG', 'TRIGLYCERIDE', 'ALT', 'ALANINE AMINOTRANSFERASE', 'NAD', 'NO ABNORMALITY DETECTED'],
+    ['HDL-C', 'HIGH DENSITY LIPOPROTEIN CHOLESTEROL', 'ALP', 'ALKALINE PHOSPHATASE', '', ''],
+]
+
+CERTIFICATION = (
+    'I hereby certify that a comprehensive medical evaluation with relevant medical '
+    'investigations were carried out on the above named staff, on the aforementioned date and time.'
+)
+
+# Table style shared by every bordered table on the report
+GRID = [
+    ('GRID', (0, 0), (-1, -1), 0.75, colors.black), ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('TOPPADDING', (0, 0), (-1, -1), 2), ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+] if colors else []
+
+
+def init_app(app):
+    app.config.setdefault('REPORT_CACHE_FOLDER', os.path.join(app.instance_path, 'report_cache'))
+
+
+def reports_available():
+    return colors is not None
+
+
+def _value(summary, field, missing):
+    value = summary.get(field)
+    if value is None or value == '':
+        return missing
+    if isinstance(value, float):
+        return f'{value:g}'
+    return str(value)
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value).strftime('%I:%M %p, %b %d, %y') if value else 'N/A'
+
+
+def _patient_name(summary):
+    if summary.get('middle_name'):
+        return f"{summary['first_name'].upper()} {summary['middle_name'][0].upper()}. {summary['last_name'].upper()}"
+    return f"{summary['first_name'].upper()} {summary['last_name'].upper()}"
+
+
+def _styles():
+    body = ParagraphStyle('body', fontName='Helvetica', fontSize=8.5, leading=10)
+    return {
+        'body': body,
+        'bold': ParagraphStyle('bold', parent=body, fontName='Helvetica-Bold'),
+        'text': ParagraphStyle('text', parent=body, fontSize=10, leading=13, spaceAfter=4),
+        'title': ParagraphStyle('title', parent=body, fontName='Helvetica-Bold', fontSize=12, leading=15,
+                                alignment=TA_CENTER, textColor=colors.HexColor('#c00000'), spaceBefore=8, spaceAfter=4),
+        'name': ParagraphStyle('name', parent=body, fontName='Helvetica-Bold', fontSize=11, leading=14, spaceBefore=6),
+        'section': ParagraphStyle('section', parent=body, fontName='Helvetica-Bold', fontSize=10, alignment=TA_CENTER),
+        'end': ParagraphStyle('end', parent=body, fontName='Helvetica-BoldOblique', fontSize=10, alignment=TA_CENTER, spaceBefore=12),
+        'signature': ParagraphStyle('signature', parent=body, fontName='Helvetica-Bold', fontSize=10, alignment=TA_RIGHT),
+        'signature_title': ParagraphStyle('signature_title', parent=body, alignment=TA_RIGHT),
+        'desirable': ParagraphStyle('desirable', parent=body, textColor=colors.green),
+    }
+
+
+def _cell(text, style):
+    return Paragraph(escape(text).replace('\n', '<br/>'), style)
+
+
+def _section_title(text, styles, width):
+    table = Table([[_cell(text, styles['section'])]], colWidths=[width])
+    table.setStyle(TableStyle(GRID + [('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#bfbfbf'))]))
+    table.spaceBefore, table.spaceAfter = 5 * mm, 2 * mm
+    return table
+
+
+def _patient_info(summary, styles, width):
+    def item(label, value):
+        return Paragraph(f'<b>{escape(label)}</b> {escape(str(value or ""))}', styles['body'])
+
+    dob = datetime.fromisoformat(summary['date_of_birth']).strftime('%d/%m/%Y')
+    rows = [
+        [item('Staff ID:', summary['staff_id']), item('Dept:', summary['department']),
+         item('PID:', summary['patient_id']), item('Registered on:', _timestamp(summary.get('date_registered')))],
+        [item('Sex:', summary['gender']), item('Age:', summary['age']),
+         item('DOB:', dob), item('Reported on:', _timestamp(summary.get('director_review_timestamp')))],
+        [item('Ref:', summary.get('patient_id_for_year')), item('Phone:', summary['contact_phone']),
+         # The PDF is cached until the results or branding change, so this is when
+         # this copy was rendered, not when it was downloaded
+         '', item('Rendered on:', datetime.utcnow().strftime('%I:%M %p, %b %d, %y'))],
+    ]
+    table = Table(rows, colWidths=[width * 0.22, width * 0.26, width * 0.18, width * 0.34])
+    table.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'TOP'), ('LEFTPADDING', (0, 0), (-1, -1), 0)]))
+    return table
+
+
+def _lab_table(summary, styles, width):
+    rows = [[_cell(heading, styles['bold']) for heading in ('Investigations', 'Parameters', 'Results', 'Ref. Values', 'Units', 'Remarks')]]
+    commands = GRID + [('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f2f2f2'))]
+    for title, remark_field, remark_missing, result_missing, parameters in LAB_SECTIONS:
+        first = len(rows)
+        remark_style = styles['desirable'] if remark_field == 'lp_remark' else styles['body']
+        for i, (parameter, field, reference, unit) in enumerate(parameters):
+            rows.append([
+                _cell(title, styles['bold']) if i == 0 else '',
+                _cell(parameter, styles['body']),
+                _cell(_value(summary, field, result_missing), styles['body']),
+                _cell(reference, styles['body']),
+                _cell(unit, styles['body']),
+                _cell(_value(summary, remark_field, remark_missing), remark_style) if i == 0 else '',
+            ])
+        commands += [('SPAN', (0, first), (0, len(rows) - 1)), ('SPAN', (5, first), (5, len(rows) - 1))]
+    table = Table(rows, colWidths=[width * f for f in (0.18, 0.18, 0.13, 0.18, 0.11, 0.22)], repeatRows=1)
+    table.setStyle(TableStyle(commands))
+    return table
+
+
+def _image(path, max_width, max_height):
+    try:
+        reader = ImageReader(path)
+    except Exception: # Unreadable or unsupported image; the report is still useful without it
+        return None
+    image_width, image_height = reader.getSize()
+    scale = min(max_width / image_width, max_height / image_height)
+    return reader, image_width * scale, image_height * scale
+
+
+def _signature(branding, images, styles, width):
+    flowables = [Spacer(1, 8 * mm)]
+    signature = images.get('report_signature') and _image(images['report_signature'], 40 * mm, 16 * mm)
+    if signature:
+        _, w, h = signature
+        image = Image(images['report_signature'], width=w, height=h)
+        image.hAlign = 'RIGHT'
+        flowables.append(image)
+    flowables.append(_cell(branding.get('doctor_name') or 'Dr. Anyanwu Ugochukwu D. FMCPath', styles['signature']))
+    flowables.append(_cell(branding.get('doctor_title') or 'Consultant in Charge', styles['signature_title']))
+    return flowables
+
+
+def render_report(summary, branding, screening_year, company_section, images):
+    """Renders the two-page annual medical report as PDF bytes.
+
+    `summary` is a patient summary (see summaries.get_patient_summary),
+    `branding` the branding fields and `images` maps branding asset fields to
+    image file paths. It touches neither the database nor the app, so it can
+    run in a worker process.
+    """
+    styles = _styles()
+    page_width, page_height = A4
+    margin = 15 * mm
+    width = page_width - 2 * margin
+
+    header = images.get('report_header') and _image(images['report_header'], width, 35 * mm)
+    footer = images.get('report_footer') and _image(images['report_footer'], page_width, 25 * mm)
+
+    def decorate(canvas, doc):
+        if header:
+            reader, w, h = header
+            canvas.drawImage(reader, margin, page_height - margin - h, w, h, mask='auto')
+        if footer:
+            reader, w, h = footer
+            canvas.drawImage(reader, (page_width - w) / 2, 0, w, h, mask='auto')
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, pagesize=A4, leftMargin=margin, rightMargin=margin,
+        topMargin=margin + (header[2] + 3 * mm if header else 0),
+        bottomMargin=max(margin, footer[2] + 5 * mm if footer else 0),
+        title=f"{screening_year} Annual Medical Report - {summary['staff_id']}",
+        author=branding.get('clinic_name') or ''
+    )
+
+    company = 'PLANT' if company_section == 'DCP' else 'TRANSPORT'
+    story = [
+        _cell(f'{screening_year} ANNUAL MEDICAL SCREENING FOR SUNU HEALTH ENROLLEES AT DANGOTE CEMENT {company}, OBAJANA, KOGI STATE.', styles['title']),
+        _cell(_patient_name(summary), styles['name']),
+        _patient_info(summary, styles, width),
+        _section_title('LAB FINDINGS/REPORT', styles, width),
+        _lab_table(summary, styles, width),
+        KeepTogether([_cell('***End of Report***', styles['end'])] + _signature(branding, images, styles, width)),
+        PageBreak(),
+        _section_title('CLINICAL AND LABORATORY FINDINGS', styles, width),
+    ]
+
+    findings = Table(
+        [[_cell(heading, styles['bold']) for heading in ('S/N', 'INVESTIGATIONS', 'RESULTS')]] +
+        [[_cell(f'{i}.', styles['body']), _cell(label, styles['body']), _cell(_value(summary, field, missing), styles['body'])]
+         for i, (label, field, missing) in enumerate(CLINICAL_FINDINGS, start=1)],
+        colWidths=[width * 0.08, width * 0.42, width * 0.5]
+    )
+    findings.setStyle(TableStyle(GRID + [('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f2f2f2'))]))
+    story.append(findings)
+
+    story.append(_section_title("PATIENT'S VITAL SIGNS", styles, width))
+    vitals = Table([[
+        Paragraph(f"<b>Blood Pressure:</b><br/>{escape(_value(summary, 'bp', ''))} mm/hg", styles['body']),
+        Paragraph(f"<b>Pulse Rate:</b><br/>{escape(_value(summary, 'pulse', ''))} b/m", styles['body']),
+        Paragraph(f"<b>SPO2:</b><br/>{escape(_value(summary, 'spo2', ''))} %", styles['body']),
+    ]], colWidths=[width / 3] * 3)
+    vitals.setStyle(TableStyle(GRID))
+    story.append(vitals)
+
+    story.append(_section_title('COMMENT/MEDICAL ADVICE:', styles, width))
+    for field in ('comment_one', 'comment_two', 'comment_three', 'comment_four'):
+        if summary.get(field):
+            story.append(_cell(summary[field], styles['text']))
+
+    story.append(_section_title('CERTIFICATION', styles, width))
+    story.append(_cell(CERTIFICATION, styles['text']))
+
+    story.append(_section_title('ACRONYMS AND INITIALISMS', styles, width))
+    acronyms = Table([[_cell(text, styles['body']) for text in row] for row in ACRONYMS],
+                     colWidths=[width * f for f in (0.09, 0.2, 0.09, 0.25, 0.08, 0.29)])
+    acronyms.setStyle(TableStyle(GRID))
+    story.append(acronyms)
+
+    story.append(KeepTogether([_cell('***End of Report***', styles['end'])] + _signature(branding, images, styles, width)))
+
+    doc.build(story, onFirstPage=decorate, onLaterPages=decorate)
+    return buffer.getvalue()
+
+
+def latest_screening(patient_id):
+    """(screening_year, company_section) of a patient's latest screening, or None."""
+    return ScreeningBioData.query.with_entities(
+        ScreeningBioData.screening_year, ScreeningBioData.company_section
+    ).filter_by(patient_comprehensive_id=patient_id).order_by(ScreeningBioData.screening_year.desc()).first()
+
+
+def branding_images(branding):
+    """Paths of the print variants (or originals) of the branding images, made if missing."""
+    folder = current_app.config['UPLOAD_FOLDER']
+    images = {}
+    for field in ASSET_FIELDS:
+        filename = branding.get(field)
+        if filename:
+            images[field] = os.path.join(folder, make_variants(filename, ['print']).get('print', filename))
+    return images
+
+
+def _cache_key(summary, screening_year, company_section, branding_version):
+    data = json.dumps([LAYOUT_VERSION, branding_version, screening_year, company_section, summary],
+                      sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _cache_path(summary, screening_year, company_section, branding_version):
+    key = _cache_key(summary, screening_year, company_section, branding_version)
+    return os.path.join(current_app.config['REPORT_CACHE_FOLDER'], str(summary['patient_id']), f'{key}.pdf')
+
+
+def _write_report(path, summary, branding, screening_year, company_section, images):
+    """Renders one report to `path`. Also the unit of work of the cohort process pool."""
+    pdf = render_report(summary, branding, screening_year, company_section, images)
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    write_bytes_atomically(path, pdf)
+    # Only the newest copy per patient is worth keeping
+    for name in os.listdir(folder):
+        if name.endswith('.pdf') and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass # Removed by another worker
+    return path
+
+
+def report_pdf(summary, screening_year, company_section):
+    """Returns the path of the patient's rendered report, rendering it only
+    when no cached copy matches their current results and the branding.
+
+    Cached reports live under REPORT_CACHE_FOLDER/<patient id>/<key>.pdf;
+    the key hashes the summary, the cohort, the branding version and
+    LAYOUT_VERSION, so a stale copy can never be served.
+    """
+    entry = branding_cache.get()
+    path = _cache_path(summary, screening_year, company_section, entry.version)
+    if os.path.exists(path):
+        return path
+    return _write_report(path, summary, entry.data, screening_year, company_section, branding_images(entry.data))
+
+
+def render_cohort_reports(screening_year, company_section, progress=None, workers=None):
+    """Renders the report of every patient in a screening cohort across a
+    process pool of REPORT_RENDER_WORKERS processes.
+
+    Reports already in the cache are not rendered again, so rerunning after
+    an interruption only renders what is missing. `progress(done, total)` is
+    called as reports complete. Returns [(summary, pdf path)] in export order.
+    """
+    patient_ids = screening_export_patient_ids(screening_year, company_section)
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    summaries = []
+    for start in range(0, len(patient_ids), batch_size):
+        batch = patient_ids[start:start + batch_size]
+        rows = {row[0]: row for row in summary_query().filter(Patient.id.in_(batch))}
+        summaries += [summary_from_row(rows[patient_id]) for patient_id in batch]
+    db.session.commit() # End the read transaction instead of holding it while the pool works
+
+    entry = branding_cache.get()
+    images = branding_images(entry.data)
+    reports = [(summary, _cache_path(summary, screening_year, company_section, entry.version)) for summary in summaries]
+    missing = [(summary, path) for summary, path in reports if not os.path.exists(path)]
+    done = len(reports) - len(missing)
+    if progress:
+        progress(done, len(reports))
+    if missing:
+        # Spawned rather than forked: the app process runs threads whose locks a fork would copy
+        with ProcessPoolExecutor(max_workers=workers or current_app.config['REPORT_RENDER_WORKERS'],
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(_write_report, path, summary, entry.data, screening_year, company_section, images)
+                       for summary, path in missing]
+            for future in as_completed(futures):
+                future.result()
+                done += 1
+                if progress:
+                    progress(done, len(reports))
+    return reports
+
+
+def _report_name(summary, screening_year):
+    return f"{summary['staff_id']}_{screening_year}_medical_report.pdf".replace('/', '_')
+
+
+def write_report_archive(path, reports, screening_year, by_department=False):
+    """Zips rendered reports into `path`. With `by_department` the archive
+    holds one zip per department instead of one folder of reports.
+    """
+    def write(partial):
+        # PDFs are already compressed; storing them keeps archiving I/O-bound
+        with zipfile.ZipFile(partial, 'w', zipfile.ZIP_STORED) as archive:
+            if not by_department:
+                for summary, pdf_path in reports:
+                    archive.write(pdf_path, _report_name(summary, screening_year))
+            else:
+                departments = {}
+                for summary, pdf_path in reports:
+                    departments.setdefault(summary['department'] or 'Unassigned', []).append((summary, pdf_path))
+                for department, items in sorted(departments.items()):
+                    with archive.open(f"{department.replace('/', '_')}.zip", 'w', force_zip64=True) as member:
+                        with zipfile.ZipFile(member, 'w', zipfile.ZIP_STORED) as bundle:
+                            for summary, pdf_path in items:
+                                bundle.write(pdf_path, _report_name(summary, screening_year))
+
+    write_atomically(path, write)
+    return path
+
+
+def invalidate_report(patient_id):
+    """Drops a patient's cached reports after their results changed."""
+    folder = os.path.join(current_app.config['REPORT_CACHE_FOLDER'], str(patient_id))
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass # Removed by another worker
@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+import gzip
+import json
+import os
+import random
+import time
+from . import db
+from .models import AuditLog, SystemConfig
+
+try:
+    import fcntl
+except ImportError: # No cross-process lock on Windows; runs are still spaced by METRICS_KEY
+    fcntl = None
+
+# SystemConfig row holding the last run's metrics, shared by every worker
+METRICS_KEY = 'audit_retention'
+
+_scheduler = None
+_scheduler_lock = Lock()
+
+
+def init_app(app):
+    app.config.setdefault('AUDIT_ARCHIVE_FOLDER', os.path.join(app.instance_path, 'audit_archive'))
+
+    @app.before_request
+    def start_audit_retention():
+        # Only starts a thread, once per process; the purge itself runs off the request path
+        if _scheduler is None and app.config['AUDIT_PURGE_INTERVAL'] > 0 and app.config['AUDIT_RETENTION_DAYS'] > 0:
+            start_scheduler(app)
+
+
+def read_metrics():
+    config = SystemConfig.query.filter_by(key=METRICS_KEY).first()
+    return json.loads(config.value) if config else {}
+
+
+def _write_metrics(metrics):
+    config = SystemConfig.query.filter_by(key=METRICS_KEY).first()
+    if not config:
+        config = SystemConfig(key=METRICS_KEY, value='')
+        db.session.add(config)
+    config.value = json.dumps(metrics, separators=(',', ':'))
+    db.session.commit()
+
+
+def _archive_path(app_config, started_at):
+    folder = app_config['AUDIT_ARCHIVE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"audit-{started_at.strftime('%Y%m%dT%H%M%S')}.ndjson.gz")
+
+
+def purge_audit_logs(app_config):
+    """Archives and deletes audit log entries older than AUDIT_RETENTION_DAYS.
+
+    Rows are handled AUDIT_PURGE_BATCH_SIZE at a time: each batch is appended
+    to a gzipped NDJSON archive and flushed to disk before it is deleted and
+    committed, so a crash can at worst archive a batch twice, never lose it.
+    Returns the metrics recorded for the run. Does nothing when
+    AUDIT_RETENTION_DAYS is 0.
+    """
+    if app_config['AUDIT_RETENTION_DAYS'] <= 0:
+        return {**read_metrics(), 'last_purged': 0, 'last_archive': None}
+    started_at = datetime.utcnow()
+    start = time.monotonic()
+    cutoff = started_at - timedelta(days=app_config['AUDIT_RETENTION_DAYS'])
+    batch_size = app_config['AUDIT_PURGE_BATCH_SIZE']
+    metrics = read_metrics()
+    purged = 0
+    archive = None
+    path = None
+    try:
+        while True:
+            batch = db.session.query(
+                AuditLog.id, AuditLog.user_id, AuditLog.action, AuditLog.timestamp, AuditLog.details
+            ).filter(AuditLog.timestamp < cutoff).order_by(AuditLog.id).limit(batch_size).all()
+            if not batch:
+                break
+
+            if archive is None:
+                path = _archive_path(app_config, started_at)
+                archive = gzip.open(path, 'at')
+            archive.write(''.join(json.dumps({
+                'id': row.id,
+                'user_id': row.user_id,
+                'action': row.action,
+                'timestamp': row.timestamp.isoformat(),
+                'details': row.details,
+            }) + '\n' for row in batch))
+            archive.flush()
+            os.fsync(archive.fileno())
+
+            AuditLog.query.filter(AuditLog.id.in_([row.id for row in batch])).delete(synchronize_session=False)
+            db.session.commit()
+            purged += len(batch)
+        error = None
+    except Exception as e:
+        db.session.rollback()
+        error = str(e)[:100]
+        raise
+    finally:
+        if archive is not None:
+            archive.close()
+        metrics.update({
+            'last_run_at': started_at.isoformat(timespec='seconds'),
+            'last_duration_ms': int((time.monotonic() - start) * 1000),
+            'last_purged': purged,
+            'total_purged': metrics.get('total_purged', 0) + purged,
+            'last_archive': os.path.basename(path) if path else None,
+            'last_error': error,
+        })
+        _write_metrics(metrics)
+    return metrics
+
+
+def _locked(app_config):
+    """Takes the instance-wide retention lock, or returns None if another process holds it."""
+    if fcntl is None:
+        return open(os.devnull)
+    os.makedirs(app_config['AUDIT_ARCHIVE_FOLDER'], exist_ok=True)
+    lock_file = open(os.path.join(app_config['AUDIT_ARCHIVE_FOLDER'], '.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def run_if_due(app_config):
+    """Purges if no worker has done so within the last AUDIT_PURGE_INTERVAL seconds."""
+    lock_file = _locked(app_config)
+    if lock_file is None:
+        return None
+    with lock_file:
+        last_run_at = read_metrics().get('last_run_at')
+        if last_run_at and datetime.utcnow() - datetime.fromisoformat(last_run_at) < timedelta(seconds=app_config['AUDIT_PURGE_INTERVAL']):
+            return None
+        return purge_audit_logs(app_config)
+
+
+class RetentionScheduler(Thread):
+    """Daemon thread that runs the audit log purge every AUDIT_PURGE_INTERVAL seconds.
+
+    Each worker process starts one, but the file lock and the shared last-run
+    time mean only one of them purges per interval.
+    """
+
+    def __init__(self, app):
+        super().__init__(name='audit-retention', daemon=True)
+        self.app = app
+        self.stopped = Event()
+
+    def run(self):
+        interval = self.app.config['AUDIT_PURGE_INTERVAL']
+        # Spread the first check out so workers started together don't race for the lock
+        delay = random.uniform(0, min(interval, 60))
+        while not self.stopped.wait(delay):
+            with self.app.app_context():
+                try:
+                    run_if_due(self.app.config)
+                except Exception:
+                    self.app.logger.exception("Audit log retention run failed")
+                finally:
+                    db.session.remove()
+            delay = interval
+
+
+def start_scheduler(app):
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RetentionScheduler(app)
+            _scheduler.start()
+    return _scheduler
@@ -1,23 +1,68 @@
-from flask import Blueprint, jsonify, request, current_app, session, send_from_directory, send_file
-from .models import User, Patient, ScreeningBioData, Consultation, FullBloodCount, KidneyFunctionTest, LipidProfile, LiverFunctionTest, ECG, Spirometry, Audiometry, Role, Permission, TemporaryAccessCode, AuditLog, SystemConfig, Conversation, Message, Branding
+from flask import Blueprint, jsonify, request, current_app, session, send_file, abort
+from .models import User, Patient, ScreeningBioData, Consultation, FullBloodCount, KidneyFunctionTest, LipidProfile, LiverFunctionTest, ECG, Spirometry, Audiometry, Role, Permission, TemporaryAccessCode, AuditLog, SystemConfig, Conversation, Message, Notification, Branding, Job, OutboundEmail
 from . import db
+from .audit import audit_writer, log_audit
+from .auth import bump_auth_version, get_user_permissions, issue_refresh_token, issue_token, load_token_user, revoke_refresh_tokens, revoke_token, rotate_refresh_token
+from .branding import ASSET_FIELDS, IMAGE_VARIANTS, asset_response, branding_cache, store_asset
+from .ingest import ingest_patient_workbook
+from .exports import BIODATA_HEADERS, biodata_query, biodata_rows, check_export_format, export_response, ndjson_response, stream_query, write_export
+from .hashing import PasswordHashingBusy, hashing_pool
+from .jobs import job_to_dict, submit_job
+from .mailer import email_to_dict, enqueue as enqueue_email, mail_sender
+from .pagination import CursorError, page_response, paginate
+from .ratelimit import limiter
+from .reports import invalidate_report, latest_screening, render_cohort_reports, report_pdf, reports_available, write_report_archive
+from .retention import read_metrics as read_retention_metrics
+from .stats import count_registration, read_counters, recount_patient
+from .search import patient_index
+from .summaries import EXPORT_COLUMN_TYPES, EXPORT_HEADERS, screening_export_patient_ids, screening_export_query, screening_export_rows, get_patient_summary as build_patient_summary
 import jwt
 import os
-from werkzeug.utils import secure_filename
-import openpyxl
-from io import BytesIO
 from datetime import datetime, timedelta, timezone, date
 from functools import wraps
-from sqlalchemy import func
+from sqlalchemy import func, case
+from sqlalchemy.orm import joinedload, selectinload
 import pyotp
 import qrcode
 import io
 import base64
-import smtplib
 from email.message import EmailMessage
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
+@bp.errorhandler(CursorError)
+def handle_cursor_error(e):
+    return jsonify({'message': str(e)}), 400
+
+@bp.errorhandler(PasswordHashingBusy)
+def handle_hashing_busy(e):
+    return jsonify({'message': 'The server is busy, please try again in a moment.'}), 429, {'Retry-After': '1'}
+
+def _rate_limit_keys(scope, account):
+    return f'{scope}:ip:{request.remote_addr}', f'{scope}:account:{str(account).lower()}'
+
+def _rate_limited(scope, account):
+    """Reserves an attempt for the client IP and the account it targets and
+    returns None, or a 429 response once either has used up its attempts.
+    Call _attempt_succeeded() when the attempt turns out to be good.
+    """
+    ip_key, account_key = _rate_limit_keys(scope, account)
+    wait = limiter.acquire([
+        (ip_key, current_app.config['LOGIN_RATE_LIMIT_PER_IP']),
+        (account_key, current_app.config['LOGIN_RATE_LIMIT_PER_ACCOUNT']),
+    ])
+    if wait is None:
+        return None
+    current_app.logger.warning(f"Rate limited {scope} attempt for {account} from {request.remote_addr}")
+    return jsonify({'message': 'Too many attempts, please try again later.'}), 429, {'Retry-After': str(wait)}
+
+def _attempt_succeeded(scope, account):
+    # Only failures count, so users who sign in successfully are never locked out:
+    # the IP gets its attempt back and the account's earlier failures are forgotten
+    ip_key, account_key = _rate_limit_keys(scope, account)
+    limiter.release(ip_key)
+    limiter.reset(account_key)
+
 @bp.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok'})
@@ -50,7 +95,6 @@ def register():
     )
     new_user.set_password(password)
     db.session.add(new_user)
-    db.session.commit()
     log_audit(new_user, 'USER_REGISTER', f"User {new_user.username} registered.")
     db.session.commit()
 
@@ -64,6 +108,10 @@ def login():
         current_app.logger.warning("Login failed: No username or password provided.")
         return jsonify({'message': 'Could not verify'}), 401
 
+    limited = _rate_limited('login', data['username'])
+    if limited:
+        return limited
+
     user = User.query.filter_by(username=data.get('username')).first()
 
     if not user:
@@ -75,14 +123,47 @@ def login():
         return jsonify({'message': 'Could not verify'}), 401
 
     current_app.logger.info(f"Login successful for user: {user.username}")
+    _attempt_succeeded('login', data['username'])
     log_audit(user, 'USER_LOGIN', f"User {user.username} logged in.")
+    refresh_token = issue_refresh_token(user.id)
     db.session.commit()
-    token = jwt.encode({
-        'user_id': user.id,
-        'exp': datetime.now(timezone.utc) + timedelta(minutes=30)
-    }, current_app.config['SECRET_KEY'], algorithm="HS256")
 
-    return jsonify({'token': token})
+    return jsonify({'token': issue_token(user), 'refresh_token': refresh_token})
+
+@bp.route('/token/refresh', methods=['POST'])
+def refresh_access_token():
+    data = request.get_json(silent=True) or {}
+    if not data.get('refresh_token'):
+        return jsonify({'message': 'Refresh token is required'}), 400
+
+    # No password check here: renewing a session costs a couple of indexed lookups, not a bcrypt hash
+    rotated = rotate_refresh_token(data['refresh_token'])
+    user = db.session.get(User, rotated[0]) if rotated else None
+    db.session.commit()
+    if not user:
+        return jsonify({'message': 'Refresh token is invalid or expired'}), 401
+
+    return jsonify({'token': issue_token(user), 'refresh_token': rotated[1]})
+
+@bp.route('/logout', methods=['POST'])
+def logout():
+    token = request.headers.get('Authorization', '').split(" ")[-1]
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    try:
+        # Logging out after the access token has expired must still end the session
+        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"], options={'verify_exp': False})
+    except jwt.InvalidTokenError:
+        data = None
+    if data is None and not refresh_token:
+        return jsonify({'message': 'Token is invalid!'}), 401
+
+    if data is not None and 'jti' in data and load_token_user(data):
+        revoke_token(data)
+    if refresh_token:
+        # Holding the refresh token is proof enough to revoke it
+        revoke_refresh_tokens(raw=refresh_token)
+    db.session.commit()
+    return jsonify({'message': 'Logged out successfully.'})
 
 def token_required(func_or_permission=None):
     if callable(func_or_permission):
@@ -104,12 +185,15 @@ def token_required(func_or_permission=None):
 
             try:
                 data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-                current_user = User.query.get(data['user_id'])
+                current_user = load_token_user(data)
             except:
                 return jsonify({'message': 'Token is invalid!'}), 401
 
+            if not current_user:
+                return jsonify({'message': 'Token is invalid!'}), 401
+
             if permission:
-                user_permissions = {p.name for role in current_user.roles for p in role.permissions}
+                user_permissions = get_user_permissions(current_user.id)
                 if permission not in user_permissions:
                     temp_permissions = session.get('temp_permissions', {})
                     if permission not in temp_permissions or datetime.fromisoformat(temp_permissions[permission]) <= datetime.utcnow():
@@ -170,62 +254,16 @@ def create_patient(current_user):
     db.session.add(new_patient)
     log_audit(current_user, 'PATIENT_REGISTER', f"Registered patient {new_patient.first_name} {new_patient.last_name} (Staff ID: {new_patient.staff_id})")
     db.session.commit()
+    patient_index.update_patient(new_patient)
 
     return jsonify({'message': 'Patient registered successfully'}), 201
 
 @bp.route('/patient-summary/<string:staff_id>', methods=['GET'])
 @token_required('view_patient_data')
 def get_patient_summary(current_user, staff_id):
-    patient = Patient.query.filter_by(staff_id=staff_id).first_or_404()
-
-    # Get the latest screening record for this patient to fetch year-specific data
-    screening_record = ScreeningBioData.query.filter_by(
-        patient_comprehensive_id=patient.id
-    ).order_by(ScreeningBioData.screening_year.desc()).first()
-
-    summary = {
-        'patient_id': patient.id,
-        'staff_id': patient.staff_id,
-        'first_name': patient.first_name,
-        'middle_name': patient.middle_name,
-        'last_name': patient.last_name,
-        'department': patient.department,
-        'gender': patient.gender,
-        'date_of_birth': patient.date_of_birth.isoformat(),
-        'age': (date.today().year - patient.date_of_birth.year),
-        'contact_phone': patient.contact_phone,
-        'email_address': patient.email_address,
-        'race': patient.race,
-        'nationality': patient.nationality,
-        'date_registered': screening_record.date_registered.isoformat() if screening_record else None,
-        'patient_id_for_year': screening_record.patient_id_for_year if screening_record else None,
-    }
-
-    def model_to_dict(model_instance, exclude=None):
-        if not model_instance:
-            return {}
-        if exclude is None:
-            exclude = []
-
-        result = {}
-        for c in model_instance.__table__.columns:
-            if c.name not in exclude:
-                value = getattr(model_instance, c.name)
-                if isinstance(value, (datetime, date)):
-                    result[c.name] = value.isoformat()
-                else:
-                    result[c.name] = value
-        return result
-
-    summary.update(model_to_dict(patient.consultation, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.full_blood_count, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.kidney_function_test, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.lipid_profile, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.liver_function_test, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.ecg, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.spirometry, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.audiometry, exclude=['id', 'patient_id']))
-
+    summary = build_patient_summary(Patient.staff_id == staff_id)
+    if summary is None:
+        abort(404)
     return jsonify(summary)
 
 @bp.route('/me/report-summary', methods=['GET'])
@@ -235,61 +273,29 @@ def get_my_report_summary(current_user):
     Fetches the comprehensive report summary for the currently logged-in user,
     if they are linked to a patient profile.
     """
-    patient = current_user.patient
-    if not patient:
+    summary = build_patient_summary(Patient.user_id == current_user.id)
+    if summary is None:
         return jsonify({'message': 'No patient profile linked to this user account.'}), 404
-
-    # This logic is duplicated from get_patient_summary.
-    # In a larger application, this could be refactored into a helper function.
-    screening_record = ScreeningBioData.query.filter_by(
-        patient_comprehensive_id=patient.id
-    ).order_by(ScreeningBioData.screening_year.desc()).first()
-
-    summary = {
-        'patient_id': patient.id,
-        'staff_id': patient.staff_id,
-        'first_name': patient.first_name,
-        'middle_name': patient.middle_name,
-        'last_name': patient.last_name,
-        'department': patient.department,
-        'gender': patient.gender,
-        'date_of_birth': patient.date_of_birth.isoformat(),
-        'age': (date.today().year - patient.date_of_birth.year),
-        'contact_phone': patient.contact_phone,
-        'email_address': patient.email_address,
-        'race': patient.race,
-        'nationality': patient.nationality,
-        'date_registered': screening_record.date_registered.isoformat() if screening_record else None,
-        'patient_id_for_year': screening_record.patient_id_for_year if screening_record else None,
-    }
-
-    def model_to_dict(model_instance, exclude=None):
-        if not model_instance:
-            return {}
-        if exclude is None:
-            exclude = []
-
-        result = {}
-        for c in model_instance.__table__.columns:
-            if c.name not in exclude:
-                value = getattr(model_instance, c.name)
-                if isinstance(value, (datetime, date)):
-                    result[c.name] = value.isoformat()
-                else:
-                    result[c.name] = value
-        return result
-
-    summary.update(model_to_dict(patient.consultation, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.full_blood_count, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.kidney_function_test, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.lipid_profile, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.liver_function_test, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.ecg, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.spirometry, exclude=['id', 'patient_id']))
-    summary.update(model_to_dict(patient.audiometry, exclude=['id', 'patient_id']))
-
     return jsonify(summary)
 
+@bp.route('/patient-report/<string:staff_id>/pdf', methods=['GET'])
+@token_required('view_patient_data')
+def download_patient_report(current_user, staff_id):
+    if not reports_available():
+        return jsonify({'message': 'PDF reports are not available on this server.'}), 501
+    summary = build_patient_summary(Patient.staff_id == staff_id)
+    if summary is None:
+        abort(404)
+    screening = latest_screening(summary['patient_id'])
+    if screening is None:
+        return jsonify({'message': 'No screening record found for this patient.'}), 404
+    return send_file(
+        report_pdf(summary, *screening),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f"{staff_id}_{screening.screening_year}_medical_report.pdf"
+    )
+
 @bp.route('/save-director-review/<string:staff_id>', methods=['POST'])
 @token_required('perform_director_review')
 def save_director_review(current_user, staff_id):
@@ -331,6 +337,7 @@ def save_director_review(current_user, staff_id):
 
     log_audit(current_user, 'DIRECTOR_REVIEW_SAVE', f"Saved director review for patient {patient.first_name} {patient.last_name} (Staff ID: {patient.staff_id})")
     db.session.commit()
+    invalidate_report(patient.id)
 
     return jsonify({'message': 'Director review saved successfully.'}), 200
 
@@ -360,7 +367,7 @@ def get_all_patients(current_user):
         return jsonify(patient_data)
 
     else:
-        patients = Patient.query.order_by(Patient.first_name, Patient.last_name).all()
+        patients, next_cursor = paginate(Patient.query, Patient.first_name, Patient.last_name, Patient.id)
         results = [{
             'staff_id': p.staff_id,
             'first_name': p.first_name,
@@ -369,15 +376,17 @@ def get_all_patients(current_user):
             'gender': p.gender,
             'contact_phone': p.contact_phone,
         } for p in patients]
-        return jsonify(results)
+        return page_response(results, next_cursor)
 
 @bp.route('/patient/<string:staff_id>', methods=['DELETE'])
 @token_required('delete_patient')
 def delete_patient(current_user, staff_id):
     patient = Patient.query.filter_by(staff_id=staff_id).first_or_404()
     log_audit(current_user, 'PATIENT_DELETE', f"Deleted patient {patient.first_name} {patient.last_name} (Staff ID: {staff_id})")
+    patient_id = patient.id
     db.session.delete(patient)
     db.session.commit()
+    patient_index.remove_patient(patient_id)
     return jsonify({'message': 'Patient deleted successfully.'}), 200
 
 @bp.route('/patient/<string:staff_id>', methods=['PUT'])
@@ -394,15 +403,18 @@ def update_patient(current_user, staff_id):
         'race', 'nationality'
     ]
 
+    old_gender, old_date_of_birth = patient.gender, patient.date_of_birth
     for field in updatable_fields:
         if field in data:
             if field == 'date_of_birth':
                 setattr(patient, field, datetime.strptime(data[field], '%Y-%m-%d').date())
             else:
                 setattr(patient, field, data[field])
+    recount_patient(patient, old_gender, old_date_of_birth)
 
     log_audit(current_user, 'PATIENT_UPDATE', f"Updated patient {patient.first_name} {patient.last_name} (Staff ID: {staff_id})")
     db.session.commit()
+    patient_index.update_patient(patient)
     return jsonify({'message': 'Patient updated successfully.'}), 200
 
 @bp.route('/patients/claim-account', methods=['POST'])
@@ -415,10 +427,15 @@ def claim_account():
     if not all([staff_id, email, password]):
         return jsonify({'message': 'Staff ID, email, and password are required.'}), 400
 
+    limited = _rate_limited('claim', staff_id)
+    if limited:
+        return limited
+
     patient = Patient.query.filter_by(staff_id=staff_id, email_address=email).first()
 
     if not patient:
         return jsonify({'message': 'Invalid Staff ID or email address.'}), 404
+    _attempt_succeeded('claim', staff_id)
 
     if patient.user_id:
         return jsonify({'message': 'This patient account has already been claimed.'}), 409
@@ -456,7 +473,7 @@ def get_screening_records(current_user):
     if not screening_year or not company_section:
         return jsonify({'message': 'screening_year and company_section parameters are required'}), 400
 
-    records = db.session.query(
+    query = db.session.query(
         ScreeningBioData.id.label('record_id'),
         ScreeningBioData.patient_id_for_year.label('patient_id'),
         Patient.staff_id,
@@ -470,9 +487,13 @@ def get_screening_records(current_user):
     ).filter(
         ScreeningBioData.screening_year == screening_year,
         ScreeningBioData.company_section == company_section
-    ).order_by(Patient.first_name, Patient.last_name).all()
+    )
+    records, next_cursor = paginate(
+        query, Patient.first_name, Patient.last_name, ScreeningBioData.id,
+        key=lambda r: [r.first_name, r.last_name, r.record_id]
+    )
 
-    return jsonify([{
+    return page_response([{
         'record_id': r.record_id,
         'patient_id': r.patient_id,
         'staff_id': r.staff_id,
@@ -481,15 +502,17 @@ def get_screening_records(current_user):
         'department': r.department,
         'gender': r.gender,
         'contact_phone': r.contact_phone,
-    } for r in records])
+    } for r in records], next_cursor)
 
 @bp.route('/screening/record/<int:record_id>', methods=['DELETE'])
 @token_required('delete_screening_record')
 def delete_screening_record(current_user, record_id):
     record = ScreeningBioData.query.get_or_404(record_id)
     log_audit(current_user, 'SCREENING_RECORD_DELETE', f"Deleted screening record for patient {record.patient_comprehensive.first_name} {record.patient_comprehensive.last_name} (Record ID: {record_id})")
+    count_registration(record, record.patient_comprehensive, sign=-1)
     db.session.delete(record)
     db.session.commit()
+    patient_index.remove_registration(record)
     return jsonify({'message': 'Screening record deleted successfully.'}), 200
 
 @bp.route('/consultations', methods=['POST'])
@@ -514,6 +537,7 @@ def create_or_update_consultation(current_user):
 
     log_audit(current_user, 'CONSULTATION_SAVE', f"Saved consultation for patient {patient.first_name} {patient.last_name} (Staff ID: {data['staff_id']})")
     db.session.commit()
+    invalidate_report(patient.id)
     return jsonify({'message': 'Consultation saved successfully'}), 200
 
 @bp.route('/consultations/<string:staff_id>', methods=['GET'])
@@ -526,7 +550,7 @@ def get_consultation(current_user, staff_id):
     consultation_data = {key: getattr(consultation, key) for key in consultation.__table__.columns.keys()}
     return jsonify(consultation_data)
 
-def create_or_update_test_result(model, staff_id):
+def create_or_update_test_result(current_user, model, staff_id):
     data = request.get_json()
     if not data:
         return jsonify({'message': 'No input data provided'}), 400
@@ -546,6 +570,7 @@ def create_or_update_test_result(model, staff_id):
 
     log_audit(current_user, 'TEST_RESULT_SAVE', f"Saved {model.__name__} for patient {patient.first_name} {patient.last_name} (Staff ID: {staff_id})")
     db.session.commit()
+    invalidate_report(patient.id)
     return jsonify({'message': 'Test result saved successfully'}), 200
 
 def get_test_result(model, staff_id):
@@ -559,7 +584,7 @@ def get_test_result(model, staff_id):
 @bp.route('/test-results/full-blood-count/<string:staff_id>', methods=['POST'])
 @token_required('enter_test_results')
 def save_fbc(current_user, staff_id):
-    return create_or_update_test_result(FullBloodCount, staff_id)
+    return create_or_update_test_result(current_user, FullBloodCount, staff_id)
 
 @bp.route('/test-results/full-blood-count/<string:staff_id>', methods=['GET'])
 @token_required('view_patient_data')
@@ -569,7 +594,7 @@ def get_fbc(current_user, staff_id):
 @bp.route('/test-results/kidney-function-test/<string:staff_id>', methods=['POST'])
 @token_required('enter_test_results')
 def save_kft(current_user, staff_id):
-    return create_or_update_test_result(KidneyFunctionTest, staff_id)
+    return create_or_update_test_result(current_user, KidneyFunctionTest, staff_id)
 
 @bp.route('/test-results/kidney-function-test/<string:staff_id>', methods=['GET'])
 @token_required('view_patient_data')
@@ -579,7 +604,7 @@ def get_kft(current_user, staff_id):
 @bp.route('/test-results/lipid-profile/<string:staff_id>', methods=['POST'])
 @token_required('enter_test_results')
 def save_lp(current_user, staff_id):
-    return create_or_update_test_result(LipidProfile, staff_id)
+    return create_or_update_test_result(current_user, LipidProfile, staff_id)
 
 @bp.route('/test-results/lipid-profile/<string:staff_id>', methods=['GET'])
 @token_required('view_patient_data')
@@ -589,7 +614,7 @@ def get_lp(current_user, staff_id):
 @bp.route('/test-results/liver-function-test/<string:staff_id>', methods=['POST'])
 @token_required('enter_test_results')
 def save_lft(current_user, staff_id):
-    return create_or_update_test_result(LiverFunctionTest, staff_id)
+    return create_or_update_test_result(current_user, LiverFunctionTest, staff_id)
 
 @bp.route('/test-results/liver-function-test/<string:staff_id>', methods=['GET'])
 @token_required('view_patient_data')
@@ -599,7 +624,7 @@ def get_lft(current_user, staff_id):
 @bp.route('/test-results/ecg/<string:staff_id>', methods=['POST'])
 @token_required('enter_test_results')
 def save_ecg(current_user, staff_id):
-    return create_or_update_test_result(ECG, staff_id)
+    return create_or_update_test_result(current_user, ECG, staff_id)
 
 @bp.route('/test-results/ecg/<string:staff_id>', methods=['GET'])
 @token_required('view_patient_data')
@@ -609,7 +634,7 @@ def get_ecg(current_user, staff_id):
 @bp.route('/test-results/spirometry/<string:staff_id>', methods=['POST'])
 @token_required('enter_test_results')
 def save_spirometry(current_user, staff_id):
-    return create_or_update_test_result(Spirometry, staff_id)
+    return create_or_update_test_result(current_user, Spirometry, staff_id)
 
 @bp.route('/test-results/spirometry/<string:staff_id>', methods=['GET'])
 @token_required('view_patient_data')
@@ -619,7 +644,7 @@ def get_spirometry(current_user, staff_id):
 @bp.route('/test-results/audiometry/<string:staff_id>', methods=['POST'])
 @token_required('enter_test_results')
 def save_audiometry(current_user, staff_id):
-    return create_or_update_test_result(Audiometry, staff_id)
+    return create_or_update_test_result(current_user, Audiometry, staff_id)
 
 @bp.route('/test-results/audiometry/<string:staff_id>', methods=['GET'])
 @token_required('view_patient_data')
@@ -649,6 +674,7 @@ def register_for_screening(current_user):
 
     if patient:
         # Update existing patient's comprehensive data
+        old_gender, old_date_of_birth = patient.gender, patient.date_of_birth
         patient.first_name = data['first_name']
         patient.middle_name = data.get('middle_name')
         patient.last_name = data['last_name']
@@ -659,6 +685,7 @@ def register_for_screening(current_user):
         patient.email_address = data['email_address']
         patient.race = data['race']
         patient.nationality = data['nationality']
+        recount_patient(patient, old_gender, old_date_of_birth)
     else:
         # Create a new patient
         patient = Patient(
@@ -680,6 +707,7 @@ def register_for_screening(current_user):
 
     # We need to commit here to get the patient.id if it's a new patient
     db.session.commit()
+    patient_index.update_patient(patient)
 
     # --- 3. Check for Duplicate Screening Registration ---
     existing_screening = ScreeningBioData.query.filter_by(
@@ -706,11 +734,14 @@ def register_for_screening(current_user):
         patient_comprehensive_id=patient.id,
         patient_id_for_year=data['patient_id_for_year'],
         screening_year=data['screening_year'],
-        company_section=data['company_section']
+        company_section=data['company_section'],
+        date_registered=datetime.utcnow()
     )
     db.session.add(new_screening_record)
+    count_registration(new_screening_record, patient)
     log_audit(current_user, 'SCREENING_REGISTER', f"Registered patient {patient.first_name} {patient.last_name} for {data['screening_year']} screening.")
     db.session.commit()
+    patient_index.add_registration(new_screening_record)
 
     return jsonify({'message': 'Patient registered for screening successfully.'}), 201
 
@@ -724,43 +755,45 @@ def screening_stats(current_user):
     if not screening_year or not company_section:
         return jsonify({'message': 'screening_year and company_section parameters are required'}), 400
 
-    # --- 2. Base Query for the given context ---
-    base_query = ScreeningBioData.query.filter_by(
-        screening_year=screening_year,
-        company_section=company_section
-    )
+    group_by = request.args.get('group_by')
+    if group_by not in (None, 'department'):
+        return jsonify({'message': "group_by must be 'department'"}), 400
 
-    # --- 3. Calculate Statistics ---
-    total_registered = base_query.count()
+    # --- 2. Overall totals come straight from the maintained counters ---
+    if group_by is None:
+        return jsonify(read_counters(screening_year, company_section))
 
+    # --- 3. Department breakdowns: every counter as a conditional sum over one scan ---
+    # Age in the screening year, the same rule the counters use (stats._contribution),
+    # so the department breakdown adds up to the overall totals
+    from sqlalchemy.sql import extract
+    age_calc = ScreeningBioData.screening_year - extract('year', Patient.date_of_birth)
     today_start = datetime.utcnow().date()
-    registered_today = base_query.filter(func.date(ScreeningBioData.date_registered) == today_start).count()
 
-    # Join with Patient table for gender and age
-    query_with_join = base_query.join(Patient, ScreeningBioData.patient_comprehensive_id == Patient.id)
+    def count_if(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
 
-    male_count = query_with_join.filter(Patient.gender == 'Male').count()
-    female_count = query_with_join.filter(Patient.gender == 'Female').count()
-
-    # Age calculation (database-agnostic)
-    # This method calculates the difference in years. It's simple, portable,
-    # and sufficient for this statistical purpose.
-    from sqlalchemy.sql import extract
-    age_calc = extract('year', func.current_date()) - extract('year', Patient.date_of_birth)
+    counters = [
+        func.count(ScreeningBioData.id).label('total_registered'),
+        count_if(func.date(ScreeningBioData.date_registered) == today_start).label('registered_today'),
+        count_if(Patient.gender == 'Male').label('male_count'),
+        count_if(Patient.gender == 'Female').label('female_count'),
+        count_if(age_calc >= 40).label('over_40_count'),
+        count_if(age_calc < 40).label('under_40_count'),
+    ]
+    stat_names = [c.name for c in counters]
 
-    over_40_count = query_with_join.filter(age_calc >= 40).count()
-    under_40_count = query_with_join.filter(age_calc < 40).count()
+    rows = db.session.query(*counters, Patient.department).join(
+        Patient, ScreeningBioData.patient_comprehensive_id == Patient.id
+    ).filter(
+        ScreeningBioData.screening_year == screening_year,
+        ScreeningBioData.company_section == company_section
+    ).group_by(Patient.department).order_by(Patient.department).all()
 
     # --- 4. Format and Return Response ---
-    stats = {
-        'total_registered': total_registered,
-        'registered_today': registered_today,
-        'male_count': male_count,
-        'female_count': female_count,
-        'over_40_count': over_40_count,
-        'under_40_count': under_40_count
-    }
-
+    breakdown = [dict(zip(stat_names + ['department'], row)) for row in rows]
+    stats = {name: sum(item[name] for item in breakdown) for name in stat_names}
+    stats['by_department'] = breakdown
     return jsonify(stats)
 
 @bp.route('/screening/search', methods=['GET'])
@@ -775,21 +808,22 @@ def search_screened_patients(current_user):
         return jsonify({'message': 'screening_year and company_section parameters are required'}), 400
 
     # --- 2. Build the Query ---
-    query = db.session.query(
-        Patient
-    ).join(
-        ScreeningBioData, Patient.id == ScreeningBioData.patient_comprehensive_id
-    ).filter(
-        ScreeningBioData.screening_year == screening_year,
-        ScreeningBioData.company_section == company_section
-    )
-
     if search_term:
-        query = query.filter(Patient.staff_id.ilike(f'%{search_term}%'))
-
-    # --- 3. Execute Query and Format Results ---
-    patients = query.limit(10).all() # Limit results for performance
-
+        # Rank matches in the search index, restricted to this cohort
+        ranked_ids = patient_index.search(search_term, limit=10, cohort=(screening_year, company_section))
+        rank = {patient_id: i for i, patient_id in enumerate(ranked_ids)}
+        patients = sorted(Patient.query.filter(Patient.id.in_(ranked_ids)).all(), key=lambda p: rank[p.id]) if ranked_ids else []
+    else:
+        patients = db.session.query(
+            Patient
+        ).join(
+            ScreeningBioData, Patient.id == ScreeningBioData.patient_comprehensive_id
+        ).filter(
+            ScreeningBioData.screening_year == screening_year,
+            ScreeningBioData.company_section == company_section
+        ).limit(10).all() # Limit results for performance
+
+    # --- 3. Format Results ---
     results = [{
         'id': p.id,
         'staff_id': p.staff_id,
@@ -820,8 +854,8 @@ def get_patient_by_staff_id(current_user, staff_id):
 @bp.route('/users', methods=['GET'])
 @token_required('manage_users')
 def get_users(current_user):
-    users = User.query.all()
-    return jsonify([{'id': u.id, 'username': u.username, 'email': u.email, 'roles': [r.name for r in u.roles]} for u in users])
+    users, next_cursor = paginate(User.query.options(selectinload(User.roles)), User.id)
+    return page_response([{'id': u.id, 'username': u.username, 'email': u.email, 'roles': [r.name for r in u.roles]} for u in users], next_cursor)
 
 @bp.route('/roles', methods=['GET'])
 @token_required('manage_roles')
@@ -840,6 +874,7 @@ def assign_role(current_user, user_id):
     role = Role.query.get_or_404(data['role_id'])
 
     user.roles.append(role)
+    bump_auth_version([user.id])
     log_audit(current_user, 'ROLE_ASSIGN', f"Assigned role '{role.name}' to user '{user.username}'")
     db.session.commit()
 
@@ -891,6 +926,7 @@ def update_role(current_user, role_id):
             if permission:
                 role.permissions.append(permission)
 
+    bump_auth_version(role_id=role.id)
     log_audit(current_user, 'ROLE_UPDATE', f"Updated role '{role.name}'")
     db.session.commit()
     return jsonify({'message': 'Role updated successfully.'})
@@ -904,25 +940,21 @@ def delete_role(current_user, role_id):
     if role.name == 'Admin':
         return jsonify({'message': 'The Admin role cannot be deleted.'}), 403
 
+    bump_auth_version(role_id=role.id)
     log_audit(current_user, 'ROLE_DELETE', f"Deleted role '{role.name}'")
     db.session.delete(role)
     db.session.commit()
     return jsonify({'message': 'Role deleted successfully.'})
 
-# Audit Log Helper
-def log_audit(user, action, details=""):
-    """Helper function to create an audit log entry."""
-    log_entry = AuditLog(user_id=user.id, action=action, details=details)
-    db.session.add(log_entry)
-
 # Temporary Access Code Routes
 import uuid
 
 @bp.route('/temp-codes', methods=['GET'])
 @token_required('manage_roles')
 def get_temp_codes(current_user):
-    codes = TemporaryAccessCode.query.order_by(TemporaryAccessCode.id.desc()).all()
-    return jsonify([{
+    query = TemporaryAccessCode.query.options(joinedload(TemporaryAccessCode.permission), joinedload(TemporaryAccessCode.user))
+    codes, next_cursor = paginate(query, TemporaryAccessCode.id.desc())
+    return page_response([{
         'id': c.id,
         'code': c.code,
         'permission': c.permission.name,
@@ -931,7 +963,7 @@ def get_temp_codes(current_user):
         'use_type': c.use_type,
         'times_used': c.times_used,
         'is_active': c.is_active,
-    } for c in codes])
+    } for c in codes], next_cursor)
 
 @bp.route('/temp-codes', methods=['POST'])
 @token_required('manage_roles')
@@ -1028,17 +1060,82 @@ def request_access(current_user):
 
     return jsonify({'message': 'Your request for access has been logged for an administrator to review.'}), 200
 
-@bp.route('/audit-logs', methods=['GET'])
-@token_required('view_audit_log')
-def get_audit_logs(current_user):
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).all()
-    return jsonify([{
+def _parse_timestamp(value):
+    """Parses an ISO 8601 date or datetime into the naive UTC datetimes audit logs store."""
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def _audit_log_query():
+    """Builds the audit log query from the request's filter parameters:
+    user_id, username, action (repeatable), since, until and q (a substring
+    of the details). Raises ValueError for an unparseable time.
+    """
+    query = db.session.query(
+        AuditLog.id, User.username, AuditLog.action, AuditLog.timestamp, AuditLog.details
+    ).join(User, AuditLog.user_id == User.id)
+
+    user_id = request.args.get('user_id', type=int)
+    if user_id:
+        query = query.filter(AuditLog.user_id == user_id)
+    if request.args.get('username'):
+        query = query.filter(User.username == request.args['username'])
+    actions = request.args.getlist('action')
+    if actions:
+        query = query.filter(AuditLog.action.in_(actions))
+    if request.args.get('since'):
+        query = query.filter(AuditLog.timestamp >= _parse_timestamp(request.args['since']))
+    if request.args.get('until'):
+        query = query.filter(AuditLog.timestamp < _parse_timestamp(request.args['until']))
+    if request.args.get('q'):
+        query = query.filter(AuditLog.details.ilike(f"%{request.args['q']}%"))
+    return query
+
+def _audit_log_to_dict(log):
+    return {
         'id': log.id,
-        'username': log.user.username,
+        'username': log.username,
         'action': log.action,
         'timestamp': log.timestamp.isoformat(),
         'details': log.details,
-    } for log in logs])
+    }
+
+@bp.route('/audit-logs', methods=['GET'])
+@token_required('view_audit_log')
+def get_audit_logs(current_user):
+    try:
+        query = _audit_log_query()
+    except ValueError:
+        return jsonify({'message': 'since and until must be ISO 8601 dates or datetimes'}), 400
+
+    if request.args.get('format') == 'ndjson':
+        # Compliance export: every matching entry, oldest first, streamed as it is read
+        log_audit(current_user, 'AUDIT_LOG_EXPORT', f"Exported audit logs ({request.query_string.decode()}).")
+        db.session.commit()
+        logs = stream_query(query.order_by(AuditLog.timestamp, AuditLog.id))
+        return ndjson_response((_audit_log_to_dict(log) for log in logs), 'audit_logs.ndjson')
+
+    logs, next_cursor = paginate(query, AuditLog.timestamp.desc(), AuditLog.id.desc())
+    return page_response([_audit_log_to_dict(log) for log in logs], next_cursor)
+
+@bp.route('/system/metrics', methods=['GET'])
+@token_required('view_audit_log')
+def get_system_metrics(current_user):
+    return jsonify({
+        'password_hashing': hashing_pool.stats(),
+        'audit_queue_depth': audit_writer.queue.qsize() if audit_writer.queue else 0,
+    })
+
+@bp.route('/audit-logs/retention', methods=['GET'])
+@token_required('view_audit_log')
+def get_audit_retention_metrics(current_user):
+    retention_days = current_app.config['AUDIT_RETENTION_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    metrics = read_retention_metrics()
+    metrics['retention_days'] = retention_days
+    metrics['pending'] = db.session.query(func.count(AuditLog.id)).filter(AuditLog.timestamp < cutoff).scalar()
+    return jsonify(metrics)
 
 
 @bp.route('/user/<int:user_id>', methods=['GET'])
@@ -1070,7 +1167,11 @@ def update_user_details(current_user, user_id):
         if not User.is_password_strong(data['new_password']):
             return jsonify({'message': 'New password is not strong enough.'}), 400
         user.set_password(data['new_password'])
+        bump_auth_version([user.id], revoke_tokens=True) # Sign the user out everywhere
+        revoke_refresh_tokens(user_id=user.id)
         log_audit(current_user, 'ADMIN_PASSWORD_CHANGE', f"Admin changed password for user '{user.username}'")
+    else:
+        bump_auth_version([user.id])
 
     log_audit(current_user, 'ADMIN_USER_UPDATE', f"Admin updated details for user '{user.username}'")
     db.session.commit()
@@ -1096,16 +1197,14 @@ def email_patient_report(current_user):
         return jsonify({'message': 'Email service is not configured.'}), 500
 
     sender_email = sender_email_config.value
-    app_password = app_password_config.value
 
     # Get patient and screening details for the email body
-    screening_record = ScreeningBioData.query.filter_by(patient_comprehensive_id=patient.id).order_by(ScreeningBioData.screening_year.desc()).first()
+    screening = latest_screening(patient.id)
 
-    if not screening_record:
+    if not screening:
         return jsonify({'message': 'No screening record found for this patient.'}), 404
 
-    report_year = screening_record.screening_year
-    organisation = screening_record.company_section
+    report_year, organisation = screening
 
     # Create the email
     msg = EmailMessage()
@@ -1134,22 +1233,23 @@ def email_patient_report(current_user):
     """
     msg.set_content(email_body, subtype='html')
 
-    # TODO: Add PDF attachment logic here in a future step.
-    # For now, just sending the text email.
+    if reports_available():
+        with open(report_pdf(build_patient_summary(Patient.id == patient.id), report_year, organisation), 'rb') as f:
+            msg.add_attachment(f.read(), maintype='application', subtype='pdf',
+                               filename=f"{patient.staff_id}_{report_year}_medical_report.pdf")
+    else:
+        current_app.logger.warning("reportlab is not installed; emailing the report without its PDF")
 
-    try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(sender_email, app_password)
-            smtp.send_message(msg)
+    email = enqueue_email(msg, current_user, audit_action='EMAIL_REPORT')
+    log_audit(current_user, 'EMAIL_REPORT_QUEUED', f"Report queued for {patient.email_address} for staff ID {staff_id}")
+    db.session.commit()
+    mail_sender.wake()
+    return jsonify({"message": "Report queued for delivery", "delivery_id": email.id}), 202
 
-        log_audit(current_user, 'EMAIL_REPORT_SUCCESS', f"Report successfully emailed to {patient.email_address} for staff ID {staff_id}")
-        db.session.commit()
-        return jsonify({"message": "Report sent successfully"}), 200
-    except Exception as e:
-        current_app.logger.error(f"Email failed to send: {e}")
-        log_audit(current_user, 'EMAIL_REPORT_FAILURE', f"Failed to email report to {patient.email_address} for staff ID {staff_id}: {e}")
-        db.session.commit()
-        return jsonify({"message": "Failed to send email"}), 500
+@bp.route('/emails/<int:email_id>', methods=['GET'])
+@token_required('email_report')
+def get_email_delivery(current_user, email_id):
+    return jsonify(email_to_dict(OutboundEmail.query.get_or_404(email_id)))
 
 
 # System Config Routes
@@ -1212,17 +1312,19 @@ def get_conversations(current_user):
 @token_required()
 def get_messages(current_user, conversation_id):
     conversation = Conversation.query.get_or_404(conversation_id)
-    if current_user not in conversation.participants:
+    if current_user.id not in [p.id for p in conversation.participants]:
         return jsonify({'message': 'Not a participant of this conversation'}), 403
 
-    messages = conversation.messages.order_by(Message.timestamp.asc()).all()
-    return jsonify([{
+    # Newest first, so the first page is the latest messages and the cursor
+    # leads back through the history
+    messages, next_cursor = paginate(conversation.messages.options(joinedload(Message.sender)), Message.timestamp.desc(), Message.id.desc())
+    return page_response([{
         'id': m.id,
         'sender_id': m.sender_id,
         'sender_username': m.sender.username,
         'content': m.content,
         'timestamp': m.timestamp.isoformat()
-    } for m in messages])
+    } for m in messages], next_cursor)
 
 @socketio.on('join')
 def on_join(data):
@@ -1248,13 +1350,13 @@ def handle_send_message(data):
         return
 
     try:
-        token_data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS266"])
-        current_user = User.query.get(token_data['user_id'])
+        token_data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+        current_user = load_token_user(token_data)
     except:
         return
 
     conversation = Conversation.query.get(conversation_id)
-    if not conversation or current_user not in conversation.participants:
+    if not current_user or not conversation or current_user.id not in [p.id for p in conversation.participants]:
         return
 
     new_message = Message(
@@ -1278,14 +1380,14 @@ def handle_send_message(data):
 @bp.route('/notifications', methods=['GET'])
 @token_required()
 def get_notifications(current_user):
-    notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.timestamp.desc()).all()
-    return jsonify([{
+    notifications, next_cursor = paginate(Notification.query.filter_by(user_id=current_user.id), Notification.timestamp.desc(), Notification.id.desc())
+    return page_response([{
         'id': n.id,
         'content': n.content,
         'url': n.url,
         'is_read': n.is_read,
         'timestamp': n.timestamp.isoformat()
-    } for n in notifications])
+    } for n in notifications], next_cursor)
 
 @bp.route('/notifications/<int:notification_id>/read', methods=['POST'])
 @token_required()
@@ -1307,13 +1409,15 @@ def get_queue_stats(current_user):
     if not screening_year or not company_section:
         return jsonify({'message': 'screening_year and company_section are required'}), 400
 
-    today = datetime.utcnow().date()
+    # A range on registered_at (rather than date(registered_at)) can use the cohort index
+    today_start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
     base_query = db.session.query(Patient.id).join(
         ScreeningBioData, Patient.id == ScreeningBioData.patient_comprehensive_id
     ).filter(
         ScreeningBioData.screening_year == screening_year,
         ScreeningBioData.company_section == company_section,
-        func.date(ScreeningBioData.registered_at) == today
+        ScreeningBioData.registered_at >= today_start,
+        ScreeningBioData.registered_at < today_start + timedelta(days=1)
     )
 
     consultation_queue = base_query.outerjoin(Consultation).filter(Consultation.id == None).count()
@@ -1335,7 +1439,7 @@ def get_queue_stats(current_user):
 @token_required()
 def get_unread_message_count(current_user):
     count = db.session.query(func.count(Message.id)).join(Conversation).filter(
-        Conversation.participants.contains(current_user),
+        Conversation.participants.any(User.id == current_user.id),
         Message.read == False,
         Message.sender_id != current_user.id
     ).scalar()
@@ -1354,8 +1458,8 @@ def update_profile(current_user):
     current_user.last_name = data.get('last_name', current_user.last_name)
     current_user.username = data.get('username', current_user.username)
     current_user.email = data.get('email', current_user.email)
+    bump_auth_version([current_user.id])
 
-    db.session.commit()
     log_audit(current_user, 'PROFILE_UPDATE', 'User updated their own profile.')
     db.session.commit()
     return jsonify({'message': 'Profile updated successfully.'})
@@ -1372,10 +1476,12 @@ def change_password(current_user):
         return jsonify({'message': 'New password is not strong enough.'}), 400
 
     current_user.set_password(new_password)
-    db.session.commit()
+    bump_auth_version([current_user.id], revoke_tokens=True) # Sign out every other session
+    revoke_refresh_tokens(user_id=current_user.id)
+    refresh_token = issue_refresh_token(current_user.id)
     log_audit(current_user, 'PASSWORD_CHANGE', 'User changed their own password.')
     db.session.commit()
-    return jsonify({'message': 'Password updated successfully.'})
+    return jsonify({'message': 'Password updated successfully.', 'token': issue_token(current_user), 'refresh_token': refresh_token})
 
 # 2FA Routes
 @bp.route('/2fa/status', methods=['GET'])
@@ -1416,7 +1522,6 @@ def verify_2fa(current_user):
         return jsonify({'message': 'Invalid OTP'}), 400
 
     current_user.otp_enabled = True
-    db.session.commit()
     log_audit(current_user, '2FA_ENABLED', 'User enabled 2FA.')
     db.session.commit()
     return jsonify({'message': '2FA enabled successfully.'})
@@ -1425,7 +1530,6 @@ def verify_2fa(current_user):
 @token_required()
 def disable_2fa(current_user):
     current_user.otp_enabled = False
-    db.session.commit()
     log_audit(current_user, '2FA_DISABLED', 'User disabled 2FA.')
     db.session.commit()
     return jsonify({'message': '2FA disabled successfully.'})
@@ -1434,133 +1538,51 @@ def disable_2fa(current_user):
 @bp.route('/patients/download', methods=['GET'])
 @token_required('download_patient_biodata')
 def download_all_patients(current_user):
-    patients = Patient.query.order_by(Patient.first_name, Patient.last_name).all()
-
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = 'All Patients Bio-Data'
-
-    headers = [
-        'Staff ID', 'First Name', 'Middle Name', 'Last Name', 'Department',
-        'Gender', 'Date of Birth', 'Contact Phone', 'Email Address',
-        'Race', 'Nationality'
-    ]
-    sheet.append(headers)
-
-    for p in patients:
-        sheet.append([
-            p.staff_id, p.first_name, p.middle_name, p.last_name, p.department,
-            p.gender, p.date_of_birth.isoformat() if p.date_of_birth else '', p.contact_phone,
-            p.email_address, p.race, p.nationality
-        ])
-
-    output = BytesIO()
-    workbook.save(output)
-    output.seek(0)
+    export_format = request.args.get('format', 'xlsx')
+    error = check_export_format(export_format)
+    if error:
+        return jsonify({'message': error}), 400
 
     log_audit(current_user, 'DOWNLOAD_PATIENT_BIODATA', 'Downloaded comprehensive patient bio-data.')
     db.session.commit()
 
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name='all_patients_biodata.xlsx'
-    )
+    rows = biodata_rows(stream_query(biodata_query()))
+    return export_response(export_format, 'All Patients Bio-Data', BIODATA_HEADERS, rows, 'all_patients_biodata')
 
 @bp.route('/screening/download', methods=['GET'])
 @token_required('download_screening_data')
 def download_screening_data(current_user):
     screening_year = request.args.get('screening_year', type=int)
     company_section = request.args.get('company_section')
+    export_format = request.args.get('format', 'xlsx')
 
     if not screening_year or not company_section:
         return jsonify({'message': 'screening_year and company_section parameters are required'}), 400
 
-    records = db.session.query(
-        Patient
-    ).join(
-        ScreeningBioData, Patient.id == ScreeningBioData.patient_comprehensive_id
-    ).filter(
-        ScreeningBioData.screening_year == screening_year,
-        ScreeningBioData.company_section == company_section
-    ).order_by(Patient.first_name, Patient.last_name).all()
+    error = check_export_format(export_format)
+    if error:
+        return jsonify({'message': error}), 400
 
-    def get_patient_summary_for_download(patient):
-        summary = {
-            'staff_id': patient.staff_id,
-            'first_name': patient.first_name,
-            'middle_name': patient.middle_name,
-            'last_name': patient.last_name,
-            'department': patient.department,
-            'gender': patient.gender,
-            'date_of_birth': patient.date_of_birth.isoformat() if patient.date_of_birth else '',
-        }
-
-        def model_to_dict(model_instance):
-            if not model_instance:
-                return {}
-            exclude = ['id', 'patient_id']
-            result = {}
-            for c in model_instance.__table__.columns:
-                if c.name not in exclude:
-                    value = getattr(model_instance, c.name)
-                    if isinstance(value, (datetime, date)):
-                        result[c.name] = value.isoformat()
-                    else:
-                        result[c.name] = value
-            return result
-
-        summary.update(model_to_dict(patient.consultation))
-        summary.update(model_to_dict(patient.full_blood_count))
-        summary.update(model_to_dict(patient.kidney_function_test))
-        summary.update(model_to_dict(patient.lipid_profile))
-        summary.update(model_to_dict(patient.liver_function_test))
-        summary.update(model_to_dict(patient.ecg))
-        summary.update(model_to_dict(patient.spirometry))
-        summary.update(model_to_dict(patient.audiometry))
-        return summary
-
-    patient_summaries = [get_patient_summary_for_download(p) for p in records]
-
-    if not patient_summaries:
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = 'No Records'
-        sheet.append(['No records found for the selected criteria.'])
-        output = BytesIO()
-        workbook.save(output)
-        output.seek(0)
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'screening_data_{screening_year}_{company_section}.xlsx'
-        )
-
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = f'{screening_year} {company_section} Screening'
-
-    headers = list(patient_summaries[0].keys())
-    sheet.append(headers)
-
-    for summary in patient_summaries:
-        row = [summary.get(h) for h in headers]
-        sheet.append(row)
+    basename = f'screening_data_{screening_year}_{company_section}'
+    has_records = ScreeningBioData.query.filter_by(
+        screening_year=screening_year,
+        company_section=company_section
+    ).first() is not None
 
-    output = BytesIO()
-    workbook.save(output)
-    output.seek(0)
+    if not has_records:
+        return export_response(export_format, 'No Records', ['No records found for the selected criteria.'], [], basename)
 
     log_audit(current_user, 'DOWNLOAD_SCREENING_DATA', f'Downloaded screening data for {screening_year} {company_section}.')
     db.session.commit()
 
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'screening_data_{screening_year}_{company_section}.xlsx'
+    rows = screening_export_rows(stream_query(screening_export_query(screening_year, company_section)))
+    return export_response(
+        export_format,
+        f'{screening_year} {company_section} Screening',
+        EXPORT_HEADERS,
+        rows,
+        basename,
+        types=EXPORT_COLUMN_TYPES
     )
 
 @bp.route('/screening/biodata/download', methods=['GET'])
@@ -1568,49 +1590,25 @@ def download_screening_data(current_user):
 def download_screening_biodata(current_user):
     screening_year = request.args.get('screening_year', type=int)
     company_section = request.args.get('company_section')
+    export_format = request.args.get('format', 'xlsx')
 
     if not screening_year or not company_section:
         return jsonify({'message': 'screening_year and company_section parameters are required'}), 400
 
-    records = db.session.query(
-        Patient
-    ).join(
-        ScreeningBioData, Patient.id == ScreeningBioData.patient_comprehensive_id
-    ).filter(
-        ScreeningBioData.screening_year == screening_year,
-        ScreeningBioData.company_section == company_section
-    ).order_by(Patient.first_name, Patient.last_name).all()
-
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = f'{screening_year} {company_section} Bio-Data'
-
-    headers = [
-        'Staff ID', 'First Name', 'Middle Name', 'Last Name', 'Department',
-        'Gender', 'Date of Birth', 'Contact Phone', 'Email Address',
-        'Race', 'Nationality'
-    ]
-    sheet.append(headers)
-
-    for p in records:
-        sheet.append([
-            p.staff_id, p.first_name, p.middle_name, p.last_name, p.department,
-            p.gender, p.date_of_birth.isoformat() if p.date_of_birth else '', p.contact_phone,
-            p.email_address, p.race, p.nationality
-        ])
-
-    output = BytesIO()
-    workbook.save(output)
-    output.seek(0)
+    error = check_export_format(export_format)
+    if error:
+        return jsonify({'message': error}), 400
 
     log_audit(current_user, 'DOWNLOAD_SCREENING_BIODATA', f'Downloaded screening bio-data for {screening_year} {company_section}.')
     db.session.commit()
 
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'screening_biodata_{screening_year}_{company_section}.xlsx'
+    rows = biodata_rows(stream_query(biodata_query(screening_year, company_section)))
+    return export_response(
+        export_format,
+        f'{screening_year} {company_section} Bio-Data',
+        BIODATA_HEADERS,
+        rows,
+        f'screening_biodata_{screening_year}_{company_section}'
     )
 
 
@@ -1624,24 +1622,13 @@ def allowed_file(filename):
 
 @bp.route('/branding', methods=['GET'])
 def get_branding():
-    branding = Branding.query.first()
-    if not branding:
-        # Create a default entry if it doesn't exist
-        branding = Branding()
-        db.session.add(branding)
-        db.session.commit()
-
-    return jsonify({
-        'clinic_name': branding.clinic_name,
-        'logo_light': branding.logo_light,
-        'logo_dark': branding.logo_dark,
-        'logo_home': branding.logo_home,
-        'report_header': branding.report_header,
-        'report_signature': branding.report_signature,
-        'report_footer': branding.report_footer,
-        'doctor_name': branding.doctor_name,
-        'doctor_title': branding.doctor_title,
-    })
+    entry = branding_cache.get()
+    response = current_app.response_class(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    # Browsers keep the copy but revalidate it, which is a 304 until the branding changes
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @bp.route('/branding', methods=['POST'])
 @token_required('manage_branding')
@@ -1661,25 +1648,25 @@ def update_branding(current_user):
 
     # --- Handle File Uploads ---
     files = request.files
-    for key in ['logo_light', 'logo_dark', 'logo_home', 'report_header', 'report_signature', 'report_footer']:
+    for key in ASSET_FIELDS:
         if key in files:
             file = files[key]
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # To avoid filename collisions, prepend with a unique identifier
-                unique_filename = f"{key}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-                file.save(save_path)
-                setattr(branding, key, unique_filename) # Store the filename in the DB
+                setattr(branding, key, store_asset(file.read(), file.filename.rsplit('.', 1)[1]))
 
+    branding.version = (branding.version or 0) + 1
     log_audit(current_user, 'BRANDING_UPDATE', 'Updated branding settings.')
     db.session.commit()
+    branding_cache.invalidate()
 
     return jsonify({'message': 'Branding updated successfully.'})
 
 @bp.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+    size = request.args.get('size')
+    if size is not None and size not in IMAGE_VARIANTS:
+        return jsonify({'message': f"size must be one of: {', '.join(IMAGE_VARIANTS)}"}), 400
+    return asset_response(filename, size)
 
 @bp.route('/patients/claim-info', methods=['GET'])
 def get_patient_claim_info():
@@ -1711,53 +1698,152 @@ def upload_patients(current_user):
 
     if file and file.filename.endswith('.xlsx'):
         try:
-            workbook = openpyxl.load_workbook(file)
-            sheet = workbook.active
-
-            # Assuming the first row is the header
-            headers = [cell.value for cell in sheet[1]]
-
-            required_fields = ['Staff ID', 'First Name', 'Last Name']
-            if not all(field in headers for field in required_fields):
-                return jsonify({'message': 'Missing required columns: Staff ID, First Name, Last Name'}), 400
-
-            patients_added = 0
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                row_data = dict(zip(headers, row))
-
-                staff_id = row_data.get('Staff ID')
-                first_name = row_data.get('First Name')
-                last_name = row_data.get('Last Name')
-
-                if not staff_id or not first_name or not last_name:
-                    continue # Skip rows with missing required data
-
-                if Patient.query.filter_by(staff_id=staff_id).first():
-                    continue # Skip existing patients
-
-                new_patient = Patient(
-                    staff_id=staff_id,
-                    first_name=first_name,
-                    last_name=last_name,
-                    department=row_data.get('Department'),
-                    gender=row_data.get('Gender'),
-                    date_of_birth=row_data.get('Date of Birth'),
-                    contact_phone=row_data.get('Contact Phone'),
-                    email_address=row_data.get('Email Address'),
-                    race=row_data.get('Race'),
-                    nationality=row_data.get('Nationality')
-                )
-                db.session.add(new_patient)
-                patients_added += 1
-
-            db.session.commit()
-            log_audit(current_user, 'PATIENT_BULK_UPLOAD', f'Uploaded and added {patients_added} new patients.')
-            db.session.commit()
-
-            return jsonify({'message': f'Successfully added {patients_added} new patients.'}), 201
-
+            report = ingest_patient_workbook(file, batch_size=current_app.config['UPLOAD_BATCH_SIZE'])
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error(f"Error processing patient upload file: {e}")
             return jsonify({'message': 'Error processing file'}), 500
 
-    return jsonify({'message': 'Invalid file type'}), 400
\ No newline at end of file
+        if report['inserted']:
+            patient_index.invalidate()
+        patients_added = len(report['inserted'])
+        log_audit(current_user, 'PATIENT_BULK_UPLOAD', f"Uploaded and added {patients_added} new patients ({len(report['skipped'])} skipped, {len(report['invalid'])} invalid).")
+        db.session.commit()
+
+        return jsonify({
+            'message': f'Successfully added {patients_added} new patients.',
+            'inserted': report['inserted'],
+            'skipped': report['skipped'],
+            'invalid': report['invalid'],
+        }), 201
+
+    return jsonify({'message': 'Only .xlsx files are supported'}), 400
+
+
+# Background Job Routes
+def _patient_upload_job(progress, path, user_id, batch_size):
+    try:
+        report = ingest_patient_workbook(path, batch_size=batch_size, progress=progress)
+    finally:
+        os.remove(path)
+    if report['inserted']:
+        patient_index.invalidate()
+
+    log_audit(db.session.get(User, user_id), 'PATIENT_BULK_UPLOAD', f"Uploaded and added {len(report['inserted'])} new patients ({len(report['skipped'])} skipped, {len(report['invalid'])} invalid).")
+    db.session.commit()
+    return report
+
+def _screening_export_job(progress, user_id, screening_year, company_section, export_format):
+    patient_ids = screening_export_patient_ids(screening_year, company_section)
+    query = screening_export_query(screening_year, company_section)
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+
+    def rows():
+        # Each batch is its own short query, so progress can be committed in between
+        for start in range(0, len(patient_ids), batch_size):
+            batch = query.filter(Patient.id.in_(patient_ids[start:start + batch_size])).all()
+            yield from screening_export_rows(batch)
+            progress(start + len(batch), len(patient_ids))
+
+    path = progress.artifact_path(export_format)
+    write_export(path, export_format, f'{screening_year} {company_section} Screening', EXPORT_HEADERS, rows(), types=EXPORT_COLUMN_TYPES)
+
+    log_audit(db.session.get(User, user_id), 'DOWNLOAD_SCREENING_DATA', f'Exported screening data for {screening_year} {company_section} in the background.')
+    db.session.commit()
+    return {
+        'rows': len(patient_ids),
+        'artifact_path': path,
+        'artifact_name': f'screening_data_{screening_year}_{company_section}.{export_format}',
+    }
+
+def _cohort_reports_job(progress, user_id, screening_year, company_section, by_department):
+    reports = render_cohort_reports(screening_year, company_section, progress=progress)
+    path = write_report_archive(progress.artifact_path('zip'), reports, screening_year, by_department)
+
+    log_audit(db.session.get(User, user_id), 'COHORT_REPORTS_RENDER', f'Rendered {len(reports)} reports for {screening_year} {company_section}.')
+    db.session.commit()
+    return {
+        'reports': len(reports),
+        'artifact_path': path,
+        'artifact_name': f"medical_reports_{screening_year}_{company_section}{'_by_department' if by_department else ''}.zip",
+    }
+
+@bp.route('/jobs/patients-upload', methods=['POST'])
+@token_required('upload_patient_data')
+def start_patient_upload_job(current_user):
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'message': 'No selected file'}), 400
+    if not file.filename.endswith('.xlsx'):
+        return jsonify({'message': 'Only .xlsx files are supported'}), 400
+
+    path = os.path.join(current_app.config['JOB_FOLDER'], f'upload_{uuid.uuid4().hex}.xlsx')
+    file.save(path)
+    job = submit_job('patients_upload', current_user, _patient_upload_job, path, current_user.id, current_app.config['UPLOAD_BATCH_SIZE'])
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+@bp.route('/jobs/screening-download', methods=['POST'])
+@token_required('download_screening_data')
+def start_screening_export_job(current_user):
+    data = request.get_json() or {}
+    screening_year = data.get('screening_year')
+    company_section = data.get('company_section')
+    export_format = data.get('format', 'xlsx')
+
+    if not screening_year or not company_section:
+        return jsonify({'message': 'screening_year and company_section are required'}), 400
+    try:
+        screening_year = int(screening_year)
+    except (TypeError, ValueError):
+        return jsonify({'message': 'screening_year must be a whole number'}), 400
+
+    error = check_export_format(export_format)
+    if error:
+        return jsonify({'message': error}), 400
+
+    job = submit_job('screening_download', current_user, _screening_export_job, current_user.id, screening_year, company_section, export_format)
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+@bp.route('/jobs/cohort-reports', methods=['POST'])
+@token_required('download_screening_data')
+def start_cohort_reports_job(current_user):
+    data = request.get_json() or {}
+    screening_year = data.get('screening_year')
+    company_section = data.get('company_section')
+    bundle = data.get('bundle', 'single')
+
+    if not screening_year or not company_section:
+        return jsonify({'message': 'screening_year and company_section are required'}), 400
+    try:
+        screening_year = int(screening_year)
+    except (TypeError, ValueError):
+        return jsonify({'message': 'screening_year must be a whole number'}), 400
+    if bundle not in ('single', 'department'):
+        return jsonify({'message': "bundle must be 'single' or 'department'"}), 400
+    if not reports_available():
+        return jsonify({'message': 'PDF reports are not available on this server.'}), 501
+
+    job = submit_job('cohort_reports', current_user, _cohort_reports_job, current_user.id, screening_year, company_section, bundle == 'department')
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+@bp.route('/jobs/<int:job_id>', methods=['GET'])
+@token_required()
+def get_job(current_user, job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        return jsonify({'message': 'Unauthorized'}), 403
+    return jsonify(job_to_dict(job))
+
+@bp.route('/jobs/<int:job_id>/download', methods=['GET'])
+@token_required()
+def download_job_artifact(current_user, job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        return jsonify({'message': 'Unauthorized'}), 403
+    if job.status == 'finished' and job.artifact_name and not job.artifact_path:
+        return jsonify({'message': 'The file for this job has expired.'}), 410
+    if job.status != 'finished' or not job.artifact_path or not os.path.exists(job.artifact_path):
+        return jsonify({'message': 'No file is available for this job.'}), 404
+    return send_file(job.artifact_path, as_attachment=True, download_name=job.artifact_name)
@@ -0,0 +1,238 @@
+from collections import Counter
+from threading import Lock, Thread
+import bisect
+import heapq
+import re
+import time
+from flask import current_app
+from . import db
+from .models import Patient, ScreeningBioData
+
+SEARCH_FIELDS = ['staff_id', 'first_name', 'middle_name', 'last_name', 'department']
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def _tokens(fields):
+    tokens = set()
+    for value in fields:
+        if value:
+            value = str(value).lower()
+            tokens.update(_WORD.findall(value))
+            tokens.add(value.replace(' ', ''))
+    return tokens
+
+
+def _trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a, b):
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+
+class PatientSearchIndex:
+    """An in-process n-gram index over patient names, staff IDs and departments.
+
+    Supports exact, prefix, substring and fuzzy (trigram similarity) matches
+    and ranks results by how well they match. It also keeps the patient ids
+    of each screening cohort so searches can be restricted to one without a
+    query. The index is built from two queries, updated in place by the
+    routes that write patients or screening records, and rebuilt in the
+    background once it is older than SEARCH_INDEX_MAX_AGE seconds so that
+    writes made by other worker processes show up.
+    """
+
+    def __init__(self):
+        self.max_age = 300
+        self._lock = Lock()
+        self._docs = {}       # patient id -> (staff_id, tokens)
+        self._grams = {}      # trigram -> set of patient ids
+        self._sorted = []     # sorted (token, patient id) pairs for prefix lookups
+        self._cohorts = {}    # (screening year, company section) -> set of patient ids
+        self._built_at = None
+        self._rebuilding = False
+
+    def _add(self, patient_id, staff_id, tokens):
+        self._docs[patient_id] = (staff_id, tokens)
+        for token in tokens:
+            bisect.insort(self._sorted, (token, patient_id))
+            for gram in _trigrams(token):
+                self._grams.setdefault(gram, set()).add(patient_id)
+
+    def _remove(self, patient_id):
+        doc = self._docs.pop(patient_id, None)
+        if doc is None:
+            return
+        for token in doc[1]:
+            i = bisect.bisect_left(self._sorted, (token, patient_id))
+            if i < len(self._sorted) and self._sorted[i] == (token, patient_id):
+                del self._sorted[i]
+            for gram in _trigrams(token):
+                ids = self._grams.get(gram)
+                if ids:
+                    ids.discard(patient_id)
+
+    def rebuild(self):
+        rows = db.session.query(Patient.id, *[getattr(Patient, f) for f in SEARCH_FIELDS]).all()
+        docs, grams, pairs = {}, {}, []
+        for patient_id, *fields in rows:
+            tokens = _tokens(fields)
+            docs[patient_id] = ((fields[0] or '').lower(), tokens)
+            for token in tokens:
+                pairs.append((token, patient_id))
+                for gram in _trigrams(token):
+                    grams.setdefault(gram, set()).add(patient_id)
+        pairs.sort()
+        cohorts = {}
+        for year, section, patient_id in db.session.query(
+            ScreeningBioData.screening_year, ScreeningBioData.company_section, ScreeningBioData.patient_comprehensive_id
+        ):
+            cohorts.setdefault((year, section), set()).add(patient_id)
+        with self._lock:
+            self._docs, self._grams, self._sorted, self._cohorts = docs, grams, pairs, cohorts
+            self._built_at = time.monotonic()
+
+    def _rebuild_in_background(self, app):
+        try:
+            with app.app_context():
+                self.rebuild()
+        except Exception:
+            app.logger.exception("Rebuilding the patient search index failed")
+        finally:
+            self._rebuilding = False
+
+    def ensure_fresh(self):
+        """Builds the index on first use and refreshes it in the background when stale."""
+        if self._built_at is None:
+            self.rebuild()
+        elif time.monotonic() - self._built_at > self.max_age and not self._rebuilding:
+            self._rebuilding = True
+            Thread(target=self._rebuild_in_background, args=(current_app._get_current_object(),), daemon=True).start()
+
+    def update_patient(self, patient):
+        """Indexes a created or edited patient."""
+        if self._built_at is None:
+            return # Built from the database on first search
+        fields = [getattr(patient, f) for f in SEARCH_FIELDS]
+        with self._lock:
+            self._remove(patient.id)
+            self._add(patient.id, (patient.staff_id or '').lower(), _tokens(fields))
+
+    def remove_patient(self, patient_id):
+        with self._lock:
+            self._remove(patient_id)
+            for members in self._cohorts.values():
+                members.discard(patient_id)
+
+    def add_registration(self, record):
+        with self._lock:
+            self._cohorts.setdefault((record.screening_year, record.company_section), set()).add(record.patient_comprehensive_id)
+
+    def remove_registration(self, record):
+        with self._lock:
+            self._cohorts.get((record.screening_year, record.company_section), set()).discard(record.patient_comprehensive_id)
+
+    def invalidate(self):
+        """Forces a rebuild on the next search, e.g. after a bulk import."""
+        self._built_at = None
+
+    def _word_scores(self, word, within, stop_at):
+        scores = {}
+        # Prefix matches. Exact matches sort first, so when a single word is
+        # searched the scan can stop once `stop_at` matches are found.
+        i = bisect.bisect_left(self._sorted, (word,))
+        while i < len(self._sorted) and self._sorted[i][0].startswith(word):
+            token, patient_id = self._sorted[i]
+            i += 1
+            if within is not None and patient_id not in within:
+                continue
+            score = 1.0 if token == word else 0.8
+            if score > scores.get(patient_id, 0):
+                scores[patient_id] = score
+                if stop_at is not None and len(scores) >= stop_at:
+                    return scores
+
+        if len(word) < 3:
+            # Too few trigrams to narrow the search, so check the tokens of
+            # each document (or of `within`) for the word directly
+            candidates = self._docs.keys() if within is None else within
+            for patient_id in candidates:
+                if patient_id in scores or patient_id not in self._docs:
+                    continue
+                if any(word in token for token in self._docs[patient_id][1]):
+                    scores[patient_id] = 0.6
+                    if stop_at is not None and len(scores) >= stop_at:
+                        break
+            return scores
+
+        # Substring and fuzzy matches among the documents sharing the most
+        # trigrams, ignoring trigrams so common they barely narrow the search
+        cutoff = max(len(self._docs) // 20, 100)
+        shared = Counter()
+        for gram in _trigrams(word):
+            ids = self._grams.get(gram, set())
+            if len(ids) <= cutoff:
+                shared.update(ids if within is None else ids & within)
+
+        # Every token containing the word has all of its inner trigrams. When
+        # each of those is too common to have been counted above (a frequent
+        # surname fragment, say), intersect their postings and check those
+        # documents for the word directly.
+        inner = sorted((self._grams.get(word[i:i + 3], set()) for i in range(len(word) - 2)), key=len)
+        if all(len(ids) > cutoff for ids in inner):
+            candidates = set.intersection(*inner)
+            for patient_id in (candidates if within is None else candidates & within):
+                if scores.get(patient_id, 0) < 0.6 and any(word in token for token in self._docs[patient_id][1]):
+                    scores[patient_id] = 0.6
+
+        for patient_id, _ in shared.most_common(200):
+            if scores.get(patient_id, 0) >= 0.8:
+                continue
+            best = 0
+            for token in self._docs[patient_id][1]:
+                if word in token:
+                    best = max(best, 0.6)
+                else:
+                    similarity = _similarity(word, token)
+                    if similarity >= 0.4:
+                        best = max(best, 0.5 * similarity)
+            if best:
+                scores[patient_id] = best
+        return scores
+
+    def search(self, term, limit=10, cohort=None):
+        """Returns up to `limit` patient ids matching every word of `term`, best first.
+
+        `cohort` optionally restricts the results to the patients registered
+        for a (screening year, company section).
+        """
+        words = _WORD.findall(term.lower())
+        if not words:
+            return []
+        self.ensure_fresh()
+        stop_at = limit if len(words) == 1 else None
+        with self._lock:
+            within = None if cohort is None else self._cohorts.get(cohort, set())
+            totals = None
+            for word in words:
+                scores = self._word_scores(word, within, stop_at)
+                if totals is None:
+                    totals = scores
+                else:
+                    totals = {pid: totals[pid] + s for pid, s in scores.items() if pid in totals}
+            compact = term.lower().replace(' ', '')
+            for patient_id in totals:
+                if self._docs[patient_id][0] == compact:
+                    totals[patient_id] += 1.0 # An exact staff ID beats any name match
+        ranked = heapq.nsmallest(limit, totals.items(), key=lambda item: (-item[1], item[0]))
+        return [patient_id for patient_id, _ in ranked]
+
+
+patient_index = PatientSearchIndex()
+
+
+def init_app(app):
+    patient_index.max_age = app.config['SEARCH_INDEX_MAX_AGE']
@@ -0,0 +1,106 @@
+from datetime import datetime
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import Patient, ScreeningBioData, ScreeningStatCounter
+
+COUNTER_FIELDS = ['total', 'male', 'female', 'over_40', 'under_40']
+
+
+def _contribution(screening_year, gender, date_of_birth):
+    """The counters one screened patient adds to their cohort.
+
+    Age bands use the patient's age in the screening year, so a stored
+    counter never goes stale when the calendar year rolls over.
+    """
+    age = screening_year - date_of_birth.year
+    return {
+        'total': 1,
+        'male': 1 if gender == 'Male' else 0,
+        'female': 1 if gender == 'Female' else 0,
+        'over_40': 1 if age >= 40 else 0,
+        'under_40': 1 if age < 40 else 0,
+    }
+
+
+def _adjust(screening_year, company_section, day, deltas):
+    key = {'screening_year': screening_year, 'company_section': company_section, 'day': day}
+    if not ScreeningStatCounter.query.filter_by(**key).first():
+        try:
+            with db.session.begin_nested():
+                db.session.add(ScreeningStatCounter(**key, **{field: 0 for field in COUNTER_FIELDS}))
+        except IntegrityError:
+            pass # Another request created the row first
+
+    # Increment in SQL so concurrent registrations don't overwrite each other
+    ScreeningStatCounter.query.filter_by(**key).update(
+        {getattr(ScreeningStatCounter, field): getattr(ScreeningStatCounter, field) + delta for field, delta in deltas.items() if delta},
+        synchronize_session=False
+    )
+
+
+def count_registration(record, patient, sign=1):
+    """Adds (sign=1) or removes (sign=-1) a screening record from the counters.
+
+    Runs in the caller's transaction, so it commits or rolls back with the
+    change it describes.
+    """
+    deltas = _contribution(record.screening_year, patient.gender, patient.date_of_birth)
+    _adjust(record.screening_year, record.company_section, record.date_registered.date(),
+            {field: sign * delta for field, delta in deltas.items()})
+
+
+def recount_patient(patient, old_gender, old_date_of_birth):
+    """Moves a patient's screening records between gender and age counters
+    after their gender or date of birth changed.
+    """
+    if patient.gender == old_gender and patient.date_of_birth == old_date_of_birth:
+        return
+    for record in ScreeningBioData.query.filter_by(patient_comprehensive_id=patient.id):
+        old = _contribution(record.screening_year, old_gender, old_date_of_birth)
+        new = _contribution(record.screening_year, patient.gender, patient.date_of_birth)
+        _adjust(record.screening_year, record.company_section, record.date_registered.date(),
+                {field: new[field] - old[field] for field in COUNTER_FIELDS})
+
+
+def read_counters(screening_year, company_section):
+    """Sums a cohort's daily counters into the /screening/stats payload."""
+    today = datetime.utcnow().date()
+    row = db.session.query(
+        func.coalesce(func.sum(ScreeningStatCounter.total), 0),
+        func.coalesce(func.sum(case((ScreeningStatCounter.day == today, ScreeningStatCounter.total), else_=0)), 0),
+        func.coalesce(func.sum(ScreeningStatCounter.male), 0),
+        func.coalesce(func.sum(ScreeningStatCounter.female), 0),
+        func.coalesce(func.sum(ScreeningStatCounter.over_40), 0),
+        func.coalesce(func.sum(ScreeningStatCounter.under_40), 0),
+    ).filter(
+        ScreeningStatCounter.screening_year == screening_year,
+        ScreeningStatCounter.company_section == company_section
+    ).one()
+    return dict(zip(
+        ['total_registered', 'registered_today', 'male_count', 'female_count', 'over_40_count', 'under_40_count'],
+        row
+    ))
+
+
+def rebuild_counters():
+    """Recomputes every counter from the screening records. Returns the number of rows written."""
+    ScreeningStatCounter.query.delete()
+    counters = {}
+    rows = db.session.query(
+        ScreeningBioData.screening_year, ScreeningBioData.company_section,
+        ScreeningBioData.date_registered, Patient.gender, Patient.date_of_birth
+    ).join(Patient, ScreeningBioData.patient_comprehensive_id == Patient.id)
+
+    for screening_year, company_section, date_registered, gender, date_of_birth in rows.yield_per(1000):
+        key = (screening_year, company_section, date_registered.date())
+        counter = counters.setdefault(key, dict.fromkeys(COUNTER_FIELDS, 0))
+        for field, delta in _contribution(screening_year, gender, date_of_birth).items():
+            counter[field] += delta
+
+    db.session.bulk_insert_mappings(ScreeningStatCounter, [
+        dict(screening_year=year, company_section=section, day=day, **counter)
+        for (year, section, day), counter in counters.items()
+    ])
+    db.session.commit()
+    return len(counters)
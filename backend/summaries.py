@@ -0,0 +1,162 @@
+from datetime import date, datetime
+from sqlalchemy.orm import aliased
+from . import db
+from .models import Patient, ScreeningBioData, Consultation, FullBloodCount, KidneyFunctionTest, LipidProfile, LiverFunctionTest, ECG, Spirometry, Audiometry
+
+# The one-to-one result tables merged into a patient summary, in the order
+# their columns are applied (later tables win on shared names such as
+# 'other_remarks', matching the old dict.update() behaviour).
+RESULT_MODELS = [
+    Consultation, FullBloodCount, KidneyFunctionTest, LipidProfile,
+    LiverFunctionTest, ECG, Spirometry, Audiometry
+]
+
+# Column names per result model, computed once instead of walking
+# __table__.columns for every row.
+RESULT_COLUMNS = {
+    model: [c.name for c in model.__table__.columns if c.name not in ('id', 'patient_id')]
+    for model in RESULT_MODELS
+}
+
+PATIENT_FIELDS = [
+    'staff_id', 'first_name', 'middle_name', 'last_name', 'department',
+    'gender', 'date_of_birth', 'contact_phone', 'email_address', 'race', 'nationality'
+]
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _latest_screening_id():
+    latest = aliased(ScreeningBioData)
+    return db.session.query(latest.id).filter(
+        latest.patient_comprehensive_id == Patient.id
+    ).order_by(latest.screening_year.desc()).limit(1).correlate(Patient).scalar_subquery()
+
+
+def _result_columns():
+    columns = []
+    for model in RESULT_MODELS:
+        columns.append(model.id.label(f'{model.__tablename__}__id'))
+        columns += [getattr(model, name).label(f'{model.__tablename__}__{name}') for name in RESULT_COLUMNS[model]]
+    return columns
+
+
+def _join_results(query):
+    for model in RESULT_MODELS:
+        query = query.outerjoin(model, model.patient_id == Patient.id)
+    return query
+
+
+def summary_query():
+    """Builds a query returning one flat row per patient with every result table
+    and the patient's latest screening record LEFT JOINed in.
+
+    Each result table contributes its id (to tell a missing record apart from
+    an empty one) followed by the columns listed in RESULT_COLUMNS.
+    """
+    columns = [Patient.id] + [getattr(Patient, name) for name in PATIENT_FIELDS]
+    columns += [ScreeningBioData.date_registered, ScreeningBioData.patient_id_for_year]
+    columns += _result_columns()
+
+    query = _join_results(db.session.query(*columns).select_from(Patient))
+    return query.outerjoin(ScreeningBioData, ScreeningBioData.id == _latest_screening_id())
+
+
+def _merge_results(summary, row, offset):
+    for model in RESULT_MODELS:
+        names = RESULT_COLUMNS[model]
+        if row[offset] is not None:
+            for i, name in enumerate(names, start=offset + 1):
+                summary[name] = _serialize(row[i])
+        offset += len(names) + 1
+    return summary
+
+
+def summary_from_row(row):
+    """Turns a row from summary_query() into the patient summary dict served to the report pages."""
+    patient_id, staff_id, first_name, middle_name, last_name, department, gender, \
+        date_of_birth, contact_phone, email_address, race, nationality, \
+        date_registered, patient_id_for_year = row[:14]
+
+    summary = {
+        'patient_id': patient_id,
+        'staff_id': staff_id,
+        'first_name': first_name,
+        'middle_name': middle_name,
+        'last_name': last_name,
+        'department': department,
+        'gender': gender,
+        'date_of_birth': date_of_birth.isoformat(),
+        'age': (date.today().year - date_of_birth.year),
+        'contact_phone': contact_phone,
+        'email_address': email_address,
+        'race': race,
+        'nationality': nationality,
+        'date_registered': date_registered.isoformat() if date_registered else None,
+        'patient_id_for_year': patient_id_for_year,
+    }
+    return _merge_results(summary, row, 14)
+
+
+def get_patient_summary(*criteria):
+    """Loads the summary for the single patient matching `criteria` in one query.
+
+    Returns None if no patient matches.
+    """
+    row = summary_query().filter(*criteria).first()
+    if row is None:
+        return None
+    return summary_from_row(row)
+
+
+# Bio-data columns leading each row of the screening data export
+EXPORT_PATIENT_FIELDS = PATIENT_FIELDS[:7]
+
+# Every result column name once, in table order, with the Python type it is
+# exported as (floats stay numeric, everything else is text)
+_EXPORT_RESULT_TYPES = {}
+for model in RESULT_MODELS:
+    for name in RESULT_COLUMNS[model]:
+        _EXPORT_RESULT_TYPES.setdefault(name, float if isinstance(model.__table__.columns[name].type, db.Float) else str)
+
+EXPORT_HEADERS = EXPORT_PATIENT_FIELDS + list(_EXPORT_RESULT_TYPES)
+EXPORT_COLUMN_TYPES = [str] * len(EXPORT_PATIENT_FIELDS) + list(_EXPORT_RESULT_TYPES.values())
+
+
+def screening_export_query(screening_year, company_section):
+    """Selects one flat row per patient registered in a screening cohort,
+    with all result tables joined in, ordered the way the export sheet is.
+    """
+    columns = [getattr(Patient, name) for name in EXPORT_PATIENT_FIELDS] + _result_columns()
+    query = db.session.query(*columns).select_from(Patient).join(
+        ScreeningBioData, Patient.id == ScreeningBioData.patient_comprehensive_id
+    )
+    return _join_results(query).filter(
+        ScreeningBioData.screening_year == screening_year,
+        ScreeningBioData.company_section == company_section
+    ).order_by(Patient.first_name, Patient.last_name)
+
+
+def screening_export_patient_ids(screening_year, company_section):
+    """Patient ids of a screening cohort in export order."""
+    return [patient_id for (patient_id,) in db.session.query(Patient.id).join(
+        ScreeningBioData, Patient.id == ScreeningBioData.patient_comprehensive_id
+    ).filter(
+        ScreeningBioData.screening_year == screening_year,
+        ScreeningBioData.company_section == company_section
+    ).order_by(Patient.first_name, Patient.last_name)]
+
+
+def screening_export_rows(rows):
+    """Turns rows from screening_export_query() into lists aligned with EXPORT_HEADERS."""
+    offset = len(EXPORT_PATIENT_FIELDS)
+    for row in rows:
+        values = {name: _serialize(row[i]) for i, name in enumerate(EXPORT_PATIENT_FIELDS)}
+        if values['date_of_birth'] is None:
+            values['date_of_birth'] = ''
+        _merge_results(values, row, offset)
+        yield [values.get(name) for name in EXPORT_HEADERS]
@@ -0,0 +1,157 @@
+"""Drives MailSender.deliver_due() against a local aiosmtpd server."""
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+import socket
+import pytest
+from aiosmtpd.controller import Controller
+from backend import create_app, db, mailer
+from backend.config import Config
+from backend.mailer import enqueue, mail_sender
+from backend.models import OutboundEmail, SystemConfig
+
+
+class Recorder:
+    """Accepts mail, except for addresses told to defer (4xx) or reject (5xx)."""
+
+    def __init__(self):
+        self.received = [] # (connection peer, recipients)
+        self.replies = {}
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        reply = self.replies.get(address)
+        if reply:
+            return reply
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.append((session.peer, envelope.rcpt_tos))
+        return '250 Message accepted'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    recorder = Recorder()
+    controller = Controller(recorder, hostname='127.0.0.1', port=_free_port())
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+@pytest.fixture
+def app(tmp_path, smtp):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'app.db')
+        SMTP_HOST = smtp.hostname
+        SMTP_PORT = smtp.port
+        SMTP_SECURITY = 'none'
+        MAIL_POLL_INTERVAL = 0
+        MAIL_RATE_PER_MINUTE = 100
+        MAIL_RETRY_DELAY = 30
+        MAIL_MAX_ATTEMPTS = 3
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.add(SystemConfig(key='sender_email', value='clinic@example.com'))
+        db.session.commit()
+        yield app
+        mail_sender.close()
+        db.session.remove()
+
+
+def queue(*addresses):
+    ids = []
+    for address in addresses:
+        message = EmailMessage()
+        message['From'] = 'clinic@example.com'
+        message['To'] = address
+        message['Subject'] = f'Report for {address}'
+        message.set_content('Your report is attached.')
+        ids.append(enqueue(message))
+    db.session.commit()
+    return [email.id for email in ids]
+
+
+def status(email_id):
+    db.session.expire_all()
+    return db.session.get(OutboundEmail, email_id)
+
+
+def test_reuses_one_connection_for_several_messages(app, smtp):
+    ids = queue('a@example.com', 'b@example.com', 'c@example.com')
+    mail_sender.deliver_due()
+
+    assert [status(i).status for i in ids] == ['sent'] * 3
+    assert sorted(r for _, (r,) in smtp.handler.received) == ['a@example.com', 'b@example.com', 'c@example.com']
+    assert len({peer for peer, _ in smtp.handler.received}) == 1
+
+
+def test_temporary_failure_is_retried_with_backoff(app, smtp):
+    smtp.handler.replies['later@example.com'] = '451 4.3.0 Try again later'
+    (email_id,) = queue('later@example.com')
+
+    before = datetime.utcnow()
+    mail_sender.deliver_due()
+    email = status(email_id)
+    assert (email.status, email.attempts) == ('queued', 1)
+    assert '451' in email.last_error
+    assert timedelta(seconds=30) <= email.next_attempt_at - before <= timedelta(seconds=37)
+
+    # Due again: the delay doubles for the second attempt
+    email.next_attempt_at = datetime.utcnow()
+    db.session.commit()
+    before = datetime.utcnow()
+    mail_sender.deliver_due()
+    email = status(email_id)
+    assert (email.status, email.attempts) == ('queued', 2)
+    assert timedelta(seconds=60) <= email.next_attempt_at - before <= timedelta(seconds=73)
+
+    # The server recovers
+    del smtp.handler.replies['later@example.com']
+    email.next_attempt_at = datetime.utcnow()
+    db.session.commit()
+    mail_sender.deliver_due()
+    email = status(email_id)
+    assert (email.status, email.attempts, email.last_error) == ('sent', 3, None)
+    assert [r for _, r in smtp.handler.received] == [['later@example.com']]
+
+
+def test_permanent_failure_is_not_retried(app, smtp):
+    smtp.handler.replies['nobody@example.com'] = '550 5.1.1 No such user'
+    rejected, accepted = queue('nobody@example.com', 'a@example.com')
+    mail_sender.deliver_due()
+
+    email = status(rejected)
+    assert (email.status, email.attempts) == ('failed', 1)
+    assert '550' in email.last_error
+    assert status(accepted).status == 'sent'
+
+
+def test_rate_limit_stops_the_pass(app, smtp, monkeypatch):
+    class Frozen(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime(2026, 1, 5, 9, 30, 20)
+
+    monkeypatch.setattr(mailer, 'datetime', Frozen)
+    app.config['MAIL_RATE_PER_MINUTE'] = 2
+    ids = queue('a@example.com', 'b@example.com', 'c@example.com')
+    OutboundEmail.query.update({'next_attempt_at': datetime(2026, 1, 5, 9, 30)})
+    db.session.commit()
+
+    wait = mail_sender.deliver_due()
+    assert [status(i).status for i in ids] == ['sent', 'sent', 'queued']
+    assert len(smtp.handler.received) == 2
+    assert wait == 40 # Until the next minute's slots
+
+    # Another sender in the same minute gets nothing either
+    assert mail_sender.deliver_due() == 40
+    assert status(ids[2]).status == 'queued'
@@ -0,0 +1,102 @@
+"""Checks that the hot list and filter routes are served by the indexes added
+in b83db19cded6. Each test calls the real endpoint on a SQLite database
+upgraded through the migrations, records the SQL it runs and checks
+EXPLAIN QUERY PLAN for it.
+"""
+import os
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import event
+from backend import create_app, db
+from backend.auth import issue_token
+from backend.config import Config
+from backend.models import Conversation, User
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path_factory.mktemp('db') / 'app.db')
+        AUDIT_PURGE_INTERVAL = 0
+        MAIL_POLL_INTERVAL = 0
+        JOB_HEARTBEAT_INTERVAL = 0
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        app.test_cli_runner().invoke(args=['create-admin', 'Passw0rd!'])
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture(scope='module')
+def admin(app):
+    return User.query.filter_by(username='admin').one()
+
+
+def route_plans(app, user, url, marker):
+    """GETs `url` as `user` and returns the query plan of every SELECT it ran
+    whose SQL contains `marker`.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT') and marker in statement:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = app.test_client().get(url, headers={'Authorization': 'Bearer ' + issue_token(user)})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert statements, f'{url} ran no query matching {marker!r}'
+
+    connection = db.session.connection()
+    return [
+        '\n'.join(row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters))
+        for statement, parameters in statements
+    ]
+
+
+def test_screening_records_use_cohort_index(app, admin):
+    (plan,) = route_plans(app, admin, '/api/screening/records?screening_year=2025&company_section=DCP', 'FROM screening_bio_data')
+    assert 'USING INDEX ix_screening_bio_data_cohort_registered_at' in plan
+
+
+def test_queue_stats_use_cohort_index_for_registration_day(app, admin):
+    plans = route_plans(app, admin, '/api/queue/stats?screening_year=2025&company_section=DCP', 'JOIN screening_bio_data')
+    assert len(plans) == 4 # One count per station
+    for plan in plans:
+        assert 'USING INDEX ix_screening_bio_data_cohort_registered_at' in plan
+        assert 'registered_at>? AND registered_at<?' in plan
+
+
+def test_audit_log_pages_by_timestamp_index(app, admin):
+    (plan,) = route_plans(app, admin, '/api/audit-logs?since=2025-01-01', 'FROM audit_log')
+    assert 'USING INDEX ix_audit_log_timestamp' in plan
+    assert 'TEMP B-TREE' not in plan # The index also gives the page order
+
+
+def test_messages_page_by_conversation_index(app, admin):
+    conversation = Conversation(participants=[admin])
+    db.session.add(conversation)
+    db.session.commit()
+    (plan,) = route_plans(app, admin, f'/api/conversations/{conversation.id}', 'FROM message')
+    assert 'USING INDEX ix_message_conversation_timestamp' in plan
+    assert 'TEMP B-TREE' not in plan # The index also gives the page order
+
+
+def test_notifications_page_by_user_index(app, admin):
+    (plan,) = route_plans(app, admin, '/api/notifications', 'FROM notification')
+    assert 'USING INDEX ix_notification_user_timestamp' in plan
+    assert 'TEMP B-TREE' not in plan # The index also gives the page order
+
+
+def test_patients_page_by_name_index(app, admin):
+    (plan,) = route_plans(app, admin, '/api/patients', 'FROM patient')
+    assert 'USING INDEX ix_patient_name' in plan
+    assert 'TEMP B-TREE' not in plan # The index also gives the page order
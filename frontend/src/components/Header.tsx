@@ -110,9 +110,23 @@ const DropdownMenu = styled.div`
 
 const NotificationDropdown = styled(DropdownMenu)`
   width: 350px;
+  max-height: 400px;
+  overflow-y: auto;
   padding: 0;
 `;
 
+const LoadMoreButton = styled.button`
+  width: 100%;
+  padding: ${({ theme }) => theme.spacing.sm};
+  background: none;
+  border: none;
+  border-top: 1px solid ${({ theme }) => theme.cardBorder};
+  color: ${({ theme }) => theme.main};
+  cursor: pointer;
+`;
+
+const NOTIFICATIONS_PAGE_SIZE = 50;
+
 const NotificationItem = styled.div<{ isRead: boolean }>`
   padding: ${({ theme }) => theme.spacing.sm};
   border-bottom: 1px solid ${({ theme }) => theme.cardBorder};
@@ -199,17 +213,29 @@ const Header: React.FC<HeaderProps> = ({ toggleTheme, theme }) => {
   const [profileDropdownOpen, setProfileDropdownOpen] = useState(false);
   const [notificationDropdownOpen, setNotificationDropdownOpen] = useState(false);
   const [notifications, setNotifications] = useState<any[]>([]);
+  const [notificationsCursor, setNotificationsCursor] = useState<string | null>(null);
+  const olderNotificationsLoaded = useRef(false);
   const profileDropdownRef = useRef<HTMLDivElement>(null);
   const notificationDropdownRef = useRef<HTMLDivElement>(null);
 
   useEffect(() => {
+    // Polls the newest page only; older pages are read on "Load more"
     const fetchNotifications = async () => {
       if (user) {
         const token = localStorage.getItem('token');
         const response = await axios.get('/api/notifications', {
           headers: { Authorization: `Bearer ${token}` },
+          params: { limit: NOTIFICATIONS_PAGE_SIZE },
         });
-        setNotifications(response.data);
+        const page: any[] = response.data;
+        if (!olderNotificationsLoaded.current || page.length === 0) {
+          setNotifications(page);
+          setNotificationsCursor(response.headers['x-next-cursor'] || null);
+        } else {
+          // Keep the older pages already loaded below the refreshed newest page
+          const oldestId = page[page.length - 1].id;
+          setNotifications((previous) => [...page, ...previous.filter((n) => n.id < oldestId)]);
+        }
       }
     };
     fetchNotifications();
@@ -219,6 +245,18 @@ const Header: React.FC<HeaderProps> = ({ toggleTheme, theme }) => {
     return () => clearInterval(interval);
   }, [user]);
 
+  const loadMoreNotifications = async () => {
+    if (!notificationsCursor) return;
+    const token = localStorage.getItem('token');
+    const response = await axios.get('/api/notifications', {
+      headers: { Authorization: `Bearer ${token}` },
+      params: { limit: NOTIFICATIONS_PAGE_SIZE, after: notificationsCursor },
+    });
+    olderNotificationsLoaded.current = true;
+    setNotifications((previous) => [...previous, ...response.data]);
+    setNotificationsCursor(response.headers['x-next-cursor'] || null);
+  };
+
   const unreadCount = notifications.filter(n => !n.is_read).length;
 
   const handleNotificationClick = async (notification: any) => {
@@ -360,6 +398,9 @@ const Header: React.FC<HeaderProps> = ({ toggleTheme, theme }) => {
                       <p>No new notifications</p>
                     </NotificationItem>
                   )}
+                  {notificationsCursor && (
+                    <LoadMoreButton onClick={loadMoreNotifications}>Load more</LoadMoreButton>
+                  )}
                 </NotificationDropdown>
               )}
             </ProfileDropdownContainer>
@@ -178,7 +178,7 @@ const AnnualMedicalReport: React.FC<AnnualMedicalReportProps> = ({
       <Page id="report-page-1">
         {branding.report_header && (
           <HeaderImage
-            src={`/api/uploads/${branding.report_header}`}
+            src={`/api/uploads/${branding.report_header}?size=print`}
             alt="Report Header"
           />
         )}
@@ -462,7 +462,7 @@ const AnnualMedicalReport: React.FC<AnnualMedicalReportProps> = ({
         <SignatureBlock>
           {branding.report_signature && (
             <SignatureImage
-              src={`/api/uploads/${branding.report_signature}`}
+              src={`/api/uploads/${branding.report_signature}?size=print`}
               alt="Signature"
             />
           )}
@@ -476,7 +476,7 @@ const AnnualMedicalReport: React.FC<AnnualMedicalReportProps> = ({
 
         {branding.report_footer && (
           <FooterImage
-            src={`/api/uploads/${branding.report_footer}`}
+            src={`/api/uploads/${branding.report_footer}?size=print`}
             alt="Report Footer"
           />
         )}
@@ -486,7 +486,7 @@ const AnnualMedicalReport: React.FC<AnnualMedicalReportProps> = ({
       <Page id="report-page-2">
         {branding.report_header && (
           <HeaderImage
-            src={`/api/uploads/${branding.report_header}`}
+            src={`/api/uploads/${branding.report_header}?size=print`}
             alt="Report Header"
           />
         )}
@@ -615,7 +615,7 @@ const AnnualMedicalReport: React.FC<AnnualMedicalReportProps> = ({
         <SignatureBlock>
           {branding.report_signature && (
             <SignatureImage
-              src={`/api/uploads/${branding.report_signature}`}
+              src={`/api/uploads/${branding.report_signature}?size=print`}
               alt="Signature"
             />
           )}
@@ -629,7 +629,7 @@ const AnnualMedicalReport: React.FC<AnnualMedicalReportProps> = ({
 
         {branding.report_footer && (
           <FooterImage
-            src={`/api/uploads/${branding.report_footer}`}
+            src={`/api/uploads/${branding.report_footer}?size=print`}
             alt="Report Footer"
           />
         )}
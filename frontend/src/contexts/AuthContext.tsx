@@ -19,6 +19,54 @@ interface AuthContextType {
 
 const AuthContext = createContext<AuthContextType | undefined>(undefined);
 
+// One refresh at a time: refresh tokens are single-use, so concurrent 401s
+// must share the same exchange instead of each spending the token.
+let refreshing: Promise<string | null> | null = null;
+
+const refreshAccessToken = (): Promise<string | null> => {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (!refreshToken) {
+    return Promise.resolve(null);
+  }
+  if (!refreshing) {
+    refreshing = axios
+      .post('/api/token/refresh', { refresh_token: refreshToken })
+      .then((response) => {
+        localStorage.setItem('token', response.data.token);
+        localStorage.setItem('refresh_token', response.data.refresh_token);
+        return response.data.token as string;
+      })
+      .catch(() => {
+        localStorage.removeItem('refresh_token');
+        return null;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+};
+
+// Retry a request once with a renewed access token when the old one has expired
+axios.interceptors.response.use(undefined, async (error) => {
+  const request = error.config;
+  if (
+    error.response?.status === 401 &&
+    request &&
+    !request._retried &&
+    !request.url?.startsWith('/api/token/refresh') &&
+    !request.url?.startsWith('/api/login')
+  ) {
+    const token = await refreshAccessToken();
+    if (token) {
+      request._retried = true;
+      request.headers = { ...request.headers, Authorization: `Bearer ${token}` };
+      return axios(request);
+    }
+  }
+  return Promise.reject(error);
+});
+
 export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({
   children,
 }) => {
@@ -55,11 +103,24 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({
   const login = async (username: string, password: string) => {
     const response = await axios.post('/api/login', { username, password });
     localStorage.setItem('token', response.data.token);
+    localStorage.setItem('refresh_token', response.data.refresh_token);
     await fetchUser();
   };
 
   const logout = () => {
+    const token = localStorage.getItem('token');
+    if (token) {
+      // Revoke the tokens server-side; the local session ends either way
+      axios
+        .post(
+          '/api/logout',
+          { refresh_token: localStorage.getItem('refresh_token') },
+          { headers: { Authorization: `Bearer ${token}` } }
+        )
+        .catch(() => {});
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     setUser(null);
     navigate('/login');
   };
@@ -27,6 +27,13 @@ const Td = styled.td`
   padding: 1rem;
 `;
 
+const LoadMoreButton = styled.button`
+  margin-top: 1rem;
+  padding: 0.5rem 1rem;
+`;
+
+const PAGE_SIZE = 100;
+
 interface AuditLog {
   id: number;
   username: string;
@@ -38,22 +45,25 @@ interface AuditLog {
 const AuditLogPage: React.FC = () => {
   const [logs, setLogs] = useState<AuditLog[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+
+  const fetchLogs = async (after?: string) => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await axios.get('/api/audit-logs', {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { limit: PAGE_SIZE, after },
+      });
+      setLogs((previous) => (after ? [...previous, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Failed to fetch audit logs:', error);
+    } finally {
+      setLoading(false);
+    }
+  };
 
   useEffect(() => {
-    const fetchLogs = async () => {
-      setLoading(true);
-      try {
-        const token = localStorage.getItem('token');
-        const response = await axios.get('/api/audit-logs', {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-        setLogs(response.data);
-      } catch (error) {
-        console.error('Failed to fetch audit logs:', error);
-      } finally {
-        setLoading(false);
-      }
-    };
     fetchLogs();
   }, []);
 
@@ -88,6 +98,7 @@ const AuditLogPage: React.FC = () => {
           ))}
         </tbody>
       </LogTable>
+      {nextCursor && <LoadMoreButton onClick={() => fetchLogs(nextCursor)}>Load more</LoadMoreButton>}
     </PageContainer>
   );
 };
@@ -89,17 +89,17 @@ const BrandingPage: React.FC = () => {
         const { data } = await axios.get('/api/branding');
         setClinicName(data.clinic_name);
         setPreviews({
-          logo_light: data.logo_light ? `/api/uploads/${data.logo_light}` : '',
-          logo_dark: data.logo_dark ? `/api/uploads/${data.logo_dark}` : '',
-          logo_home: data.logo_home ? `/api/uploads/${data.logo_home}` : '',
+          logo_light: data.logo_light ? `/api/uploads/${data.logo_light}?size=thumb` : '',
+          logo_dark: data.logo_dark ? `/api/uploads/${data.logo_dark}?size=thumb` : '',
+          logo_home: data.logo_home ? `/api/uploads/${data.logo_home}?size=thumb` : '',
           report_header: data.report_header
-            ? `/api/uploads/${data.report_header}`
+            ? `/api/uploads/${data.report_header}?size=thumb`
             : '',
           report_signature: data.report_signature
-            ? `/api/uploads/${data.report_signature}`
+            ? `/api/uploads/${data.report_signature}?size=thumb`
             : '',
           report_footer: data.report_footer
-            ? `/api/uploads/${data.report_footer}`
+            ? `/api/uploads/${data.report_footer}?size=thumb`
             : '',
         });
         setDoctorName(data.doctor_name || '');
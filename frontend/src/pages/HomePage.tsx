@@ -75,7 +75,7 @@ const HomePage: React.FC<HomePageProps> = ({ toggleTheme, theme }) => {
       <MainContent>
         {branding?.logo_home && (
           <HomeLogo
-            src={`/api/uploads/${branding.logo_home}`}
+            src={`/api/uploads/${branding.logo_home}?size=header`}
             alt="Clinic Home Logo"
           />
         )}
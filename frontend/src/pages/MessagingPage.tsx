@@ -113,11 +113,18 @@ const MessageBubble = styled.div<{ isSender: boolean }>`
   }
 `;
 
+const LoadOlderButton = styled.button`
+  align-self: center;
+  margin-bottom: 1rem;
+  padding: 0.5rem 1rem;
+`;
+
 const socket = io('http://localhost:5000');
 
 const MessagingPage: React.FC = () => {
   const [conversations, setConversations] = useState<any[]>([]);
   const [messages, setMessages] = useState<any[]>([]);
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
   const [activeConversation, setActiveConversation] = useState<number | null>(null);
   const [newMessage, setNewMessage] = useState('');
   const { user } = useAuth();
@@ -127,9 +134,11 @@ const MessagingPage: React.FC = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
 
+  // Only a new latest message scrolls down, not loading earlier ones
+  const lastMessageId = messages.length ? messages[messages.length - 1].id : null;
   useEffect(() => {
     scrollToBottom();
-  }, [messages]);
+  }, [lastMessageId]);
 
   useEffect(() => {
     const fetchConversations = async () => {
@@ -144,19 +153,24 @@ const MessagingPage: React.FC = () => {
     }
   }, [user]);
 
-  useEffect(() => {
-    const fetchMessages = async () => {
-      if (activeConversation) {
-        const token = localStorage.getItem('token');
-        const response = await axios.get(
-          `/api/conversations/${activeConversation}`,
-          {
-            headers: { Authorization: `Bearer ${token}` },
-          }
-        );
-        setMessages(response.data);
+  // Messages come newest first; each page is reversed for display and older
+  // pages are put in front of the ones already shown
+  const fetchMessages = async (after?: string) => {
+    if (!activeConversation) return;
+    const token = localStorage.getItem('token');
+    const response = await axios.get(
+      `/api/conversations/${activeConversation}`,
+      {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { after },
       }
-    };
+    );
+    const page = [...response.data].reverse();
+    setMessages((previous) => (after ? [...page, ...previous] : page));
+    setOlderCursor(response.headers['x-next-cursor'] || null);
+  };
+
+  useEffect(() => {
     fetchMessages();
   }, [activeConversation]);
 
@@ -208,6 +222,11 @@ const MessagingPage: React.FC = () => {
       </ConversationList>
       <ChatWindow>
         <MessageArea>
+          {olderCursor && (
+            <LoadOlderButton onClick={() => fetchMessages(olderCursor)}>
+              Load earlier messages
+            </LoadOlderButton>
+          )}
           {messages.map((msg) => (
             <MessageBubble
               key={msg.id}
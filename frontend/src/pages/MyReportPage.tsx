@@ -160,7 +160,7 @@ const MyReportPage: React.FC = () => {
           headers: { Authorization: `Bearer ${token}` },
         }
       );
-      showFlashMessage('Report has been sent successfully!', 'success');
+      showFlashMessage('Report has been queued and will be emailed shortly.', 'success');
     } catch (error) {
       console.error('Failed to email report:', error);
       showFlashMessage('There was an error sending the report.', 'error');
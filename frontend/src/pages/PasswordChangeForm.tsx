@@ -61,9 +61,12 @@ const PasswordChangeForm: React.FC = () => {
     setIsLoading(true);
     try {
       const token = localStorage.getItem('token');
-      await axios.post('/api/profile/change-password', formData, {
+      const response = await axios.post('/api/profile/change-password', formData, {
         headers: { Authorization: `Bearer ${token}` },
       });
+      // Changing the password signs out every older token, including this one
+      localStorage.setItem('token', response.data.token);
+      localStorage.setItem('refresh_token', response.data.refresh_token);
       showFlashMessage('Password changed successfully!', 'success');
       setFormData({
         current_password: '',
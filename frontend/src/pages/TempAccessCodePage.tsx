@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import styled from 'styled-components';
 import axios from 'axios';
+import { fetchAllPages } from '../utils/pagination';
 import { useApp } from '../contexts/AppContext';
 import { Input } from '../components/common/Input';
 import { Button } from '../components/common/Button';
@@ -77,6 +78,13 @@ const StatusBadge = styled.span<{ isActive: boolean }>`
   font-weight: bold;
 `;
 
+const LoadMoreButton = styled.button`
+  margin-top: ${({ theme }) => theme.spacing.md};
+  padding: ${({ theme }) => theme.spacing.sm} ${({ theme }) => theme.spacing.md};
+`;
+
+const PAGE_SIZE = 100;
+
 interface TempCode {
   id: number;
   code: string;
@@ -101,6 +109,7 @@ interface User {
 const TempAccessCodePage: React.FC = () => {
   const { showFlashMessage, setIsLoading } = useApp();
   const [codes, setCodes] = useState<TempCode[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [permissions, setPermissions] = useState<Permission[]>([]);
   const [users, setUsers] = useState<User[]>([]);
   const [loading, setLoading] = useState(true);
@@ -110,25 +119,34 @@ const TempAccessCodePage: React.FC = () => {
   const [duration, setDuration] = useState(60);
   const [useType, setUseType] = useState('single-use');
 
+  // Newest codes first, one page at a time
+  const fetchCodes = async (after?: string) => {
+    const token = localStorage.getItem('token');
+    const response = await axios.get<TempCode[]>('/api/temp-codes', {
+      headers: { Authorization: `Bearer ${token}` },
+      params: { limit: PAGE_SIZE, after },
+    });
+    setCodes((previous) => (after ? [...previous, ...response.data] : response.data));
+    setNextCursor(response.headers['x-next-cursor'] || null);
+  };
+
   const fetchData = async () => {
     setLoading(true);
     try {
       const token = localStorage.getItem('token');
-      const [codesResponse, permissionsResponse, usersResponse] =
-        await Promise.all([
-          axios.get('/api/temp-codes', {
-            headers: { Authorization: `Bearer ${token}` },
-          }),
-          axios.get('/api/permissions', {
-            headers: { Authorization: `Bearer ${token}` },
-          }),
-          axios.get('/api/users', {
-            headers: { Authorization: `Bearer ${token}` },
-          }),
-        ]);
-      setCodes(codesResponse.data);
+      // The user picker has to offer every user, so it is the one list
+      // here that is read in full
+      const [, permissionsResponse, allUsers] = await Promise.all([
+        fetchCodes(),
+        axios.get('/api/permissions', {
+          headers: { Authorization: `Bearer ${token}` },
+        }),
+        fetchAllPages<User>('/api/users', {
+          headers: { Authorization: `Bearer ${token}` },
+        }),
+      ]);
       setPermissions(permissionsResponse.data);
-      setUsers(usersResponse.data);
+      setUsers(allUsers);
     } catch (error) {
       console.error('Failed to fetch data:', error);
     } finally {
@@ -136,6 +154,19 @@ const TempAccessCodePage: React.FC = () => {
     }
   };
 
+  const loadMoreCodes = async () => {
+    if (!nextCursor) return;
+    setIsLoading(true);
+    try {
+      await fetchCodes(nextCursor);
+    } catch (error) {
+      console.error('Failed to fetch codes:', error);
+      showFlashMessage('Failed to fetch codes.', 'error');
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   useEffect(() => {
     fetchData();
   }, []);
@@ -156,7 +187,7 @@ const TempAccessCodePage: React.FC = () => {
         { headers: { Authorization: `Bearer ${token}` } }
       );
       showFlashMessage('Code generated successfully!', 'success');
-      fetchData(); // Refresh list
+      await fetchCodes(); // The new code is at the top of the first page
     } catch (error) {
       console.error('Failed to generate code:', error);
       showFlashMessage('Failed to generate code.', 'error');
@@ -178,7 +209,11 @@ const TempAccessCodePage: React.FC = () => {
           }
         );
         showFlashMessage('Code revoked successfully.', 'success');
-        fetchData(); // Refresh list
+        setCodes((previous) =>
+          previous.map((code) =>
+            code.id === codeId ? { ...code, is_active: false } : code
+          )
+        );
       } catch (error) {
         console.error('Failed to revoke code:', error);
         showFlashMessage('Failed to revoke code.', 'error');
@@ -293,6 +328,9 @@ const TempAccessCodePage: React.FC = () => {
           ))}
         </tbody>
       </CodeTable>
+      {nextCursor && (
+        <LoadMoreButton onClick={loadMoreCodes}>Load more</LoadMoreButton>
+      )}
     </PageContainer>
   );
 };
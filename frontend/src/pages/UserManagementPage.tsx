@@ -55,6 +55,13 @@ const ActionButton = styled.button`
   }
 `;
 
+const LoadMoreButton = styled.button`
+  margin-top: ${({ theme }) => theme.spacing.md};
+  padding: ${({ theme }) => theme.spacing.sm} ${({ theme }) => theme.spacing.md};
+`;
+
+const PAGE_SIZE = 100;
+
 interface User {
   id: number;
   username: string;
@@ -70,22 +77,43 @@ interface Role {
 const UserManagementPage: React.FC = () => {
   const [users, setUsers] = useState<User[]>([]);
   const [roles, setRoles] = useState<Role[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const { showFlashMessage, setIsLoading, isLoading } = useApp();
   const navigate = useNavigate();
 
+  const fetchUsers = async (after?: string) => {
+    setIsLoading(true);
+    try {
+      const token = localStorage.getItem('token');
+      const response = await axios.get<User[]>('/api/users', {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { limit: PAGE_SIZE, after },
+      });
+      setUsers((previous) => (after ? [...previous, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Failed to fetch users:', error);
+      showFlashMessage('Failed to fetch user data.', 'error');
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   const fetchData = useCallback(async () => {
     setIsLoading(true);
     try {
       const token = localStorage.getItem('token');
       const [usersResponse, rolesResponse] = await Promise.all([
-        axios.get('/api/users', {
+        axios.get<User[]>('/api/users', {
           headers: { Authorization: `Bearer ${token}` },
+          params: { limit: PAGE_SIZE },
         }),
         axios.get('/api/roles', {
           headers: { Authorization: `Bearer ${token}` },
         }),
       ]);
       setUsers(usersResponse.data);
+      setNextCursor(usersResponse.headers['x-next-cursor'] || null);
       setRoles(rolesResponse.data);
     } catch (error) {
       console.error('Failed to fetch user management data:', error);
@@ -111,7 +139,15 @@ const UserManagementPage: React.FC = () => {
         }
       );
       showFlashMessage('Role assigned successfully!', 'success');
-      fetchData(); // Refresh user data
+      // Update the row in place so the pages already loaded stay on screen
+      const roleName = roles.find((role) => role.id === roleId)?.name;
+      setUsers((previous) =>
+        previous.map((user) =>
+          user.id === userId && roleName && !user.roles.includes(roleName)
+            ? { ...user, roles: [...user.roles, roleName] }
+            : user
+        )
+      );
     } catch (error) {
       console.error('Failed to assign role:', error);
       showFlashMessage('Failed to assign role.', 'error');
@@ -124,7 +160,7 @@ const UserManagementPage: React.FC = () => {
     navigate(`/control-panel/edit-user/${userId}`);
   };
 
-  if (isLoading) {
+  if (isLoading && users.length === 0) {
     return (
       <PageContainer>
         <p>Loading...</p>
@@ -188,6 +224,11 @@ const UserManagementPage: React.FC = () => {
           )}
         </tbody>
       </UserTable>
+      {nextCursor && (
+        <LoadMoreButton onClick={() => fetchUsers(nextCursor)} disabled={isLoading}>
+          Load more
+        </LoadMoreButton>
+      )}
     </PageContainer>
   );
 };
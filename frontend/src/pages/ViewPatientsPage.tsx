@@ -41,6 +41,13 @@ const ActionContainer = styled.div`
   gap: ${({ theme }) => theme.spacing.sm};
 `;
 
+const LoadMoreButton = styled.button`
+  margin-top: ${({ theme }) => theme.spacing.md};
+  padding: ${({ theme }) => theme.spacing.sm} ${({ theme }) => theme.spacing.md};
+`;
+
+const PAGE_SIZE = 100;
+
 interface Patient {
   staff_id: string;
   first_name: string;
@@ -52,17 +59,20 @@ interface Patient {
 
 const ViewPatientsPage: React.FC = () => {
   const [patients, setPatients] = useState<Patient[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const { showFlashMessage, setIsLoading, isLoading } = useApp();
   const navigate = useNavigate();
 
-  const fetchPatients = useCallback(async () => {
+  const fetchPatients = useCallback(async (after?: string) => {
     setIsLoading(true);
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get('/api/patients', {
+      const response = await axios.get<Patient[]>('/api/patients', {
         headers: { Authorization: `Bearer ${token}` },
+        params: { limit: PAGE_SIZE, after },
       });
-      setPatients(response.data);
+      setPatients((previous) => (after ? [...previous, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Failed to fetch patients:', error);
       showFlashMessage('Failed to fetch patients.', 'error');
@@ -88,7 +98,7 @@ const ViewPatientsPage: React.FC = () => {
           headers: { Authorization: `Bearer ${token}` },
         });
         showFlashMessage('Patient deleted successfully.', 'success');
-        fetchPatients(); // Refresh the list
+        setPatients((previous) => previous.filter((item) => item.staff_id !== staffId));
       } catch (error) {
         console.error('Failed to delete patient:', error);
         showFlashMessage('Failed to delete patient.', 'error');
@@ -159,6 +169,11 @@ const ViewPatientsPage: React.FC = () => {
           )}
         </tbody>
       </PatientTable>
+      {nextCursor && (
+        <LoadMoreButton onClick={() => fetchPatients(nextCursor)} disabled={isLoading}>
+          Load more
+        </LoadMoreButton>
+      )}
     </PageContainer>
   );
 };
@@ -42,6 +42,13 @@ const ActionContainer = styled.div`
   gap: ${({ theme }) => theme.spacing.sm};
 `;
 
+const LoadMoreButton = styled.button`
+  margin-top: ${({ theme }) => theme.spacing.md};
+  padding: ${({ theme }) => theme.spacing.sm} ${({ theme }) => theme.spacing.md};
+`;
+
+const PAGE_SIZE = 100;
+
 interface ScreenedPatient {
   record_id: number;
   patient_id: string;
@@ -56,21 +63,25 @@ interface ScreenedPatient {
 const ViewRecordsPage: React.FC = () => {
   const { companySection, screeningYear } = useGlobalFilter();
   const [records, setRecords] = useState<ScreenedPatient[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const { showFlashMessage, setIsLoading, isLoading } = useApp();
   const navigate = useNavigate();
 
-  const fetchRecords = useCallback(async () => {
+  const fetchRecords = useCallback(async (after?: string) => {
     setIsLoading(true);
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get('/api/screening/records', {
+      const response = await axios.get<ScreenedPatient[]>('/api/screening/records', {
         headers: { Authorization: `Bearer ${token}` },
         params: {
+          limit: PAGE_SIZE,
+          after,
           screening_year: screeningYear,
           company_section: companySection,
         },
       });
-      setRecords(response.data);
+      setRecords((previous) => (after ? [...previous, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Failed to fetch records:', error);
       showFlashMessage('Failed to fetch records.', 'error');
@@ -97,7 +108,7 @@ const ViewRecordsPage: React.FC = () => {
           headers: { Authorization: `Bearer ${token}` },
         });
         showFlashMessage('Record deleted successfully.', 'success');
-        fetchRecords(); // Refresh the list
+        setRecords((previous) => previous.filter((item) => item.record_id !== recordId));
       } catch (error) {
         console.error('Failed to delete record:', error);
         showFlashMessage('Failed to delete record.', 'error');
@@ -171,6 +182,11 @@ const ViewRecordsPage: React.FC = () => {
           )}
         </tbody>
       </RecordTable>
+      {nextCursor && (
+        <LoadMoreButton onClick={() => fetchRecords(nextCursor)} disabled={isLoading}>
+          Load more
+        </LoadMoreButton>
+      )}
     </PageContainer>
   );
 };
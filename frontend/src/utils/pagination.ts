@@ -0,0 +1,20 @@
+import axios, { AxiosRequestConfig } from 'axios';
+
+// List endpoints return one page at a time and name the next page's cursor in
+// the X-Next-Cursor header. This follows the cursors and returns every row.
+export const fetchAllPages = async <T = any>(
+  url: string,
+  config: AxiosRequestConfig = {}
+): Promise<T[]> => {
+  const results: T[] = [];
+  let after: string | undefined;
+  do {
+    const response = await axios.get<T[]>(url, {
+      ...config,
+      params: { ...config.params, after },
+    });
+    results.push(...response.data);
+    after = response.headers?.['x-next-cursor'] || undefined;
+  } while (after);
+  return results;
+};